@@ -6,6 +6,7 @@ app = dash.Dash(
     external_stylesheets=[dbc.themes.LUX],
     suppress_callback_exceptions=True,
     prevent_initial_callbacks=True,
+    compress=True,
     meta_tags=[
         {
             "name": "viewport",
@@ -15,6 +16,8 @@ app = dash.Dash(
 )
 
 server = app.server
+server.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+server.config['COMPRESS_STREAMS'] = False
 
 if __name__ == '__main__':
     print('This is the app/server setup file')
\ No newline at end of file
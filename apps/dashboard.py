@@ -1,21 +1,13 @@
+import math
 import dash_bootstrap_components as dbc
-from dash import html, Input, Output, State
+from dash import dcc, html, Input, Output, State, callback_context, no_update
 from app import app
-from dashboard_functions import cleaned_data_reader, heatmap_generator, top_states_generator, top_cities_generator, incidents_per_day_generator, incidents_per_month_generator, incidents_per_year_generator, age_distribution_generator, gun_type_distribution_generator, gun_count_distribution_generator, suspect_gender_distribution_generator, victim_gender_distribution_generator
+from figure_registry import figure_sources, figure_get, filtered_figures_get
 
 
-data = cleaned_data_reader()
-incident_heatmap = heatmap_generator(data)
-top_states = top_states_generator(data)
-top_cities = top_cities_generator(data)
-incidents_per_day = incidents_per_day_generator(data)
-incidents_per_month = incidents_per_month_generator(data)
-incidents_per_year = incidents_per_year_generator(data)
-age_distribution = age_distribution_generator(data)
-gun_type_distribution = gun_type_distribution_generator(data)
-gun_count_distribution = gun_count_distribution_generator(data)
-suspect_gender_distribution = suspect_gender_distribution_generator(data)
-victim_gender_distribution = victim_gender_distribution_generator(data)
+filter_years = [2014, 2015, 2016, 2017]
+filter_months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+filter_weekdays = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
 
 
 page_content_1_modal = html.Div(
@@ -146,234 +138,347 @@ page_content_4_modal = html.Div(
 )
 
 
-page_content_1 = dbc.Container(
-    children=[
-        dbc.Row(
-            className="mt-4 g-0",
-            children=[
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(className="text-center bg-dark text-light", children=['Severity of Incidents Across The US']),
-                        body=True,
-                        color="dark",
-                        style={'height': '100%'}
+def page_content_1():
+    """
+    Build section 1 of the dashboard, generating only the figures it shows
+    """
+
+    return dbc.Container(
+        children=[
+            dbc.Row(
+                className="mt-4 g-0",
+                children=[
+                    dbc.Col(
+                        dbc.Card(
+                            dbc.CardBody(className="text-center bg-dark text-light", children=['Severity of Incidents Across The US']),
+                            body=True,
+                            color="dark",
+                            style={'height': '100%'}
+                        ),
+                        lg=10
                     ),
-                    lg=10
-                ),
 
-                dbc.Col(
-                    dbc.Card(
-                        className="justify-content-center text-center",
+                    dbc.Col(
+                        dbc.Card(
+                            className="justify-content-center text-center",
+                            children=[
+                                page_content_1_modal
+                            ],
+                            body=True,
+                            color="dark",
+                            style={'height': '100%'}
+                        ),
+                        lg=2
+                    )
+                ]
+            ),
+
+            dbc.Row(
+                children=[
+                    dbc.Col(
                         children=[
-                            page_content_1_modal
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('incident_heatmap')]),
                         ],
-                        body=True,
-                        color="dark",
-                        style={'height': '100%'}
+                        style={'height': '100%'},
+                        lg=6
                     ),
-                    lg=2
-                )
-            ]
-        ),
 
-        dbc.Row(
-            children=[
-                dbc.Col(
-                    children=[
-                        dbc.Card(className="shadow-sm rounded", children=[incident_heatmap]),
-                    ],
-                    style={'height': '100%'},
-                    lg=6
-                ),
+                    dbc.Col(
+                        children=[
+                            dbc.Row(
+                                dbc.Col(dbc.Card(className="shadow-sm rounded", children=[figure_get('top_states')])),
+                            ),
+                            dbc.Row(
+                                dbc.Col(dbc.Card(className="shadow-sm rounded", children=[figure_get('top_cities')])),
+                            )
+                        ],
+                        lg=6
+                    ),
+                ]
+            ),
 
-                dbc.Col(
-                    children=[
-                        dbc.Row(
-                            dbc.Col(dbc.Card(className="shadow-sm rounded", children=[top_states])),
+            dbc.Row(
+                children=[
+                    dbc.Col(
+                        children=[
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('density_map')]),
+                        ]
+                    ),
+                ]
+            )
+        ]
+    )
+
+
+def page_content_2():
+    """
+    Build section 2 of the dashboard, generating only the figures it shows
+    """
+
+    return dbc.Container(
+        children=[
+            dbc.Row(
+                className="mt-4 g-0",
+                children=[
+                    dbc.Col(
+                        dbc.Card(
+                            dbc.CardBody(className="text-center bg-dark text-light", children=['Incidents Per Day/Month/Year']),
+                            body=True,
+                            color="dark",
+                            style={'height': '100%'}
                         ),
-                        dbc.Row(
-                            dbc.Col(dbc.Card(className="shadow-sm rounded", children=[top_cities])),
-                        )
-                    ],
-                    lg=6
-                ),
-            ]
-        )
-    ]
-)
+                        lg=10
+                    ),
 
+                    dbc.Col(
+                        dbc.Card(
+                            className="justify-content-center text-center",
+                            children=[
+                                page_content_2_modal
+                            ],
+                            body=True,
+                            color="dark",
+                            style={'height': '100%'}
+                        ),
+                        lg=2
+                    )
+                ]
+            ),
 
-page_content_2 = dbc.Container(
-    children=[
-        dbc.Row(
-            className="mt-4 g-0",
-            children=[
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(className="text-center bg-dark text-light", children=['Incidents Per Day/Month/Year']),
-                        body=True,
-                        color="dark",
-                        style={'height': '100%'}
+            dbc.Row(
+                children=[
+                    dbc.Col(
+                        children=[
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('incidents_per_day')]),
+                        ],
+                        lg=4
                     ),
-                    lg=10
-                ),
 
-                dbc.Col(
-                    dbc.Card(
-                        className="justify-content-center text-center",
+                    dbc.Col(
                         children=[
-                            page_content_2_modal
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('incidents_per_month')]),
                         ],
-                        body=True,
-                        color="dark",
-                        style={'height': '100%'}
+                        lg=4
                     ),
-                    lg=2
-                )
-            ]
-        ),
-
-        dbc.Row(
-            children=[
-                dbc.Col(
-                    children=[
-                        dbc.Card(className="shadow-sm rounded", children=[incidents_per_day]),
-                    ],
-                    lg=4
-                ),
-
-                dbc.Col(
-                    children=[
-                        dbc.Card(className="shadow-sm rounded", children=[incidents_per_month]),
-                    ],
-                    lg=4
-                ),
-
-                dbc.Col(
-                    children=[
-                        dbc.Card(className="shadow-sm rounded", children=[incidents_per_year]),
-                    ],
-                    lg=4
-                ),
-            ]
-        )
-    ]
-)
 
+                    dbc.Col(
+                        children=[
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('incidents_per_year')]),
+                        ],
+                        lg=4
+                    ),
+                ]
+            ),
 
-page_content_3 = dbc.Container(
-    children=[
-        dbc.Row(
-            className="mt-4 g-0",
-            children=[
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(className="text-center bg-dark text-light", children=['Age Distribution of People Involved']),
-                        body=True,
-                        color="dark",
-                        style={'height': '100%'}
+            dbc.Row(
+                children=[
+                    dbc.Col(
+                        children=[
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('incidents_time_series')]),
+                        ]
+                    ),
+                ]
+            )
+        ]
+    )
+
+
+def page_content_3():
+    """
+    Build section 3 of the dashboard, generating only the figures it shows
+    """
+
+    return dbc.Container(
+        children=[
+            dbc.Row(
+                className="mt-4 g-0",
+                children=[
+                    dbc.Col(
+                        dbc.Card(
+                            dbc.CardBody(className="text-center bg-dark text-light", children=['Age Distribution of People Involved']),
+                            body=True,
+                            color="dark",
+                            style={'height': '100%'}
+                        ),
+                        lg=10
                     ),
-                    lg=10
-                ),
 
-                dbc.Col(
-                    dbc.Card(
-                        className="justify-content-center text-center",
+                    dbc.Col(
+                        dbc.Card(
+                            className="justify-content-center text-center",
+                            children=[
+                                page_content_3_modal
+                            ],
+                            body=True,
+                            color="dark",
+                            style={'height': '100%'}
+                        ),
+                        lg=2
+                    )
+                ]
+            ),
+
+            dbc.Row(
+                children=[
+                    dbc.Col(
                         children=[
-                            page_content_3_modal
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('age_distribution')]),
                         ],
-                        body=True,
-                        color="dark",
-                        style={'height': '100%'}
+                        lg=12
+                    )
+                ]
+            )
+        ]
+    )
+
+
+def page_content_4():
+    """
+    Build section 4 of the dashboard, generating only the figures it shows
+    """
+
+    return dbc.Container(
+        children=[
+            dbc.Row(
+                className="mt-4 g-0",
+                children=[
+                    dbc.Col(
+                        dbc.Card(
+                            dbc.CardBody(className="text-center bg-dark text-light", children=['Severity of Incidents Across The US']),
+                            body=True,
+                            color="dark",
+                            style={'height': '100%'}
+                        ),
+                        lg=10
                     ),
-                    lg=2
-                )
-            ]
-        ),
-
-        dbc.Row(
-            children=[
-                dbc.Col(
-                    children=[
-                        dbc.Card(className="shadow-sm rounded", children=[age_distribution]),
-                    ],
-                    lg=12
-                )
-            ]
-        )
-    ]
-)
 
+                    dbc.Col(
+                        dbc.Card(
+                            className="justify-content-center text-center",
+                            children=[
+                                page_content_4_modal
+                            ],
+                            body=True,
+                            color="dark",
+                            style={'height': '100%'}
+                        ),
+                        lg=2
+                    )
+                ]
+            ),
 
-page_content_4 = dbc.Container(
-    children=[
-        dbc.Row(
-            className="mt-4 g-0",
-            children=[
-                dbc.Col(
-                    dbc.Card(
-                        dbc.CardBody(className="text-center bg-dark text-light", children=['Severity of Incidents Across The US']),
-                        body=True,
-                        color="dark",
-                        style={'height': '100%'}
+            dbc.Row(
+                className="g-0",
+                children=[
+                    dbc.Col(
+                        children=[
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('gun_type_distribution')]),
+                        ],
+                        lg=6
                     ),
-                    lg=10
-                ),
 
-                dbc.Col(
-                    dbc.Card(
-                        className="justify-content-center text-center",
+                    dbc.Col(
                         children=[
-                            page_content_4_modal
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('gun_count_distribution')]),
                         ],
-                        body=True,
-                        color="dark",
-                        style={'height': '100%'}
+                        lg=6
                     ),
-                    lg=2
-                )
-            ]
-        ),
+                ]
+            ),
 
-        dbc.Row(
-            className="g-0",
-            children=[
-                dbc.Col(
-                    children=[
-                        dbc.Card(className="shadow-sm rounded", children=[gun_type_distribution]),
-                    ],
-                    lg=6
-                ),
-
-                dbc.Col(
-                    children=[
-                        dbc.Card(className="shadow-sm rounded", children=[gun_count_distribution]),
-                    ],
-                    lg=6
-                ),
-            ]
-        ),
+            dbc.Row(
+                className="g-0",
+                children=[
+                    dbc.Col(
+                        children=[
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('suspect_gender_distribution')]),
+                        ],
+                        lg=6
+                    ),
 
-        dbc.Row(
-            className="g-0",
-            children=[
-                dbc.Col(
-                    children=[
-                        dbc.Card(className="shadow-sm rounded", children=[suspect_gender_distribution]),
-                    ],
-                    lg=6
-                ),
+                    dbc.Col(
+                        children=[
+                            dbc.Card(className="shadow-sm rounded", children=[figure_get('victim_gender_distribution')]),
+                        ],
+                        lg=6
+                    ),
+                ],
+            )
+        ]
+    )
+
+
+def filter_panel():
+    """
+    Build the year/state/month/weekday filters applied to every dashboard figure
+    """
+
+    states = sorted(figure_get('incident_heatmap').figure['data'][0]['locations'])
+
+    return dbc.Container(
+        children=[
+            dbc.Card(
+                className="mt-4 shadow-sm rounded",
+                body=True,
+                children=[
+                    dbc.Row(
+                        children=[
+                            dbc.Col(
+                                children=[
+                                    html.Label("Years"),
+                                    dcc.RangeSlider(
+                                        id="filter_years",
+                                        min=filter_years[0],
+                                        max=filter_years[-1],
+                                        step=1,
+                                        marks={year: str(year) for year in filter_years},
+                                        value=[filter_years[0], filter_years[-1]]
+                                    )
+                                ],
+                                lg=3
+                            ),
+
+                            dbc.Col(
+                                children=[
+                                    html.Label("States"),
+                                    dcc.Dropdown(id="filter_states", options=[{"label": value, "value": value} for value in states], multi=True, placeholder="All states")
+                                ],
+                                lg=3
+                            ),
+
+                            dbc.Col(
+                                children=[
+                                    html.Label("Months"),
+                                    dcc.Dropdown(id="filter_months", options=[{"label": value, "value": value} for value in filter_months], multi=True, placeholder="All months")
+                                ],
+                                lg=3
+                            ),
+
+                            dbc.Col(
+                                children=[
+                                    html.Label("Weekdays"),
+                                    dcc.Dropdown(id="filter_weekdays", options=[{"label": value, "value": value} for value in filter_weekdays], multi=True, placeholder="All weekdays")
+                                ],
+                                lg=3
+                            ),
+                        ]
+                    ),
 
-                dbc.Col(
-                    children=[
-                        dbc.Card(className="shadow-sm rounded", children=[victim_gender_distribution]),
-                    ],
-                    lg=6
-                ),
-            ],
-        )
-    ]
-)
+                    dbc.Row(
+                        className="mt-3",
+                        children=[
+                            dbc.Col(
+                                children=[
+                                    html.Span(id="drilldown_label", className="me-3", children=["Click a state on the heatmap to break its cities and trends down"]),
+                                    dbc.Button(id="drilldown_reset", className="bg-dark text-light", n_clicks=0, outline=True, size="sm", children=["All States"])
+                                ]
+                            )
+                        ]
+                    )
+                ]
+            )
+        ]
+    )
 
 
 @app.callback(
@@ -417,14 +522,102 @@ def toggle_modal_4(n1, n2, is_open):
     return is_open
 
 
-layout = html.Div(
-    children=[
-        page_content_1,
-        page_content_2,
-        page_content_3,
-        page_content_4
-    ]
+@app.callback(
+    Output("incident_heatmap", "clickData"),
+    Input("drilldown_reset", "n_clicks"),
+)
+def reset_drilldown(n_clicks):
+    return None
+
+
+def zoom_range(relayout_data):
+    """
+    Zoomed date range of a time series from its relayoutData, None when zoomed out
+    """
+
+    if not relayout_data:
+        return None
+
+    if 'xaxis.range[0]' in relayout_data:
+        return (str(relayout_data['xaxis.range[0]'])[:10], str(relayout_data['xaxis.range[1]'])[:10])
+
+    if 'xaxis.range' in relayout_data:
+        return tuple(str(bound)[:10] for bound in relayout_data['xaxis.range'])
+
+    return None
+
+
+def map_view(relayout_data):
+    """
+    Zoom level, viewed bounds and projection scale of the density map from its relayoutData,
+    None when not zoomed. Each doubling of the projection scale is one more level of the hexagon
+    bin pyramid, the bounds around the center are rounded out to whole degrees and the scale
+    (which sizes the hexagon markers) to quarter doublings so close views share a cache entry
+    """
+
+    if not relayout_data or 'geo.projection.scale' not in relayout_data:
+        return None
+
+    scale = float(relayout_data['geo.projection.scale'])
+    level = max(round(math.log2(scale)), 0) if scale > 0 else 0
+    marker_scale = 2 ** (round(math.log2(scale) * 4) / 4) if scale > 0 else 1
+
+    if marker_scale == 1:
+        return None
+
+    if 'geo.center.lon' not in relayout_data or 'geo.center.lat' not in relayout_data:
+        return (level, None, marker_scale)
+
+    longitude, latitude = float(relayout_data['geo.center.lon']), float(relayout_data['geo.center.lat'])
+    bounds = (math.floor(longitude - 35 / scale), math.ceil(longitude + 35 / scale), math.floor(latitude - 16 / scale), math.ceil(latitude + 16 / scale))
+
+    return (level, bounds, marker_scale)
+
+
+@app.callback(
+    [Output(name, "figure") for name in figure_sources] + [Output("drilldown_label", "children")],
+    [Input("filter_years", "value"), Input("filter_states", "value"), Input("filter_months", "value"), Input("filter_weekdays", "value"), Input("incident_heatmap", "clickData"), Input("incidents_time_series", "relayoutData"), Input("density_map", "relayoutData")],
 )
+def update_figures(years, states, months, weekdays, click_data, relayout_data, map_relayout_data):
+    filters = {
+        'year': list(range(years[0], years[1] + 1)),
+        'state_code': states or None,
+        'month': months or None,
+        'weekday': weekdays or None
+    }
+
+    drilldown = ('state_code', click_data['points'][0]['location']) if click_data else None
+    label = f"Cities and trends of {drilldown[1]}" if drilldown else "Click a state on the heatmap to break its cities and trends down"
+
+    zooms = {'incidents_time_series': zoom_range(relayout_data), 'density_map': map_view(map_relayout_data)}
+
+    # A zoom only redraws the zoomed figure: the time series downsampled for the new range,
+    # the density map binned at the level of the new scale
+    triggers = [trigger['prop_id'] for trigger in callback_context.triggered]
+    zoomed = [prop_id.split('.')[0] for prop_id in triggers if prop_id.endswith('.relayoutData')]
+
+    if triggers and len(zoomed) == len(triggers):
+        figures = dict(zip(zoomed, filtered_figures_get(zoomed, filters, drilldown, zooms)))
+
+        return [figures[name].figure if name in figures else no_update for name in figure_sources] + [no_update]
+
+    return [figure.figure for figure in filtered_figures_get(list(figure_sources), filters, drilldown, zooms)] + [label]
+
+
+def layout():
+    """
+    Build the dashboard page on request, each section computes its figures on first use
+    """
+
+    return html.Div(
+        children=[
+            filter_panel(),
+            page_content_1(),
+            page_content_2(),
+            page_content_3(),
+            page_content_4()
+        ]
+    )
 
 
 if __name__ == '__main__':
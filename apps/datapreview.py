@@ -1,10 +1,9 @@
-import pandas as pd
+from urllib.parse import urlencode
 import dash_bootstrap_components as dbc
 from dash import html, dash_table
 from dash.dependencies import Input, Output, State
 from app import app
-
-data = pd.read_csv('data/cleaned_data/cleaned_data_1.csv', nrows=100)
+from preview_table import preview_columns, preview_numeric_columns, preview_page
 
 data_table = dash_table.DataTable(
     style_cell = {
@@ -33,9 +32,16 @@ data_table = dash_table.DataTable(
         }
     ],
 
-    columns = [{'name': i, 'id': i} for i in data.columns],
+    id = 'data_table',
+    columns = [{'name': i, 'id': i, 'type': 'numeric' if i in preview_numeric_columns else 'text'} for i in preview_columns],
+    page_current = 0,
     page_size = 10,
-    data = data.to_dict('records')
+    page_action = 'custom',
+    sort_action = 'custom',
+    sort_mode = 'single',
+    sort_by = [],
+    filter_action = 'custom',
+    filter_query = ''
 )
 
 
@@ -82,6 +88,16 @@ offcanvas = html.Div(
                     html.Br(),
                     html.Br(),
 
+                    html.Span('LATITUDE: ', className="text-success"),
+                    html.Span('Latitude of the incident'),
+                    html.Br(),
+                    html.Br(),
+
+                    html.Span('LONGITUDE: ', className="text-success"),
+                    html.Span('Longitude of the incident'),
+                    html.Br(),
+                    html.Br(),
+
                     html.Span('N_GUNS_INVOLVED: ', className="text-success"),
                     html.Span('# of guns involved'),
                     html.Br(),
@@ -115,6 +131,29 @@ offcanvas = html.Div(
 )
 
 
+downloads = html.Div(
+    children=[
+        dbc.Button(
+            className="bg-dark text-light me-2",
+            id="download-csv",
+            outline=True,
+            href="/export/incidents.csv",
+            external_link=True,
+            children=['Download CSV'],
+        ),
+
+        dbc.Button(
+            className="bg-dark text-light",
+            id="download-arrow",
+            outline=True,
+            href="/export/incidents.arrow",
+            external_link=True,
+            children=['Download Arrow'],
+        ),
+    ]
+)
+
+
 page_content_1 = dbc.Container(
     children=[
         dbc.Row(
@@ -127,7 +166,20 @@ page_content_1 = dbc.Container(
                         color="dark",
                         style={'height': '100%'}
                     ),
-                    lg=9
+                    lg=6
+                ),
+
+                dbc.Col(
+                    dbc.Card(
+                        className="justify-content-center text-center",
+                        children=[
+                            downloads
+                        ],
+                        body=True,
+                        color="dark",
+                        style={'height': '100%'}
+                    ),
+                    lg=3
                 ),
 
                 dbc.Col(
@@ -160,6 +212,29 @@ def toggle_offcanvas(n1, is_open):
     return is_open
 
 
+@app.callback(
+    Output("data_table", "data"),
+    Output("data_table", "page_count"),
+    Input("data_table", "page_current"),
+    Input("data_table", "page_size"),
+    Input("data_table", "sort_by"),
+    Input("data_table", "filter_query"),
+    prevent_initial_call=False
+)
+def update_table(page_current, page_size, sort_by, filter_query):
+    return preview_page(page_current, page_size, sort_by, filter_query)
+
+
+@app.callback(
+    Output("download-csv", "href"),
+    Output("download-arrow", "href"),
+    Input("data_table", "filter_query")
+)
+def update_downloads(filter_query):
+    query = '?' + urlencode({'filter_query': filter_query}) if filter_query else ''
+    return '/export/incidents.csv' + query, '/export/incidents.arrow' + query
+
+
 layout = html.Div(
     children=[
         page_content_1
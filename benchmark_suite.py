@@ -0,0 +1,406 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import resource
+
+repository_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, repository_path)
+sys.path.insert(1, os.path.join(repository_path, 'data'))
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import dashboard_functions
+import column_store
+import query_engine
+import out_of_core
+from figure_registry import figure_sources
+from synthetic_data import synthetic_data_write, base_rows
+from data_clean import data_clean_streaming, data_clean_parallel_streaming #type:ignore
+from data_cleaning_functions import original_data_reader, data_feature_engineering, final_column_cleaning, data_save, participant_table_builder, participant_table_save, aggregate_cube_builder, aggregate_cube_save #type:ignore
+
+benchmark_scales = [1, 10, 100]
+
+# Largest scale the in-memory cleaning and loading stages run at: they hold the full data
+# (about 0.8 GB peak per 1x), above it only the streaming, parallel and out-of-core modes run
+benchmark_in_memory_scale = 1
+benchmark_chunksize = 100000
+benchmark_workers = min(4, os.cpu_count() or 1)
+
+benchmark_results_path = os.path.join(repository_path, 'benchmark_results')
+
+benchmark_filters = {
+    'year': [2016, 2017],
+    'state_code': ['CA', 'TX', 'FL', 'IL'],
+    'weekday': ['Sat', 'Sun']
+}
+
+
+def peak_memory_reset():
+    """
+    Reset the peak resident memory of this process, when the platform allows it
+    Linux resets VmHWM through /proc/self/clear_refs; elsewhere the peak keeps growing
+    and only increases are visible
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    None
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+    return None
+
+
+def memory_status():
+    """
+    Current and peak resident memory of this process
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    current: int (bytes)
+    peak: int (bytes)
+    """
+
+    try:
+        with open('/proc/self/status') as status:
+            fields = dict(line.split(':', 1) for line in status)
+
+        return int(fields['VmRSS'].split()[0]) * 1024, int(fields['VmHWM'].split()[0]) * 1024
+
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+        return peak, peak
+
+
+def stage_measure(results, scale, group, stage, function, *args):
+    """
+    Run one stage of the benchmark, recording its duration and peak memory
+
+    Parameters:
+    -----------
+    results: list of dict (the stage record is appended)
+    scale: float
+    group: str ('cleaning', 'loading' or 'generator', with the mode in brackets for the
+           streaming, parallel and out-of-core modes)
+    stage: str (unique per scale)
+    function: callable
+    args: arguments of function
+
+    Returns:
+    result: result of function(*args)
+    """
+
+    peak_memory_reset()
+    memory_before, _ = memory_status()
+
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+
+    _, memory_peak = memory_status()
+
+    results.append({
+        'scale': scale,
+        'group': group,
+        'stage': stage,
+        'seconds': seconds,
+        'peak_rss_bytes': memory_peak,
+        'peak_rss_delta_bytes': max(memory_peak - memory_before, 0)
+    })
+
+    print(f'{scale:>6}x  {group:<22} {stage:<60} {seconds:10.4f}s  {results[-1]["peak_rss_delta_bytes"] / 2**20:10.1f} MB')
+
+    return result
+
+
+def benchmark_in_memory(results, scale):
+    """
+    Benchmark the in-memory cleaning stages, the dashboard loaders and every figure
+    generator, in the working directory holding the synthetic original data
+
+    Parameters:
+    -----------
+    results: list of dict (stage records are appended)
+    scale: float
+
+    Returns:
+    None
+    """
+
+    data = stage_measure(results, scale, 'cleaning', 'original_data_reader', original_data_reader)
+    data = stage_measure(results, scale, 'cleaning', 'data_feature_engineering', data_feature_engineering, data)
+    data = stage_measure(results, scale, 'cleaning', 'final_column_cleaning', final_column_cleaning, data)
+    stage_measure(results, scale, 'cleaning', 'data_save', data_save, data)
+
+    participants = stage_measure(results, scale, 'cleaning', 'participant_table_builder', participant_table_builder, data)
+    participant_table_save(participants)
+
+    cube = stage_measure(results, scale, 'cleaning', 'aggregate_cube_builder', aggregate_cube_builder, data)
+    aggregate_cube_save(cube)
+
+    del data, participants, cube
+
+    data = stage_measure(results, scale, 'loading', 'cleaned_data_reader', dashboard_functions.cleaned_data_reader)
+    cube = stage_measure(results, scale, 'loading', 'cube_reader', dashboard_functions.cube_reader)
+    participants = stage_measure(results, scale, 'loading', 'participant_table_reader', dashboard_functions.participant_table_reader)
+
+    index = stage_measure(results, scale, 'loading', 'query_index_builder', query_engine.query_index_builder, data, participants)
+    stage_measure(results, scale, 'loading', 'column_store_save', column_store.column_store_save, index)
+
+    del data, participants, index
+
+    index = stage_measure(results, scale, 'loading', 'column_store_reader', column_store.column_store_reader)
+    aggregates = stage_measure(results, scale, 'loading', 'incident_aggregates', dashboard_functions.incident_aggregates, cube)
+    selection = stage_measure(results, scale, 'loading', 'query_selection', query_engine.query_selection, index, benchmark_filters)
+    filtered_aggregates = stage_measure(results, scale, 'loading', 'incident_aggregates[filtered]', dashboard_functions.incident_aggregates, index, selection)
+
+    for name, (generator, source) in figure_sources.items():
+        function = getattr(dashboard_functions, generator)
+
+        if source == 'aggregates':
+            stage_measure(results, scale, 'generator', generator, function, aggregates)
+            stage_measure(results, scale, 'generator', generator + '[filtered]', function, filtered_aggregates)
+        else:
+            stage_measure(results, scale, 'generator', generator, function, index)
+            stage_measure(results, scale, 'generator', generator + '[filtered]', function, index, selection)
+
+    return None
+
+
+def benchmark_out_of_core(results, scale):
+    """
+    Benchmark the streaming and parallel cleaning modes, the out-of-core loaders and every
+    figure generator on their results, in the working directory holding the synthetic
+    original data. Memory is bounded by benchmark_chunksize, so these run at every scale
+    (the peak memory of the parallel workers is not counted, only that of this process)
+
+    Parameters:
+    -----------
+    results: list of dict (stage records are appended)
+    scale: float
+
+    Returns:
+    None
+    """
+
+    stage_measure(results, scale, 'cleaning[parallel]', 'data_clean_parallel_streaming', data_clean_parallel_streaming, benchmark_chunksize, benchmark_workers)
+    stage_measure(results, scale, 'cleaning[streaming]', 'data_clean_streaming', data_clean_streaming, benchmark_chunksize)
+
+    group = 'loading[out_of_core]'
+
+    stage_measure(results, scale, group, 'chunk_stores_build', out_of_core.chunk_stores_build, benchmark_chunksize)
+    indexes = stage_measure(results, scale, group, 'chunk_stores_reader', out_of_core.chunk_stores_reader, benchmark_chunksize)
+    cube = stage_measure(results, scale, group, 'out_of_core_cube', out_of_core.out_of_core_cube, benchmark_chunksize)
+    bins = stage_measure(results, scale, group, 'out_of_core_hex_pyramid', out_of_core.out_of_core_hex_pyramid, benchmark_chunksize)
+
+    cube_index = stage_measure(results, scale, group, 'query_index_builder[cube]', query_engine.query_index_builder, cube[dashboard_functions.cube_dimensions + dashboard_functions.cube_measures], None, False)
+    cube_aggregates = stage_measure(results, scale, group, 'incident_aggregates[cube]', dashboard_functions.incident_aggregates, cube_index)
+    cube_selection = query_engine.query_selection(cube_index, benchmark_filters)
+    filtered_cube_aggregates = stage_measure(results, scale, group, 'incident_aggregates[cube filtered]', dashboard_functions.incident_aggregates, cube_index, cube_selection)
+
+    aggregates = stage_measure(results, scale, group, 'out_of_core_aggregates', out_of_core.out_of_core_aggregates, indexes)
+    filtered_aggregates = stage_measure(results, scale, group, 'out_of_core_aggregates[filtered]', out_of_core.out_of_core_aggregates, indexes, benchmark_filters)
+    filtered_bins = stage_measure(results, scale, group, 'out_of_core_hex_bins[filtered]', out_of_core.out_of_core_hex_bins, indexes, benchmark_filters)
+
+    for name, (generator, source) in figure_sources.items():
+        function = getattr(dashboard_functions, generator)
+
+        if source == 'aggregates':
+            unfiltered, filtered = cube_aggregates, filtered_cube_aggregates
+        elif source == 'hex_bins':
+            unfiltered, filtered = bins, filtered_bins
+        else:
+            unfiltered, filtered = aggregates, filtered_aggregates
+
+        stage_measure(results, scale, 'generator[out_of_core]', generator + '[out_of_core]', function, unfiltered)
+        stage_measure(results, scale, 'generator[out_of_core]', generator + '[out_of_core filtered]', function, filtered)
+
+    return None
+
+
+def benchmark_scale(scale, seed, workspace, in_memory_scale = benchmark_in_memory_scale):
+    """
+    Benchmark the cleaning modes, the dashboard loaders and every figure generator on
+    seeded synthetic data of base_rows * scale incidents
+    The in-memory stages only run up to in_memory_scale, the streaming, parallel and
+    out-of-core modes run at every scale
+    The synthetic original data and every output are written to the workspace, which
+    becomes the working directory while the stages run
+
+    Parameters:
+    -----------
+    scale: float
+    seed: int
+    workspace: str
+    in_memory_scale: float
+
+    Returns:
+    results: list of dict
+    """
+
+    results = []
+    working_directory = os.getcwd()
+
+    synthetic_data_write(scale, workspace, seed)
+    os.makedirs(os.path.join(workspace, 'data', 'cleaned_data'), exist_ok = True)
+    os.chdir(workspace)
+
+    try:
+        if scale <= in_memory_scale:
+            benchmark_in_memory(results, scale)
+
+        benchmark_out_of_core(results, scale)
+
+        rows = pq.ParquetFile('data/cleaned_data/cleaned_data.parquet').metadata.num_rows
+
+    finally:
+        os.chdir(working_directory)
+
+    for record in results:
+        record['rows'] = rows
+
+    return results
+
+
+def benchmark_metadata(seed):
+    """
+    Describe the code and environment a benchmark ran on, so result files can be compared
+
+    Parameters:
+    -----------
+    seed: int
+
+    Returns:
+    metadata: dict
+    """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = repository_path, capture_output = True, text = True).stdout.strip()
+    except OSError:
+        commit = None
+
+    metadata = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': commit or None,
+        'seed': seed,
+        'base_rows': base_rows,
+        'chunksize': benchmark_chunksize,
+        'workers': benchmark_workers,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+    return metadata
+
+
+def benchmark_run(scales = benchmark_scales, seed = 0, output_path = None, keep_workspace = False, in_memory_scale = benchmark_in_memory_scale):
+    """
+    Run the benchmark at every scale and write the results as json
+
+    Parameters:
+    -----------
+    scales: list of float
+    seed: int
+    output_path: str (optional, defaults to a timestamped file in benchmark_results)
+    keep_workspace: bool (keep the synthetic and cleaned data files)
+    in_memory_scale: float (largest scale the in-memory stages run at)
+
+    Returns:
+    output_path: str
+    """
+
+    benchmark = {'metadata': benchmark_metadata(seed), 'results': []}
+
+    for scale in scales:
+        workspace = tempfile.mkdtemp(prefix = f'benchmark_{scale}x_')
+
+        try:
+            benchmark['results'].extend(benchmark_scale(scale, seed, workspace, in_memory_scale))
+        finally:
+            if keep_workspace:
+                print(f'Kept workspace {workspace}')
+            else:
+                shutil.rmtree(workspace, ignore_errors = True)
+
+    if output_path is None:
+        os.makedirs(benchmark_results_path, exist_ok = True)
+        output_path = os.path.join(benchmark_results_path, time.strftime('benchmark_%Y%m%d_%H%M%S.json'))
+
+    with open(output_path, 'w') as output_file:
+        json.dump(benchmark, output_file, indent = 1)
+
+    print(f'Results written to {output_path}')
+
+    return output_path
+
+
+def benchmark_compare(baseline_path, candidate_path):
+    """
+    Print the duration and peak memory ratio of every stage present in two result files
+
+    Parameters:
+    -----------
+    baseline_path: str
+    candidate_path: str
+
+    Returns:
+    comparison: list of dict
+    """
+
+    with open(baseline_path) as baseline_file, open(candidate_path) as candidate_file:
+        baseline = {(record['scale'], record['stage']): record for record in json.load(baseline_file)['results']}
+        candidate = {(record['scale'], record['stage']): record for record in json.load(candidate_file)['results']}
+
+    comparison = []
+
+    for key in candidate:
+        if key not in baseline:
+            continue
+
+        comparison.append({
+            'scale': key[0],
+            'stage': key[1],
+            'seconds_ratio': candidate[key]['seconds'] / max(baseline[key]['seconds'], 1e-9),
+            'memory_ratio': candidate[key]['peak_rss_delta_bytes'] / max(baseline[key]['peak_rss_delta_bytes'], 1)
+        })
+
+        print(f'{key[0]:>6}x  {key[1]:<60} time x{comparison[-1]["seconds_ratio"]:7.2f}   memory x{comparison[-1]["memory_ratio"]:7.2f}')
+
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the cleaning stages and dashboard generators on synthetic data')
+    parser.add_argument('--scales', type = float, nargs = '+', default = benchmark_scales, help = f'multiples of {base_rows} incidents')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', help = 'json results path')
+    parser.add_argument('--keep-workspace', action = 'store_true', help = 'keep the synthetic and cleaned data files')
+    parser.add_argument('--in-memory-scale', type = float, default = benchmark_in_memory_scale, help = 'largest scale the in-memory stages run at, the streaming, parallel and out-of-core modes run at every scale')
+    parser.add_argument('--compare', nargs = 2, metavar = ('BASELINE', 'CANDIDATE'), help = 'compare two result files instead of running')
+    arguments = parser.parse_args()
+
+    if arguments.compare:
+        benchmark_compare(*arguments.compare)
+    else:
+        benchmark_run(arguments.scales, arguments.seed, arguments.output, arguments.keep_workspace, arguments.in_memory_scale)
@@ -0,0 +1,151 @@
+import numpy as np
+
+bitmap_dimensions = [
+    'state_code',
+    'year',
+    'month',
+    'weekday'
+]
+
+
+def bitmap_index_builder(index, dimensions = bitmap_dimensions):
+    """
+    Build a packed bitmap per value of each low cardinality dimension
+    Bit i of a value's bitmap is set when row i has that value, so predicates on these
+    dimensions become bitwise ANDs/ORs over a few kilobytes instead of full column scans
+
+    Parameters:
+    -----------
+    index: dict (query index, see query_engine.query_index_builder)
+    dimensions: list of dimensions
+
+    Returns:
+    bitmaps: dict
+    """
+
+    bitmaps = {'size': index['size']}
+
+    for dimension in dimensions:
+        codes = index[dimension]
+        categories = index[dimension + '_categories']
+
+        order = np.argsort(codes, kind = 'stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+
+        bitmaps[dimension] = {}
+
+        for code, category in enumerate(categories):
+            rows = np.zeros(index['size'], dtype = bool)
+            rows[order[bounds[code]:bounds[code + 1]]] = True
+
+            bitmaps[dimension][category] = np.packbits(rows)
+
+    return bitmaps
+
+
+def bitmap_all(bitmaps):
+    """
+    Bitmap selecting every row
+
+    Parameters:
+    -----------
+    bitmaps: dict
+
+    Returns:
+    bitmap: np array of uint8
+    """
+
+    bitmap = np.packbits(np.ones(bitmaps['size'], dtype = bool))
+
+    return bitmap
+
+
+def bitmap_values(bitmaps, dimension, values):
+    """
+    Bitmap of the rows whose dimension is any of the values (OR of the value bitmaps)
+    Values missing from the index select nothing
+
+    Parameters:
+    -----------
+    bitmaps: dict
+    dimension: str
+    values: list
+
+    Returns:
+    bitmap: np array of uint8
+    """
+
+    bitmap = np.zeros((bitmaps['size'] + 7) // 8, dtype = np.uint8)
+
+    for value in values:
+        if value in bitmaps[dimension]:
+            bitmap |= bitmaps[dimension][value]
+
+    return bitmap
+
+
+def bitmap_query(bitmaps, predicate):
+    """
+    Evaluate a predicate over the bitmap index
+    A predicate is either a dict of dimension -> list of values (values OR'ed, dimensions
+    AND'ed, None selects everything) or a tuple ('and' | 'or', [predicates])
+
+    Parameters:
+    -----------
+    bitmaps: dict
+    predicate: dict or tuple
+
+    Returns:
+    bitmap: np array of uint8
+    """
+
+    if isinstance(predicate, dict):
+        bitmap = bitmap_all(bitmaps)
+
+        for dimension, values in predicate.items():
+            if values is not None:
+                bitmap &= bitmap_values(bitmaps, dimension, values)
+
+        return bitmap
+
+    operator, predicates = predicate
+    bitmaps_evaluated = [bitmap_query(bitmaps, child) for child in predicates]
+
+    if operator == 'and':
+        bitmap = bitmap_all(bitmaps)
+
+        for child in bitmaps_evaluated:
+            bitmap &= child
+
+    elif operator == 'or':
+        bitmap = np.zeros((bitmaps['size'] + 7) // 8, dtype = np.uint8)
+
+        for child in bitmaps_evaluated:
+            bitmap |= child
+
+    else:
+        raise ValueError(f'unknown bitmap operator: {operator}')
+
+    return bitmap
+
+
+def bitmap_selection(bitmaps, bitmap):
+    """
+    Expand a bitmap into a row selection usable by the query engine and the generators
+
+    Parameters:
+    -----------
+    bitmaps: dict
+    bitmap: np array of uint8
+
+    Returns:
+    selection: np array of bool
+    """
+
+    selection = np.unpackbits(bitmap, count = bitmaps['size']).view(bool)
+
+    return selection
+
+
+if __name__ == '__main__':
+    print('This is the bitmap index file')
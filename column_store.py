@@ -0,0 +1,200 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import sys
+sys.path.insert(1, './data')
+from data_cleaning_functions import data_signature #type:ignore
+
+store_version = 1
+store_path = './data/cleaned_data/column_store.bin'
+store_magic = b'GVCS'
+store_alignment = 64
+
+# Every module the stored query index is read and built by, a change to any of them
+# invalidates the store
+store_code_paths = [
+    './dashboard_functions.py',
+    './query_engine.py',
+    './bitmap_index.py',
+    './gun_analytics.py',
+    './time_series.py',
+    './data/data_cleaning_functions.py'
+]
+
+
+def store_signature():
+    """
+    Signature of the cleaned data and of the code of the query index the store is built from
+    (see data_cleaning_functions.data_signature)
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    signature: str
+    """
+
+    signature = data_signature(store_version, store_code_paths)
+
+    return signature
+
+
+def store_aligned(position):
+    """
+    Round a byte position up to the store alignment
+    """
+
+    return -(-position // store_alignment) * store_alignment
+
+
+def column_store_save(index, path = store_path):
+    """
+    Write a query index into a single memory mappable columnar file
+    The file is a small json header (dtypes, shapes, offsets and the category dictionaries)
+    followed by the raw, aligned numpy arrays. It is written to a temporary path first so
+    concurrent workers never map a partial store
+
+    Parameters:
+    -----------
+    index: dict (query index, see query_engine.query_index_builder)
+    path: str
+
+    Returns:
+    None
+    """
+
+    arrays = {}
+    categories = {}
+
+    for key, value in index.items():
+        if key == 'size':
+            continue
+
+        elif key == 'participants':
+            for name, array in value.items():
+                if name.endswith('_categories'):
+                    categories['participants/' + name] = array.tolist()
+                else:
+                    arrays['participants/' + name] = array
+
+        elif key == 'bitmaps':
+            for dimension in value:
+                if dimension != 'size':
+                    arrays['bitmaps/' + dimension] = np.stack(list(value[dimension].values()))
+
+        elif key.endswith('_categories'):
+            categories[key] = value.tolist()
+
+        else:
+            arrays[key] = value
+
+    layout = {}
+    position = 0
+
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': position}
+        position = store_aligned(position + array.nbytes)
+
+    header = json.dumps({
+        'version': store_version,
+        'signature': store_signature(),
+        'size': index['size'],
+        'arrays': layout,
+        'categories': categories
+    }).encode()
+
+    data_start = store_aligned(len(store_magic) + 8 + len(header))
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+
+    with open(temporary_path, 'wb') as store_file:
+        store_file.write(store_magic)
+        store_file.write(np.uint64(len(header)).tobytes())
+        store_file.write(header)
+
+        for name, array in arrays.items():
+            store_file.seek(data_start + layout[name]['offset'])
+            store_file.write(array.tobytes())
+
+    os.replace(temporary_path, path)
+
+
+def column_store_reader(path = store_path, signature = None):
+    """
+    Map the column store read only and rebuild the query index over the mapped buffers
+    Every worker maps the same file, so the arrays live once in the page cache instead of
+    once per process. Returns None if the store is missing, of another version or stale
+
+    Parameters:
+    -----------
+    path: str
+    signature: str (optional, store_signature() computed once by a caller mapping several stores)
+
+    Returns:
+    index: dict (query index of np.memmap views)
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as store_file:
+        if store_file.read(len(store_magic)) != store_magic:
+            return None
+
+        header_length = int(np.frombuffer(store_file.read(8), dtype = np.uint64)[0])
+        header = json.loads(store_file.read(header_length))
+
+    if header['version'] != store_version:
+        return None
+
+    signature = signature or store_signature()
+
+    if signature is not None and header['signature'] != signature:
+        return None
+
+    data_start = store_aligned(len(store_magic) + 8 + header_length)
+    buffer = np.memmap(path, dtype = np.uint8, mode = 'r')
+
+    index = {'size': header['size'], 'participants': {}, 'bitmaps': {'size': header['size']}}
+
+    for name, array_layout in header['arrays'].items():
+        dtype = np.dtype(array_layout['dtype'])
+        start = data_start + array_layout['offset']
+        stop = start + dtype.itemsize * int(np.prod(array_layout['shape']))
+
+        array = buffer[start:stop].view(dtype).reshape(array_layout['shape'])
+
+        if name.startswith('participants/'):
+            index['participants'][name.split('/', 1)[1]] = array
+        elif name.startswith('bitmaps/'):
+            index['bitmaps'][name.split('/', 1)[1]] = array
+        else:
+            index[name] = array
+
+    for name, values in header['categories'].items():
+        if name.startswith('participants/'):
+            index['participants'][name.split('/', 1)[1]] = np.array(values)
+        else:
+            index[name] = pd.Index(values)
+
+    for dimension in list(index['bitmaps']):
+        if dimension != 'size':
+            index['bitmaps'][dimension] = dict(zip(index[dimension + '_categories'], index['bitmaps'][dimension]))
+
+    if not index['participants']:
+        del index['participants']
+
+    return index
+
+
+if __name__ == '__main__':
+    import dashboard_functions
+    from query_engine import query_index_builder
+
+    data = dashboard_functions.cleaned_data_reader()
+    column_store_save(query_index_builder(data, dashboard_functions.participant_table_reader()))
+    print(f'Column store written to {store_path}')
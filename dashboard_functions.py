@@ -1,18 +1,24 @@
+import os
 import pandas as pd
 import numpy as np
-from collections import Counter
+import pyarrow as pa
+import pyarrow.parquet as pq
 import plotly.graph_objs as go
 from dash import dcc
 import sys
 sys.path.insert(1, './data')
-from data_cleaning_functions import gun_map, column_dtypes, string_to_list #type:ignore
+from query_engine import participant_roles, query_index_builder, query_aggregate, query_aggregates, participant_histogram
+from gun_analytics import gun_count_labels, gun_type_counts, gun_count_bins
+from time_series import time_series_points, time_series_window, daily_counts, lttb
+from data_cleaning_functions import column_dtypes, compact_column_dtypes, list_column_types, month_categories, cube_dimensions, cube_measures, string_to_list, arrow_to_data, compact_schema_apply, participant_table_builder, aggregate_cube_builder, hex_levels, hex_radius, hex_latitude, hex_bin_centers, hex_bins_builder #type:ignore
 
 
 def cleaned_data_reader():
     """
-    Read the data into memory and apply a string_to_list() function to convert literal string values
-    into lists.
-    '[1, 2, 3]' -> [1, 2, 3]
+    Read the data into memory, in the compact in-memory schema
+    Only the incident level columns are read: the values of the list columns are held by the
+    participant table (see participant_table_reader). The parquet file is read when present,
+    the csv files otherwise
 
     Parameters:
     -----------
@@ -22,34 +28,257 @@ def cleaned_data_reader():
     data: dataframe
     """
 
-    cleaned_data_1 = pd.read_csv('./data/cleaned_data/cleaned_data_1.csv', dtype = column_dtypes)
-    cleaned_data_2 = pd.read_csv('./data/cleaned_data/cleaned_data_2.csv', dtype = column_dtypes)
-    data = pd.concat([cleaned_data_1, cleaned_data_2], ignore_index = True)
+    if os.path.exists('./data/cleaned_data/cleaned_data.parquet'):
+        parquet_file = pq.ParquetFile('./data/cleaned_data/cleaned_data.parquet')
+        columns = [column for column in parquet_file.schema_arrow.names if column not in list_column_types]
+
+        return compact_schema_apply(parquet_data_reader('./data/cleaned_data/cleaned_data.parquet', columns))
+
+    cleaned_data = [
+        pd.read_csv(path, dtype = column_dtypes, usecols = lambda column: column not in list_column_types)
+        for path in ['./data/cleaned_data/cleaned_data_1.csv', './data/cleaned_data/cleaned_data_2.csv']
+    ]
+
+    data = compact_schema_apply(pd.concat(cleaned_data, ignore_index = True))
+
+    return data
+
+
+def cleaned_data_chunk_reader(chunksize = 100000):
+    """
+    Stream the cleaned data in chunks of at most chunksize incidents, in file order
+    Each chunk comes in the compact schema of cleaned_data_reader() with its participant
+    table, so memory use depends on the chunk size instead of the size of the data
+    Parquet chunks are coded straight from their arrow list columns; the csv files go
+    through string_to_list() to convert literal string values into lists.
+    '[1, 2, 3]' -> [1, 2, 3]
+
+    Parameters:
+    -----------
+    chunksize: int
+
+    Returns:
+    chunks: generator of (dataframe, participant table)
+    """
+
+    if os.path.exists('./data/cleaned_data/cleaned_data.parquet'):
+        parquet_file = pq.ParquetFile('./data/cleaned_data/cleaned_data.parquet')
+
+        for batch in parquet_file.iter_batches(batch_size = chunksize):
+            table = pa.Table.from_batches([batch])
+            columns = [column for column in table.column_names if column not in list_column_types]
+
+            yield compact_schema_apply(arrow_to_data(table.select(columns))), participant_table_builder(table)
+
+        return
+
+    for path in ['./data/cleaned_data/cleaned_data_1.csv', './data/cleaned_data/cleaned_data_2.csv']:
+        for data in pd.read_csv(path, dtype = column_dtypes, chunksize = chunksize):
+            if data.empty:
+                continue
+
+            data = data.reset_index(drop = True)
+
+            for column in list_column_types:
+                data[column] = data[column].apply(string_to_list)
+
+            participants = participant_table_builder(data)
+
+            yield compact_schema_apply(data), participants
+
+
+def parquet_data_reader(path, columns = None):
+    """
+    Read the cleaned parquet file into memory
+    Typed list columns are converted by arrow into one numpy array per row, null lists
+    become np.nan
+
+    Parameters:
+    -----------
+    path: str
+    columns: list of str (optional, every column by default)
 
-    data['participant_age'] = data['participant_age'].apply(string_to_list)
-    data['participant_status'] = data['participant_status'].apply(string_to_list)
-    data['participant_type'] = data['participant_type'].apply(string_to_list)
-    data['gun_type'] = data['gun_type'].apply(string_to_list)
-    data['participant_gender'] = data['participant_gender'].apply(string_to_list)
+    Returns:
+    data: dataframe
+    """
+
+    data = arrow_to_data(pq.read_table(path, columns = columns))
 
     return data
 
 
+def participant_table_reader():
+    """
+    Read the participant table (participants and guns of every incident) saved by the
+    cleaning step
+    If the npz file is missing or was saved without the guns, build it from the list columns
+    of the cleaned data instead
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    participants: dict of np arrays
+    """
+
+    if os.path.exists('./data/cleaned_data/participants.npz'):
+        with np.load('./data/cleaned_data/participants.npz') as participants_file:
+            participants = dict(participants_file)
+
+        if 'gun_category' in participants:
+            return participants
+
+    if os.path.exists('./data/cleaned_data/cleaned_data.parquet'):
+        return participant_table_builder(pq.read_table('./data/cleaned_data/cleaned_data.parquet', columns = list(list_column_types)))
+
+    lists = [
+        pd.read_csv(path, dtype = column_dtypes, usecols = list(list_column_types))
+        for path in ['./data/cleaned_data/cleaned_data_1.csv', './data/cleaned_data/cleaned_data_2.csv']
+    ]
+    lists = pd.concat(lists, ignore_index = True)
+
+    for column in list_column_types:
+        lists[column] = lists[column].apply(string_to_list)
+
+    participants = participant_table_builder(lists)
+
+    return participants
+
+
+def cube_reader(data = None):
+    """
+    Read the pre-aggregated cube saved by the cleaning step
+    If the parquet file is missing, build it from the provided data instead
+
+    Parameters:
+    -----------
+    data: dataframe (optional)
+
+    Returns:
+    cube: dataframe
+    """
+
+    if os.path.exists('./data/cleaned_data/cube.parquet'):
+        cube = pq.read_table('./data/cleaned_data/cube.parquet').to_pandas()
+        cube = cube.astype({column: dtype for column, dtype in compact_column_dtypes.items() if column in cube_dimensions})
+
+    else:
+        cube = aggregate_cube_builder(data if data is not None else cleaned_data_reader())
+
+    return cube
+
+
+def hex_bins_reader(data = None):
+    """
+    Read the hexagon bin pyramid of the density map saved by the cleaning step
+    If the parquet file is missing, build it from the provided data instead
+
+    Parameters:
+    -----------
+    data: dataframe (optional)
+
+    Returns:
+    bins: dataframe of level, q, r, count, n_killed, n_injured
+    """
+
+    if os.path.exists('./data/cleaned_data/hex_bins.parquet'):
+        bins = pq.read_table('./data/cleaned_data/hex_bins.parquet').to_pandas()
+
+    else:
+        bins = hex_bins_builder(data if data is not None else cleaned_data_reader())
+
+    return bins
+
+
+def cube_query(source, by, selection = None):
+    """
+    Answer a grouped count/sum of incidents from the aggregate cube
+    An incident level dataframe is also accepted and grouped directly, and a query index
+    (see query_engine.query_index_builder) is answered with bincounts
+
+    Parameters:
+    -----------
+    source: dataframe (aggregate cube or incidents), query index or incident aggregates
+    by: list of cube dimensions
+    selection: np array of bool or of row positions over the rows of source (optional)
+
+    Returns:
+    result: dataframe of count, n_killed, n_injured indexed by the dimensions
+    """
+
+    if isinstance(source, dict) and 'aggregates' in source:
+        return source['aggregates'][tuple(by)].copy()
+
+    if isinstance(source, dict):
+        return query_aggregate(source, by, selection)
+
+    if selection is not None:
+        source = source.iloc[selection]
+
+    if 'count' in source.columns:
+        result = source.groupby(by, observed = True)[cube_measures].sum()
+
+    else:
+        result = source.groupby(by, observed = True).agg(
+            count = ('n_killed', 'size'),
+            n_killed = ('n_killed', 'sum'),
+            n_injured = ('n_injured', 'sum')
+        )
+
+    return result
+
+
+# Incident level statistics of the heatmap, barcharts and per day/month/year charts
+incident_groupings = [
+    ['state_code'],
+    ['state'],
+    ['city_or_county'],
+    ['weekday'],
+    ['month', 'year'],
+    ['year']
+]
+
+
+def incident_aggregates(data, selection = None):
+    """
+    Plan every incident level statistic of the dashboard as a single pass over the data
+    The result is accepted by cube_query in place of the data, so each generator takes its
+    grouping from it instead of grouping the data again
+
+    Parameters:
+    -----------
+    data: dataframe (aggregate cube or incidents), query index or incident aggregates
+    selection: np array of bool or of row positions (optional)
+
+    Returns:
+    aggregates: dict with the 'aggregates' of every incident grouping
+    """
+
+    if not isinstance(data, dict):
+        data = query_index_builder(data[cube_dimensions + [measure for measure in cube_measures if measure in data]], bitmaps = False)
+
+    aggregates = {'aggregates': query_aggregates(data, incident_groupings, selection)}
+
+    return aggregates
+
+
 # Heatmap for incidents across the US -----------------------------------#
-def heatmap_generator(data):
+def heatmap_generator(data, selection = None):
     """
     Generate heatmap graph
 
     Parameters:
     -----------
-    data: dataframe
+    data: dataframe (aggregate cube or incidents), query index or incident aggregates
+    selection: np array of bool (optional)
 
     Returns:
     incident_heatmap: dcc.Graph
     """
 
-    states_incidents_sum = pd.DataFrame(data.groupby(['state_code'])['date'].count())
-    states_incidents_sum = states_incidents_sum.sort_values(by = 'date', ascending = False)
+    states_incidents_sum = cube_query(data, ['state_code'], selection)[['count']]
+    states_incidents_sum = states_incidents_sum.sort_values(by = 'count', ascending = False)
     states_incidents_sum = states_incidents_sum.reset_index()
     states_incidents_sum.columns = ['state_code', 'counts']
 
@@ -76,27 +305,154 @@ def heatmap_generator(data):
     return incident_heatmap
 
 
+# Hexagon density map of incidents ------------------------------------#
+# Pixel size of a level 0 hexagon marker at projection scale 1 (about 11 pixels per degree of
+# latitude on the 55vh high map). Markers grow with the projection scale and halve with each
+# level, so they keep the size of their hexagon and neighbouring hexagons tile the map
+hex_marker_size = 11
+
+
+def map_view_level(map_view):
+    """
+    Zoom level of a density map view, clipped to the levels of the bin pyramid, its bounds and
+    its projection scale (2 ** level when the view does not give one)
+    """
+
+    level, bounds, *scale = map_view if map_view is not None else (0, None)
+    level = min(max(int(level), 0), hex_levels - 1)
+    scale = float(scale[0]) if scale else 2.0 ** level
+
+    return level, bounds, scale
+
+
+def hex_bins_view(index, selection = None, map_view = None):
+    """
+    Bin the selected incidents of a query index at the zoom level of a map view alone
+    Points are kept one hexagon past the bounds, so the hexagons centered inside are whole
+
+    Parameters:
+    -----------
+    index: dict (query index)
+    selection: np array of bool or of row positions (optional)
+    map_view: tuple of (level, bounds, scale) (optional, see density_map_generator)
+
+    Returns:
+    bins: dataframe of level, q, r, count, n_killed, n_injured
+    """
+
+    level, bounds, _ = map_view_level(map_view)
+
+    longitude = index['longitude'] if selection is None else index['longitude'][selection]
+    latitude = index['latitude'] if selection is None else index['latitude'][selection]
+    rows = np.arange(len(longitude))
+
+    if bounds is not None:
+        west, east, south, north = bounds
+        margin = 2 * hex_radius / 2 ** level / np.cos(np.radians(hex_latitude))
+        rows = np.flatnonzero((longitude >= west - margin) & (longitude <= east + margin) & (latitude >= south - margin) & (latitude <= north + margin))
+
+    points = {
+        'longitude': longitude[rows],
+        'latitude': latitude[rows],
+        'n_killed': (index['n_killed'] if selection is None else index['n_killed'][selection])[rows],
+        'n_injured': (index['n_injured'] if selection is None else index['n_injured'][selection])[rows]
+    }
+    bins = hex_bins_builder(points, [level])
+
+    return bins
+
+
+def density_map_generator(data, selection = None, map_view = None):
+    """
+    Generate incident density map graph
+    Only the non-empty hexagons of the zoom level, within the viewed bounds, are sent. They are
+    read from bins (the bin pyramid, or bins of the view, e.g. from out_of_core_hex_bins), or
+    binned at that level alone from the coordinates of the selected incidents of a query index
+    Markers are sized from the level and the projection scale so the hexagons tile
+
+    Parameters:
+    -----------
+    data: hexagon bins or query index
+    selection: np array of bool or of row positions (optional)
+    map_view: tuple of (level, bounds, scale) (optional, bounds are (west, east, south, north)
+              or None, the projection scale is optional)
+
+    Returns:
+    density_map: dcc.Graph
+    """
+
+    level, bounds, scale = map_view_level(map_view)
+
+    if isinstance(data, dict):
+        bins = hex_bins_view(data, selection, map_view)
+    else:
+        bins = data[data['level'] == level]
+
+    bins_longitude, bins_latitude = hex_bin_centers(bins['q'].to_numpy(), bins['r'].to_numpy(), hex_radius / 2 ** level)
+
+    if bounds is not None:
+        west, east, south, north = bounds
+        shown = (bins_longitude >= west) & (bins_longitude <= east) & (bins_latitude >= south) & (bins_latitude <= north)
+        bins, bins_longitude, bins_latitude = bins[shown], bins_longitude[shown], bins_latitude[shown]
+
+    hover_text = [
+        f'Incidents: {count}<br>Killed: {n_killed}<br>Injured: {n_injured}'
+        for count, n_killed, n_injured in zip(bins['count'], bins['n_killed'], bins['n_injured'])
+    ]
+
+
+    trace1 = go.Scattergeo(
+        lon = np.round(bins_longitude, 4).tolist(),
+        lat = np.round(bins_latitude, 4).tolist(),
+        mode = 'markers',
+        text = hover_text,
+        hoverinfo = 'text',
+        marker = {
+            'symbol': 'hexagon',
+            'size': round(hex_marker_size * scale / 2 ** level, 2),
+            'color': np.round(np.log10(bins['count'].to_numpy()), 3).tolist(),
+            'colorscale': 'YlOrRd',
+            'colorbar': {'title': 'Log10 Counts'},
+            'line': {'width': 0}
+        }
+    )
+
+    density_map = dcc.Graph(
+        style = {'height': '55vh'},
+        figure = {
+            'data': [trace1],
+            'layout': go.Layout(
+                title = 'Incident Density',
+                geo_scope = 'usa',
+                uirevision = 'density_map'
+            )
+        }
+    )
+
+    return density_map
+
+
 # Barchart for top dangerous states -----------------------------------#
-def top_states_generator(data):
+def top_states_generator(data, selection = None):
     """
     Generate top states graph
 
     Parameters:
     -----------
-    data: dataframe
+    data: dataframe (aggregate cube or incidents), query index or incident aggregates
+    selection: np array of bool (optional)
 
     Returns:
     top_states: dcc.Graph
     """
     
-    data['n_injured+killed'] = data['n_killed'] + data['n_injured']
-    top_10_states = data['state'].value_counts()[:10].index.tolist()
-    dangerous_states = data[data['state'].isin(top_10_states)]
+    dangerous_states = cube_query(data, ['state'], selection).nlargest(10, 'count')
+    dangerous_states['n_injured+killed'] = dangerous_states['n_killed'] + dangerous_states['n_injured']
 
-    states_counts = dangerous_states.groupby('state')['n_injured+killed'].sum()
+    states_counts = dangerous_states['n_injured+killed']
     states_counts = states_counts.sort_values(ascending = False)
-    states_n_injured = dangerous_states.groupby('state')['n_injured'].sum().sort_values(ascending = False)
-    states_n_killed = dangerous_states.groupby('state')['n_killed'].sum().sort_values(ascending = False)
+    states_n_injured = dangerous_states['n_injured'].sort_values(ascending = False)
+    states_n_killed = dangerous_states['n_killed'].sort_values(ascending = False)
 
 
     trace1 = go.Bar(
@@ -133,26 +489,26 @@ def top_states_generator(data):
 
 
 # Barchart for top dangerous cities/counties --------------------------#
-def top_cities_generator(data):
+def top_cities_generator(data, selection = None):
     """
     Generate top cities graph
 
     Parameters:
     -----------
-    data: dataframe
+    data: dataframe (aggregate cube or incidents), query index or incident aggregates
+    selection: np array of bool (optional)
 
     Returns:
     top_cities: dcc.Graph
     """
     
-    data['n_injured+killed'] = data['n_killed'] + data['n_injured']
-    top_10_cities = data['city_or_county'].value_counts()[:10].index.tolist()
-    dangerous_cities = data[data['city_or_county'].isin(top_10_cities)]
+    dangerous_cities = cube_query(data, ['city_or_county'], selection).nlargest(10, 'count')
+    dangerous_cities['n_injured+killed'] = dangerous_cities['n_killed'] + dangerous_cities['n_injured']
 
-    cities_counts = dangerous_cities.groupby('city_or_county')['n_injured+killed'].sum()
+    cities_counts = dangerous_cities['n_injured+killed']
     cities_counts = cities_counts.sort_values(ascending = False)
-    cities_n_injured = dangerous_cities.groupby('city_or_county')['n_injured'].sum().sort_values(ascending = False)
-    cities_n_killed = dangerous_cities.groupby('city_or_county')['n_killed'].sum().sort_values(ascending = False)
+    cities_n_injured = dangerous_cities['n_injured'].sort_values(ascending = False)
+    cities_n_killed = dangerous_cities['n_killed'].sort_values(ascending = False)
 
 
     trace1 = go.Bar(
@@ -189,21 +545,23 @@ def top_cities_generator(data):
 
 
 # Barchart for average incidents per weekday --------------------------#
-def incidents_per_day_generator(data):
+def incidents_per_day_generator(data, selection = None):
     """
     Generate incidents per day graph
 
     Parameters:
     -----------
-    data: dataframe
+    data: dataframe (aggregate cube or incidents), query index or incident aggregates
+    selection: np array of bool (optional)
 
     Returns:
     incidents_per_day: dcc.Graph
     """
     
     weekdays = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-    day_counts = data['weekday'].value_counts()[weekdays].tolist()
-    averages = [element/4 for element in day_counts]
+    day_counts = cube_query(data, ['weekday'], selection)['count'].reindex(weekdays, fill_value = 0).tolist()
+    n_years = max(len(cube_query(data, ['year'], selection)), 1)
+    averages = [element/n_years for element in day_counts]
 
 
     trace1 = go.Bar(
@@ -236,26 +594,24 @@ def incidents_per_day_generator(data):
 
 
 # Barchart for incidents per month ------------------------------------#
-def incidents_per_month_generator(data):
+def incidents_per_month_generator(data, selection = None):
     """
     Generate incidents per month graph
 
     Parameters:
     -----------
-    data: dataframe
+    data: dataframe (aggregate cube or incidents), query index or incident aggregates
+    selection: np array of bool (optional)
 
     Returns:
     incidents_per_month: dcc.Graph
     """
 
-    month_counts_total = Counter(data['month'])
-    month_counts_2014 = Counter(data[data['year'] == 2014]['month'])
-    month_counts_2015 = Counter(data[data['year'] == 2014]['month'])
-    month_counts_2016 = Counter(data[data['year'] == 2016]['month'])
-    month_counts_2017 = Counter(data[data['year'] == 2017]['month'])
+    month_counts = cube_query(data, ['month', 'year'], selection)['count'].unstack(fill_value = 0)
+    month_counts = month_counts.reindex(index = month_categories, columns = [2014, 2015, 2016, 2017], fill_value = 0)
 
-    months = list(month_counts_total)
-    counts = list(month_counts_total.values())
+    months = month_categories
+    counts = month_counts.sum(axis = 1).tolist()
 
     incident_counts_by_month = pd.DataFrame(
         {
@@ -274,7 +630,7 @@ def incidents_per_month_generator(data):
 
     trace2 = go.Bar(
         orientation='h',
-        x = list(month_counts_2014.values()),
+        x = month_counts[2014].tolist(),
         y = months,
         name = 2014,
         visible = 'legendonly'
@@ -282,7 +638,7 @@ def incidents_per_month_generator(data):
 
     trace3 = go.Bar(
         orientation='h',
-        x = list(month_counts_2015.values()),
+        x = month_counts[2015].tolist(),
         y = months,
         name = 2015,
         visible = 'legendonly'
@@ -290,7 +646,7 @@ def incidents_per_month_generator(data):
 
     trace4 = go.Bar(
         orientation='h',
-        x = list(month_counts_2016.values()),
+        x = month_counts[2016].tolist(),
         y = months,
         name = 2016,
         visible = 'legendonly'
@@ -298,7 +654,7 @@ def incidents_per_month_generator(data):
 
     trace5 = go.Bar(
         orientation='h',
-        x = list(month_counts_2017.values()),
+        x = month_counts[2017].tolist(),
         y = months,
         name = 2017,
         visible = 'legendonly'
@@ -319,26 +675,26 @@ def incidents_per_month_generator(data):
 
 
 # Barchart for incidents per year -------------------------------------#
-def incidents_per_year_generator(data):
+def incidents_per_year_generator(data, selection = None):
     """
     Generate incidents per year graph
 
     Parameters:
     -----------
-    data: dataframe
+    data: dataframe (aggregate cube or incidents), query index or incident aggregates
+    selection: np array of bool (optional)
 
     Returns:
     incidents_per_year: dcc.Graph
     """
 
-    data['n_injured+killed'] = data['n_injured'] + data['n_killed']
-    casualties_by_year = data[['year', 'n_killed', 'n_injured']].groupby('year').sum()
-    data = data.groupby('year')['n_injured+killed'].sum().reset_index()
+    casualties_by_year = cube_query(data, ['year'], selection)
+    casualties_by_year['n_injured+killed'] = casualties_by_year['n_injured'] + casualties_by_year['n_killed']
 
     trace1 = go.Bar(
         orientation='h',
-        x = data['n_injured+killed'],
-        y = data['year'],
+        x = casualties_by_year['n_injured+killed'],
+        y = casualties_by_year.index.tolist(),
         name = 'Total',
     )
 
@@ -370,87 +726,109 @@ def incidents_per_year_generator(data):
     return incidents_per_year
 
 
-# Line plot for age distributions -------------------------------------#
-def age_distribution_generator(data):
+# Line plot for incidents per day over time ---------------------------#
+def incidents_time_series_generator(data, selection = None, x_range = None):
     """
-    Generate age distribution graph
+    Generate incidents per day over time graph
+    The daily counts and their weekly average cover the full date range, or the zoomed range,
+    and are downsampled with LTTB to at most time_series_points points per line
 
     Parameters:
     -----------
-    data: dataframe
+    data: query index
+    selection: np array of bool or of row positions (optional)
+    x_range: tuple of 2 dates ('YYYY-MM-DD', optional, the zoomed range)
 
     Returns:
-    age_distribution: dcc.Graph
+    incidents_time_series: dcc.Graph
     """
-    
-    ages = data['participant_age'].tolist()
-    types = data['participant_type'].tolist()
-    age_list = []
 
-    for idx, _ in enumerate(ages):
-        if isinstance(ages[idx], list):
-            for idx2, _ in enumerate(ages[idx]):
-                age_list.append(ages[idx][idx2])
+    first_day, day_counts = daily_counts(data, selection)
+    days = np.arange(first_day, first_day + len(day_counts))
+    weekly_averages = pd.Series(day_counts).rolling(time_series_window, min_periods = 1).mean().to_numpy()
+
+    shown = slice(None)
+
+    if x_range is not None:
+        start, stop = np.searchsorted(days, np.array(x_range, dtype = 'datetime64[D]').astype('int64'), side = 'left')
+        shown = slice(max(start - 1, 0), stop + 1)
 
-    age_list = list(map(int, age_list))
-    unique_ages = list(sorted(set(age_list)))
-    ages_count = [0] * len(unique_ages)
+    days, day_counts, weekly_averages = days[shown], day_counts[shown], weekly_averages[shown]
+    daily_points = lttb(days, day_counts, time_series_points)
+    weekly_points = lttb(days, weekly_averages, time_series_points)
+    dates = days.astype('datetime64[D]').astype(str)
 
-    for idx, _ in enumerate(age_list):
-        for idx2, _ in enumerate(unique_ages):
-            if unique_ages[idx2] == age_list[idx]:
-                ages_count[idx2] += 1
 
+    trace1 = go.Scatter(
+        x = dates[daily_points].tolist(),
+        y = day_counts[daily_points].tolist(),
+        mode = 'lines',
+        name = 'Daily'
+    )
+
+    trace2 = go.Scatter(
+        x = dates[weekly_points].tolist(),
+        y = np.round(weekly_averages[weekly_points], 2).tolist(),
+        mode = 'lines',
+        name = f'{time_series_window} Day Avg'
+    )
+
+    incidents_time_series = dcc.Graph(
+        figure = {
+            'data': [trace1, trace2],
+            'layout': go.Layout(
+                title = 'Incidents Per Day Over Time',
+                xaxis = {'title': 'Date', 'range': list(x_range) if x_range is not None else None},
+                yaxis = {'title': 'Counts'},
+                uirevision = 'incidents_time_series'
+            )
+        }
+    )
 
-    victim_age_list = []
-    suspect_age_list = []
+    return incidents_time_series
 
-    for idx, _ in enumerate(ages):
-        if ages[idx] is not np.nan:
-            for idx2, _ in enumerate(ages[idx]):
-                if 'Victim' in types[idx][idx2] and ages[idx][idx2] is not np.nan:
-                    victim_age_list.append(ages[idx][idx2])
 
-                elif 'Suspect' in types[idx][idx2] and ages[idx][idx2] is not np.nan:
-                    suspect_age_list.append(ages[idx][idx2])
+# Line plot for age distributions -------------------------------------#
+def age_distribution_generator(data, selection = None):
+    """
+    Generate age distribution graph
 
-    victim_age_list = list(map(int, victim_age_list))
-    victim_unique_ages = list(sorted(set(victim_age_list)))
-    victim_ages_count = [0] * len(victim_unique_ages)
+    Parameters:
+    -----------
+    data: query index
+    selection: np array of bool (optional)
 
-    suspect_age_list = list(map(int, suspect_age_list))
-    suspect_unique_ages = list(sorted(set(suspect_age_list)))
-    suspect_ages_count = [0] * len(suspect_unique_ages)
+    Returns:
+    age_distribution: dcc.Graph
+    """
 
+    age_histogram = participant_histogram(data, 'age', selection)
+    all_ages_count = age_histogram.sum(axis = 0)
+    victim_ages_count = age_histogram[participant_roles.index('Victim')]
+    suspect_ages_count = age_histogram[participant_roles.index('Suspect')]
 
-    for idx, _ in enumerate(victim_age_list):
-        for idx2, _ in enumerate(victim_unique_ages):
-            if victim_unique_ages[idx2] == victim_age_list[idx]:
-                victim_ages_count[idx2] += 1
+    unique_ages, ages_count = np.flatnonzero(all_ages_count), all_ages_count[all_ages_count > 0]
+    victim_unique_ages, victim_ages_count = np.flatnonzero(victim_ages_count), victim_ages_count[victim_ages_count > 0]
+    suspect_unique_ages, suspect_ages_count = np.flatnonzero(suspect_ages_count), suspect_ages_count[suspect_ages_count > 0]
 
-    for idx, _ in enumerate(suspect_age_list):
-        for idx2, _ in enumerate(suspect_unique_ages):
-            if suspect_unique_ages[idx2] == suspect_age_list[idx]:
-                suspect_ages_count[idx2] += 1
-                
 
     trace1 = go.Scatter(
-        x = unique_ages,
-        y = ages_count,
+        x = unique_ages.tolist(),
+        y = ages_count.tolist(),
         mode = 'lines',
         name = 'All Participants'
     )
 
     trace2 = go.Scatter(
-        x = victim_unique_ages,
-        y = victim_ages_count,
+        x = victim_unique_ages.tolist(),
+        y = victim_ages_count.tolist(),
         mode = 'lines',
         name = 'Victims'
     )
 
     trace3 = go.Scatter(
-        x = suspect_unique_ages,
-        y = suspect_ages_count,
+        x = suspect_unique_ages.tolist(),
+        y = suspect_ages_count.tolist(),
         mode = 'lines',
         name = 'Suspects'
     )
@@ -471,44 +849,22 @@ def age_distribution_generator(data):
 
 
 # Pie chart for gun type distribution ---------------------------------#
-def gun_type_distribution_generator(data):
+def gun_type_distribution_generator(data, selection = None):
     """
     Generate gun type distribution graph
 
     Parameters:
     -----------
-    data: dataframe
+    data: query index
+    selection: np array of bool (optional)
 
     Returns:
     gun_type_distribution: dcc.Graph
     """
-    
-    gun_list = []
-    gun_types = data['gun_type'].tolist()
-
-    for idx, _ in enumerate(gun_types):
-        if gun_types[idx] is not np.nan:
-            for idx2, _ in enumerate(gun_types[idx]):
-                if gun_types[idx][idx2] is not np.nan:
-                    gun_list.append(gun_types[idx][idx2])
-                    
-    unique_guns = list(set(gun_list))
-    gun_counts = [0] * len(unique_guns)
-
-    for idx, _ in enumerate(gun_list):
-        for idx2, _ in enumerate(unique_guns):
-            if unique_guns[idx2] == gun_list[idx]:
-                gun_counts[idx2] += 1
-
-    temp_gun_type = pd.DataFrame(
-        {
-            'gun_list': gun_list
-        }
-    )
 
-    temp_gun_type['gun_list'] = temp_gun_type['gun_list'].map(gun_map)
-    gun_type_cleaned_labels = temp_gun_type['gun_list'].value_counts().index.tolist()
-    gun_type_cleaned_counts = temp_gun_type['gun_list'].value_counts()
+    gun_type_cleaned_counts = gun_type_counts(data, selection)
+    gun_type_cleaned_labels = gun_type_cleaned_counts.index.tolist()
+    gun_type_cleaned_counts = gun_type_cleaned_counts.tolist()
 
 
     trace1 = go.Pie(
@@ -531,35 +887,21 @@ def gun_type_distribution_generator(data):
 
 
 # Pie chart for gun counts distribution -------------------------------#
-def gun_count_distribution_generator(data):
+def gun_count_distribution_generator(data, selection = None):
     """
     Generate gun count distribution graph
 
     Parameters:
     -----------
-    data: dataframe
+    data: query index
+    selection: np array of bool (optional)
 
     Returns:
     gun_count_distribution: dcc.Graph
     """
 
-    data_n_guns_drop = data[['n_guns_involved']].dropna().reset_index(drop = True)
-    data_n_guns_drop = data_n_guns_drop['n_guns_involved'].tolist()
-    data_n_guns_drop = list(map(float, data_n_guns_drop))
-
-    for idx, _ in enumerate(data_n_guns_drop):
-        if data_n_guns_drop[idx] >= 5:
-            data_n_guns_drop[idx] = '5+'
-
-
-    n_guns = pd.DataFrame(
-        {
-            'n_guns_involved': data_n_guns_drop
-        }
-    )
-
-    n_guns_labels = [1.0, 2.0, 3.0, 4.0, '5+']
-    n_guns_counts = n_guns.value_counts()[n_guns_labels].tolist()
+    n_guns_labels = gun_count_labels
+    n_guns_counts = gun_count_bins(data, selection)
 
 
     trace1 = go.Pie(
@@ -584,33 +926,24 @@ def gun_count_distribution_generator(data):
 
 
 # Pie chart of gender distribution for suspects -----------------------#
-def suspect_gender_distribution_generator(data):
+def suspect_gender_distribution_generator(data, selection = None):
     """
     Generate suspect gender distribution graph
 
     Parameters:
     -----------
-    data: dataframe
+    data: query index
+    selection: np array of bool (optional)
 
     Returns:
     suspect_gender_distribution: dcc.Graph
     """
 
-    genders = data['participant_gender'].tolist()
-    types = data['participant_type'].tolist()
-    suspect_gender_list = []
+    gender_histogram = participant_histogram(data, 'gender', selection)[participant_roles.index('Suspect')]
+    suspect_gender_list = dict(zip(data['participants']['gender_categories'], gender_histogram.tolist()))
 
-    for idx, _ in enumerate(genders):
-        if isinstance(genders[idx], list):
-            for idx2, _ in enumerate(genders[idx]):
-                try:
-                    if 'Suspect' in types[idx][idx2]:
-                        suspect_gender_list.append(genders[idx][idx2])
-                except:
-                    pass
-                    
     gender_labels = ['Male', 'Female']
-    suspect_gender_counts = [suspect_gender_list.count('Male'), suspect_gender_list.count('Female')]
+    suspect_gender_counts = [suspect_gender_list.get('Male', 0), suspect_gender_list.get('Female', 0)]
 
 
     trace1 = go.Pie(
@@ -633,33 +966,24 @@ def suspect_gender_distribution_generator(data):
 
 
 # Pie chart of gender distribution for victims ------------------------#
-def victim_gender_distribution_generator(data):
+def victim_gender_distribution_generator(data, selection = None):
     """
     Generate victim gender distribution graph
 
     Parameters:
     -----------
-    data: dataframe
+    data: query index
+    selection: np array of bool (optional)
 
     Returns:
     victim_gender_distribution: dcc.Graph
     """
 
-    genders = data['participant_gender'].tolist()
-    types = data['participant_type'].tolist()
-    victim_gender_list = []
+    gender_histogram = participant_histogram(data, 'gender', selection)[participant_roles.index('Victim')]
+    victim_gender_list = dict(zip(data['participants']['gender_categories'], gender_histogram.tolist()))
 
-    for idx, _ in enumerate(genders):
-        if isinstance(genders[idx], list):
-            for idx2, _ in enumerate(genders[idx]):
-                try:
-                    if 'Victim' in types[idx][idx2]:
-                        victim_gender_list.append(genders[idx][idx2])
-                except:
-                    pass
-                
     gender_labels = ['Male', 'Female']
-    victim_gender_counts = [victim_gender_list.count('Male'), victim_gender_list.count('Female')]
+    victim_gender_counts = [victim_gender_list.get('Male', 0), victim_gender_list.get('Female', 0)]
 
 
     trace1 = go.Pie(
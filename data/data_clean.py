@@ -1,27 +1,203 @@
-from data_cleaning_functions import original_data_reader, data_feature_engineering, final_column_cleaning, data_save
+import os
+import argparse
+import pyarrow as pa
+import pyarrow.parquet as pq
+from data_cleaning_functions import original_data_paths, cleaned_output_paths, output_formats, original_data_reader, original_data_chunk_reader, parallel_data_clean, data_feature_engineering, final_column_cleaning, data_save, data_writers_open, data_chunk_save, data_writers_close, arrow_to_data, participant_table_builder, participant_table_save, aggregate_cube_builder, aggregate_cube_save, hex_bins_builder, hex_bins_save, files_hash, cleaning_code_version, manifest_signature, manifest_reader, manifest_save, stale_shards, shard_artifact_path, shard_artifacts_build
 
-def data_clean():
+def data_clean(chunksize = None, workers = None, incremental = False):
     """
     Clean original data and save the results for later use
+    When a chunksize is given the original data is streamed through the cleaning steps
+    chunk by chunk, so peak memory is bounded by the chunk size instead of the full data
+    When workers is given each shard of the original data is cleaned in its own process,
+    with a chunksize as well each shard is streamed chunk by chunk in its own process
+    When incremental is set only the shards that changed since the last run are cleaned,
+    chunk by chunk when a chunksize is given
+
+    Parameters:
+    -----------
+    chunksize: int (optional)
+    workers: int (optional)
+    incremental: bool
     """
 
-    # Preliminary Data Cleaning
-    data = original_data_reader()
+    if incremental:
+        return data_clean_incremental(workers, chunksize)
+
+    if chunksize is not None and workers is not None:
+        data_clean_parallel_streaming(chunksize, workers)
+        return manifest_record(artifacts_built = True)
+
+    if chunksize is not None:
+        data_clean_streaming(chunksize)
+        return manifest_record()
+
+    if workers is not None:
+        # Read, feature engineer and clean every shard in parallel
+        data = parallel_data_clean(workers = workers)
+
+    else:
+        # Preliminary Data Cleaning
+        data = original_data_reader()
 
 
-    # Create features in data for future use
-    data = data_feature_engineering(data)
+        # Create features in data for future use
+        data = data_feature_engineering(data)
 
 
-    # Clean specific data columns
-    data = final_column_cleaning(data)
+        # Clean specific data columns
+        data = final_column_cleaning(data)
 
 
     # Save cleaned data files
     data_save(data)
 
+
+    # Save participant level table
+    participants = participant_table_builder(data)
+    participant_table_save(participants)
+
+
+    # Save pre-aggregated cube
+    cube = aggregate_cube_builder(data)
+    aggregate_cube_save(cube)
+
+
+    # Save hexagon bin pyramid of the density map
+    bins = hex_bins_builder(data)
+    hex_bins_save(bins)
+
+
+    # Record the signature of the inputs the outputs were built from
+    manifest_record()
+
+    return None
+
+
+def data_clean_streaming(chunksize):
+    """
+    Clean original data chunk by chunk and append each cleaned chunk to every saved output
+
+    Parameters:
+    -----------
+    chunksize: int
+    """
+
+    writers = data_writers_open(output_formats)
+
+    for data in original_data_chunk_reader(chunksize = chunksize):
+        data = data_feature_engineering(data)
+        data = final_column_cleaning(data)
+
+        data_chunk_save(data, writers)
+
+    data_writers_close(writers)
+
+    return None
+
+
+def data_clean_parallel_streaming(chunksize, workers):
+    """
+    Clean every shard of the original data chunk by chunk in its own process, then append
+    the cleaned shards to every saved output batch by batch, in shard order
+
+    Parameters:
+    -----------
+    chunksize: int
+    workers: int
+    """
+
+    shard_artifacts_build(original_data_paths, workers, chunksize)
+    shard_artifacts_save(chunksize)
+
+    return None
+
+
+def shard_artifacts_save(batch_size = 50000):
+    """
+    Append the cleaned shard artifacts to every saved output batch by batch, in shard order,
+    so memory is bounded by the batch size instead of the shards
+
+    Parameters:
+    -----------
+    batch_size: int
+    """
+
+    writers = data_writers_open(output_formats)
+
+    for path in original_data_paths:
+        for batch in pq.ParquetFile(shard_artifact_path(path)).iter_batches(batch_size = batch_size):
+            data_chunk_save(arrow_to_data(pa.Table.from_batches([batch])), writers)
+
+    data_writers_close(writers)
+
+    return None
+
+
+def data_clean_incremental(workers = None, chunksize = None):
+    """
+    Clean only the shards whose contents or cleaning code changed since the last run,
+    as recorded in data/cleaned_data/manifest.json, then rebuild the final outputs
+    from the cached per-shard artifacts
+    With a chunksize the stale shards are cleaned and the artifacts appended chunk by chunk
+
+    Parameters:
+    -----------
+    workers: int (optional)
+    chunksize: int (optional)
+    """
+
+    manifest = manifest_reader()
+    shard_hashes, stale = stale_shards(manifest)
+
+    shard_artifacts_build(stale, workers, chunksize)
+
+    outputs_missing = not all(os.path.exists(path) for path in cleaned_output_paths)
+
+    if stale or outputs_missing:
+        shard_artifacts_save(chunksize or 50000)
+
+    manifest_record(shard_hashes, artifacts_built = True)
+
+    return None
+
+
+def manifest_record(shard_hashes = None, artifacts_built = False):
+    """
+    Record in data/cleaned_data/manifest.json the signature of the original data and cleaning
+    code the outputs were just built from. The dashboard checks the files it derives from the
+    cleaned data against it, so it never has to read the cleaned data to find them stale
+    The shard hashes used by data_clean_incremental are only recorded when every shard
+    artifact was just built from them
+
+    Parameters:
+    -----------
+    shard_hashes: dict of path -> hash (optional, hashed here when not given)
+    artifacts_built: bool
+    """
+
+    manifest = manifest_reader()
+    code_version = cleaning_code_version()
+
+    if shard_hashes is None:
+        shard_hashes = {path: files_hash([path]) for path in original_data_paths}
+
+    if artifacts_built:
+        manifest['code_version'] = code_version
+        manifest['shards'] = shard_hashes
+        manifest['artifacts'] = {path: shard_artifact_path(path) for path in original_data_paths}
+
+    manifest['signature'] = manifest_signature(code_version, shard_hashes)
+    manifest_save(manifest)
+
     return None
 
 
 if __name__ == "__main__":
-    data_clean()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description = 'Clean the original data')
+    parser.add_argument('--chunksize', type = int, default = None, help = 'stream the original data in chunks of this many rows')
+    parser.add_argument('--workers', type = int, default = None, help = 'clean the original data shards in this many processes (each streamed when --chunksize is given)')
+    parser.add_argument('--incremental', action = 'store_true', help = 'only clean the shards that changed since the last run (each streamed when --chunksize is given)')
+    args = parser.parse_args()
+
+    data_clean(chunksize = args.chunksize, workers = args.workers, incremental = args.incremental)
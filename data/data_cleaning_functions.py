@@ -1,6 +1,16 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import os
+import json
+import shutil
+import hashlib
+import zipfile
 import calendar
+import functools
+from concurrent.futures import ProcessPoolExecutor
 
 columns_to_drop = [
     'incident_id',
@@ -15,8 +25,6 @@ columns_to_drop = [
     'state_senate_district', 
     'notes', 
     'gun_stolen',
-    'latitude',
-    'longitude',
     'incident_characteristics',
     'location_description',
     'participant_relationship',
@@ -31,6 +39,8 @@ column_dtypes = {
     'n_killed': 'int16',
     'n_injured': 'int16',
     'gun_type': object,
+    'latitude': 'float32',
+    'longitude': 'float32',
     'n_guns_involved': object,
     'participant_age': object,
     'participant_gender': object,
@@ -43,6 +53,86 @@ column_dtypes = {
 }
 
 
+original_data_paths = [
+    'data/original_data/original_data_1.csv',
+    'data/original_data/original_data_2.csv',
+    'data/original_data/original_data_3.csv',
+    'data/original_data/original_data_4.csv'
+]
+
+
+cleaned_output_paths = [
+    'data/cleaned_data/cleaned_data.parquet',
+    'data/cleaned_data/cleaned_data_1.csv',
+    'data/cleaned_data/cleaned_data_2.csv',
+    'data/cleaned_data/participants.npz',
+    'data/cleaned_data/cube.parquet',
+    'data/cleaned_data/hex_bins.parquet'
+]
+
+
+cleaned_data_schema = pa.schema([
+    ('date', pa.string()),
+    ('state', pa.string()),
+    ('city_or_county', pa.string()),
+    ('n_killed', pa.int16()),
+    ('n_injured', pa.int16()),
+    ('gun_type', pa.list_(pa.string())),
+    ('latitude', pa.float32()),
+    ('longitude', pa.float32()),
+    ('n_guns_involved', pa.string()),
+    ('participant_age', pa.list_(pa.int16())),
+    ('participant_gender', pa.list_(pa.string())),
+    ('participant_status', pa.list_(pa.string())),
+    ('participant_type', pa.list_(pa.string())),
+    ('state_code', pa.string()),
+    ('weekday', pa.string()),
+    ('month', pa.string()),
+    ('year', pa.int16())
+])
+
+
+cube_dimensions = [
+    'state',
+    'state_code',
+    'city_or_county',
+    'year',
+    'month',
+    'weekday'
+]
+
+
+cube_measures = [
+    'count',
+    'n_killed',
+    'n_injured'
+]
+
+
+# Hexagonal bins of the density map: level 0 hexagons have a radius of hex_radius degrees
+# (longitudes scaled to hex_latitude), each further level halves it
+hex_levels = 8
+hex_radius = 0.5
+hex_latitude = 38
+
+
+list_column_types = {
+    'gun_type': pa.string(),
+    'participant_age': pa.int16(),
+    'participant_gender': pa.string(),
+    'participant_status': pa.string(),
+    'participant_type': pa.string()
+}
+
+
+participant_columns = [
+    'participant_age',
+    'participant_gender',
+    'participant_status',
+    'participant_type'
+]
+
+
 us_state_abbrev = {
     'Alabama': 'AL',
     'Alaska': 'AK',
@@ -144,6 +234,85 @@ weekday_map = {
 }
 
 
+state_categories = list(us_state_abbrev)
+state_code_categories = list(us_state_abbrev.values())
+weekday_categories = list(weekday_map.values())
+month_categories = list(calendar.month_abbr)[1:]
+
+
+participant_categories = {
+    'participant_gender': ['Male', 'Female'],
+    'participant_status': ['Unharmed', 'Injured', 'Killed', 'Arrested', 'Unharmed, Arrested', 'Injured, Arrested', 'Killed, Arrested'],
+    'participant_type': ['Victim', 'Subject-Suspect']
+}
+
+
+gun_categories = list(dict.fromkeys(gun_map.values()))
+
+
+participant_array_dtypes = {
+    'offsets': 'int64',
+    'age': 'int16',
+    'gender': 'int8',
+    'status': 'int8',
+    'type': 'int8',
+    'gun_offsets': 'int64',
+    'gun_category': 'int8'
+}
+
+
+# Every output of a cleaning run, see data_writers_open()
+output_formats = ('parquet', 'csv', 'participants', 'cube', 'hex_bins')
+
+
+# Chunk aggregates (cube, hexagon bins) held before they are merged into the running aggregate
+aggregate_merge_chunks = 16
+
+
+# Shards smaller than this are cleaned in the calling process: starting a worker and shipping
+# the cleaned frame back costs more than cleaning a few megabytes
+parallel_min_shard_bytes = 4 << 20
+
+
+compact_column_dtypes = {
+    'state': pd.CategoricalDtype(state_categories),
+    'city_or_county': 'category',
+    'n_killed': 'int16',
+    'n_injured': 'int16',
+    'n_guns_involved': 'Int16',
+    'state_code': pd.CategoricalDtype(state_code_categories),
+    'weekday': pd.CategoricalDtype(weekday_categories),
+    'month': pd.CategoricalDtype(month_categories),
+    'year': 'int16'
+}
+
+
+def original_data_chunk_reader(paths = original_data_paths, chunksize = 50000):
+    """
+    Stream the original data in chunks
+    Only reads the columns that are kept (not in columns_to_drop)
+    Filters years between 2014-2017 per chunk
+
+    Parameters:
+    -----------
+    paths: list of str
+    chunksize: int
+
+    Returns
+    -----------
+    chunks: generator of dataframes
+    """
+
+    for path in paths:
+        reader = pd.read_csv(path, dtype = column_dtypes, usecols = lambda column: column not in columns_to_drop, chunksize = chunksize)
+
+        for chunk in reader:
+            chunk = chunk[(chunk['date'] >= '2014-01-01') & (chunk['date'] < '2018-01-01')]
+            chunk = chunk.reset_index(drop = True)
+
+            yield chunk
+
+
 def original_data_reader():
     """
     Read and combine all portions of the original data
@@ -151,16 +320,7 @@ def original_data_reader():
     Fill NA values with 'Unknown'
     """
 
-    original_data_1 = pd.read_csv('data/original_data/original_data_1.csv', dtype = column_dtypes)
-    original_data_2 = pd.read_csv('data/original_data/original_data_2.csv', dtype = column_dtypes)
-    original_data_3 = pd.read_csv('data/original_data/original_data_3.csv', dtype = column_dtypes)
-    original_data_4 = pd.read_csv('data/original_data/original_data_4.csv', dtype = column_dtypes)
-
-    data = pd.concat([original_data_1, original_data_2, original_data_3, original_data_4], ignore_index = True)
-
-    data = data.drop(columns_to_drop, 1)
-    data = data[(data['date'] >= '2014-01-01') & (data['date'] < '2018-01-01')]
-    data = data.reset_index(drop = True)
+    data = pd.concat(original_data_chunk_reader(), ignore_index = True)
 
     return data
 
@@ -173,14 +333,16 @@ def data_feature_engineering(data):
 
     data['state_code'] = data['state'].map(us_state_abbrev)
 
-    data['weekday'] = pd.to_datetime(data['date']).dt.weekday
+    dates = pd.to_datetime(data['date'])
+
+    data['weekday'] = dates.dt.weekday
     data['weekday'] = data['weekday'].map(weekday_map)
 
     month_dict = dict(enumerate(calendar.month_abbr))
-    data['month'] = pd.to_datetime(data['date']).dt.month
+    data['month'] = dates.dt.month
     data['month'] = data['month'].map(month_dict)
 
-    data['year'] = pd.to_datetime(data['date']).dt.year
+    data['year'] = dates.dt.year
 
 
     return data
@@ -241,9 +403,37 @@ def column_cleaner(column):
     return cleaned_column
 
 
+def vectorized_column_cleaner(column):
+    """
+    Vectorized equivalent of column_cleaner() built on arrow compute kernels
+    Replaces '||' and '::' like row_cleaner, then one regex pass removes everything up to
+    the last ':' of each entry before splitting the entries into lists
+    Rows are handed back as python lists of str and missing rows as np.nan, exactly like
+    column_cleaner()
+
+    Parameters:
+    -----------
+    column: df series
+
+    Returns:
+    cleaned_column: df series
+    """
+
+    cleaned_array = pa.array(column, type = pa.string(), from_pandas = True)
+    cleaned_array = pc.replace_substring(cleaned_array, '||', '|')
+    cleaned_array = pc.replace_substring(cleaned_array, '::', ':')
+    cleaned_array = pc.replace_substring_regex(cleaned_array, '[^|]*:', '')
+    cleaned_array = pc.split_pattern(cleaned_array, '|')
+
+    cleaned_column = pd.Series(cleaned_array.to_pylist(), index = column.index, dtype = object)
+    cleaned_column[cleaned_array.is_null().to_numpy(zero_copy_only = False)] = np.nan
+
+    return cleaned_column
+
+
 def final_column_cleaning(data):
     """
-    Apply df_cleaner() function to certain columns in the dataframe
+    Apply vectorized_column_cleaner() function to certain columns in the dataframe
     Returns a cleaned dataframe
 
     Parameters:
@@ -256,57 +446,1293 @@ def final_column_cleaning(data):
 
     """
 
-    data['participant_age'] = column_cleaner(data['participant_age'])
-    data['participant_status'] = column_cleaner(data['participant_status'])
-    data['participant_type'] = column_cleaner(data['participant_type'])
-    data['gun_type'] = column_cleaner(data['gun_type'])
-    data['participant_gender'] = column_cleaner(data['participant_gender'])
+    data['participant_age'] = vectorized_column_cleaner(data['participant_age'])
+    data['participant_status'] = vectorized_column_cleaner(data['participant_status'])
+    data['participant_type'] = vectorized_column_cleaner(data['participant_type'])
+    data['gun_type'] = vectorized_column_cleaner(data['gun_type'])
+    data['participant_gender'] = vectorized_column_cleaner(data['participant_gender'])
     
     return data
 
-def data_save(data):
+def list_column_arrow(column):
+    """
+    View a list column as a single arrow list array
+    Arrow columns are used as they are; a column of lists or arrays is converted by arrow in
+    one pass, missing rows (np.nan) become null lists
+
+    Parameters:
+    -----------
+    column: df series, pa.Array or pa.ChunkedArray
+
+    Returns
+    -----------
+    list_array: pa.ListArray
+    """
+
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+
+    list_array = column if isinstance(column, pa.Array) else pa.array(column, from_pandas = True)
+
+    if pa.types.is_null(list_array.type):
+        list_array = pa.nulls(len(list_array), type = pa.list_(pa.string()))
+
+    return list_array
+
+
+def list_column_flatten(column):
+    """
+    Flatten a list column into a single series of values
+    Missing rows contribute no values
+
+    Parameters:
+    -----------
+    column: df series, pa.Array or pa.ChunkedArray
+
+    Returns
+    -----------
+    values: df series
+    lengths: np array of list lengths per row
+    """
+
+    list_array = list_column_arrow(column)
+
+    lengths = pc.fill_null(pc.list_value_length(list_array), 0).to_numpy().astype('int32')
+    values = pc.list_flatten(list_array).to_pandas()
+
+    return values, lengths
+
+
+def list_column_to_arrow(column, value_type):
+    """
+    Convert a list column into a typed arrow list array
+    Missing rows become null lists instead of strings
+
+    Parameters:
+    -----------
+    column: df series, pa.Array or pa.ChunkedArray
+    value_type: pyarrow DataType
+
+    Returns
+    -----------
+    list_array: pa.ListArray
+    """
+
+    missing = list_column_arrow(column).is_null().to_numpy(zero_copy_only = False)
+    values, lengths = list_column_flatten(column)
+
+    if pa.types.is_integer(value_type):
+        values = pd.to_numeric(values, errors = 'coerce')
+
+    values = pa.array(values, type = value_type, from_pandas = True)
+
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    offsets = pa.array(offsets, type = pa.int32(), mask = np.append(missing, False))
+
+    list_array = pa.ListArray.from_arrays(offsets, values)
+
+    return list_array
+
+
+def list_column_format(column):
+    """
+    Format a list column the way the csv files store it, one string per row
+    ['a', 'b'] -> "['a', 'b']", missing rows stay missing
+
+    Parameters:
+    -----------
+    column: df series, pa.Array or pa.ChunkedArray
+
+    Returns
+    -----------
+    formatted: np array of object
+    """
+
+    list_array = list_column_arrow(column)
+    lengths = pc.fill_null(pc.list_value_length(list_array), 0).to_numpy()
+
+    values = pc.fill_null(pc.list_flatten(list_array).cast(pa.string()), '')
+    values = pc.binary_join_element_wise("'", values, "'", '')
+    offsets = pa.array(np.concatenate([[0], np.cumsum(lengths)]), type = pa.int32())
+
+    formatted = pc.binary_join(pa.ListArray.from_arrays(offsets, values), ', ')
+    formatted = pc.binary_join_element_wise('[', formatted, ']', '')
+    formatted = pc.if_else(list_array.is_null(), pa.scalar(None, type = pa.string()), formatted)
+
+    return formatted.to_numpy(zero_copy_only = False)
+
+
+def shard_clean(path):
     """
-    Save cleaned data into 2 separate csv files
+    Read, feature engineer and clean a single shard of the original data
 
     Parameters:
     -----------
+    path: str
+
+    Returns
+    -----------
     data: dataframe
+    """
+
+    data = pd.concat(original_data_chunk_reader([path]), ignore_index = True)
+    data = data_feature_engineering(data)
+    data = final_column_cleaning(data)
+
+    return data
+
+
+def parallel_workers(paths, workers = None, min_shard_bytes = parallel_min_shard_bytes):
+    """
+    Number of worker processes worth starting to process the given shards
+    1 means the shards are processed serially: a single cpu or shard, or a shard smaller
+    than min_shard_bytes
+
+    Parameters:
+    -----------
+    paths: list of str
+    workers: int (optional, defaults to the number of cpus)
+    min_shard_bytes: int
 
     Returns
     -----------
-    None
+    workers: int
     """
 
-    cleaned_data_1 = data[:112798]
-    cleaned_data_2 = data[112798:]
+    workers = min(workers or os.cpu_count() or 1, len(paths))
 
-    cleaned_data_1.to_csv('data/cleaned_data/cleaned_data_1.csv', index = False)
-    cleaned_data_2.to_csv('data/cleaned_data/cleaned_data_2.csv', index = False)
+    if workers < 2 or min(os.path.getsize(path) for path in paths) < min_shard_bytes:
+        return 1
 
-    return None
+    return workers
 
 
-def string_to_list(row_value):
+def parallel_data_clean(paths = original_data_paths, workers = None, min_shard_bytes = parallel_min_shard_bytes):
     """
-    Convert a string representation of a list to an actual list
-    
+    Clean every shard of the original data in a pool of worker processes
+    Shards are merged in the order of paths, so the result matches a serial run
+    Falls back to a serial run when the pool would not pay off (see parallel_workers)
+
     Parameters:
     -----------
-    row: str
+    paths: list of str
+    workers: int (optional, defaults to the number of cpus)
+    min_shard_bytes: int
 
     Returns
     -----------
-    cleaned_row: list
+    data: dataframe
     """
-    
-    if row_value is np.nan:
-        return np.nan
 
+    workers = parallel_workers(paths, workers, min_shard_bytes)
+
+    if workers == 1:
+        shards = [shard_clean(path) for path in paths]
     else:
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            shards = list(executor.map(shard_clean, paths))
+
+    data = pd.concat(shards, ignore_index = True)
+
+    return data
+
+
+def files_hash(paths):
+    """
+    Compute the sha256 hash of the contents of one or more files, the one place file contents
+    are hashed: the original data shards and the cleaning code by data_clean, the code of the
+    modules building a derived file by data_signature()
+
+    Parameters:
+    -----------
+    paths: list of str
+
+    Returns
+    -----------
+    digest: str
+    """
+
+    digest = hashlib.sha256()
+
+    for path in paths:
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def cleaning_code_version():
+    """
+    Version of the cleaning code, the hash of this file and of data_clean.py, which decides
+    how the cleaned shards are combined into the outputs
+    Any change to either invalidates every cached shard
+
+    Returns
+    -----------
+    version: str
+    """
+
+    version = files_hash([__file__, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_clean.py')])
+
+    return version
+
+
+def shard_artifact_path(path):
+    """
+    Location of the cached cleaned output for a shard of the original data
+
+    Parameters:
+    -----------
+    path: str
+
+    Returns
+    -----------
+    artifact_path: str
+    """
+
+    artifact_path = os.path.join('data/cleaned_data/shards', os.path.basename(path).replace('.csv', '.parquet'))
+
+    return artifact_path
+
+
+def shard_artifact_build(path):
+    """
+    Clean a single shard of the original data and save it as a parquet artifact
+
+    Parameters:
+    -----------
+    path: str
+
+    Returns
+    -----------
+    artifact_path: str
+    """
+
+    artifact_path = shard_artifact_path(path)
+    pq.write_table(data_to_arrow(shard_clean(path)), artifact_path)
+
+    return artifact_path
+
+
+def shard_artifact_stream(path, chunksize):
+    """
+    Clean a single shard of the original data chunk by chunk, appending each cleaned chunk
+    to its parquet artifact, so memory is bounded by the chunk size instead of the shard
+
+    Parameters:
+    -----------
+    path: str
+    chunksize: int
+
+    Returns
+    -----------
+    artifact_path: str
+    """
+
+    artifact_path = shard_artifact_path(path)
+
+    with pq.ParquetWriter(artifact_path, cleaned_data_schema) as writer:
+        for data in original_data_chunk_reader([path], chunksize = chunksize):
+            data = data_feature_engineering(data)
+            data = final_column_cleaning(data)
+
+            writer.write_table(data_to_arrow(data))
+
+    return artifact_path
+
+
+def shard_artifacts_build(paths, workers = None, chunksize = None):
+    """
+    Build the parquet artifacts for the given shards, in a pool of worker processes
+    when workers is given and the shards are large enough (see parallel_workers)
+    When a chunksize is given each shard is streamed chunk by chunk (see shard_artifact_stream)
+
+    Parameters:
+    -----------
+    paths: list of str
+    workers: int (optional)
+    chunksize: int (optional)
+
+    Returns
+    -----------
+    artifact_paths: list of str, in the order of paths
+    """
+
+    os.makedirs('data/cleaned_data/shards', exist_ok = True)
+
+    build = shard_artifact_build if chunksize is None else functools.partial(shard_artifact_stream, chunksize = chunksize)
+
+    if workers is None or parallel_workers(paths, workers) == 1:
+        return [build(path) for path in paths]
+
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        artifact_paths = list(executor.map(build, paths))
+
+    return artifact_paths
+
+
+def manifest_reader():
+    """
+    Read the manifest of the last cleaning run
+    An empty manifest is returned when there is none
+
+    Returns
+    -----------
+    manifest: dict
+    """
+
+    if not os.path.exists('data/cleaned_data/manifest.json'):
+        return {'code_version': None, 'shards': {}, 'artifacts': {}}
+
+    with open('data/cleaned_data/manifest.json') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    return manifest
+
+
+def manifest_save(manifest):
+    """
+    Save the manifest of the current cleaning run
+    The previous manifest is replaced in a single rename
+
+    Parameters:
+    -----------
+    manifest: dict
+
+    Returns
+    -----------
+    None
+    """
+
+    temporary_path = f'data/cleaned_data/manifest.json.{os.getpid()}.tmp'
+
+    with open(temporary_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent = 4)
+
+    os.replace(temporary_path, 'data/cleaned_data/manifest.json')
+
+    return None
+
+
+def stale_shards(manifest, paths = original_data_paths):
+    """
+    Find the shards that have to be cleaned again
+    A shard is stale when its contents or the cleaning code changed, or its artifact is missing
+
+    Parameters:
+    -----------
+    manifest: dict
+    paths: list of str
+
+    Returns
+    -----------
+    shard_hashes: dict of path -> hash for every shard
+    stale: list of str
+    """
+
+    shard_hashes = {path: files_hash([path]) for path in paths}
+    code_changed = manifest['code_version'] != cleaning_code_version()
+
+    stale = [
+        path for path in paths
+        if code_changed
+        or manifest['shards'].get(path) != shard_hashes[path]
+        or not os.path.exists(shard_artifact_path(path))
+    ]
+
+    return shard_hashes, stale
+
+
+def manifest_signature(code_version, shard_hashes):
+    """
+    Signature of the inputs a cleaning run built the cleaned data from: the cleaning code
+    and the contents of every original data shard
+
+    Parameters:
+    -----------
+    code_version: str
+    shard_hashes: dict of path -> hash
+
+    Returns
+    -----------
+    signature: str
+    """
+
+    inputs = json.dumps({'code_version': code_version, 'shards': shard_hashes}, sort_keys = True)
+    signature = hashlib.sha256(inputs.encode()).hexdigest()
+
+    return signature
+
+
+def data_signature(version, code_paths = ()):
+    """
+    Signature a file derived from the cleaned data (figure bundle, column store, preview table)
+    is saved with and checked against: the signature of the cleaned data recorded in the manifest
+    by data_clean, the version of the derived file and the code of the modules building it
+    The cleaned data itself is never read. Data cleaned without a recorded signature is signed by
+    the size and modification time of its files instead
+    Returns None when none of the cleaned files are present (e.g. a deploy that only ships the
+    derived files)
+
+    Parameters:
+    -----------
+    version: int
+    code_paths: list of str
+
+    Returns
+    -----------
+    signature: str
+    """
+
+    data_paths = [path for path in cleaned_output_paths if os.path.exists(path)]
+
+    if not data_paths:
+        return None
+
+    digest = hashlib.sha256(str(version).encode())
+    manifest = manifest_reader()
+
+    if manifest.get('signature'):
+        digest.update(manifest['signature'].encode())
+
+    else:
+        for path in data_paths:
+            stat = os.stat(path)
+            digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+
+    digest.update(files_hash([path for path in code_paths if os.path.exists(path)]).encode())
+
+    signature = digest.hexdigest()
+
+    return signature
+
+
+def data_stamp():
+    """
+    Size and modification time of the manifest and of every cleaned file, a check cheap
+    enough to run on every request of whether data_signature() may have changed
+
+    Parameters:
+    -----------
+    None
+
+    Returns
+    -----------
+    stamp: tuple
+    """
+
+    stamp = tuple(
+        (os.stat(path).st_size, os.stat(path).st_mtime_ns) if os.path.exists(path) else None
+        for path in ['data/cleaned_data/manifest.json'] + cleaned_output_paths
+    )
+
+    return stamp
+
+
+def data_to_arrow(data):
+    """
+    Convert the cleaned dataframe into an arrow table with cleaned_data_schema
+    List columns are stored natively as typed lists
+    The fixed schema keeps every chunk of a streamed run compatible
+
+    Parameters:
+    -----------
+    data: dataframe
+
+    Returns
+    -----------
+    table: pa.Table
+    """
+
+    arrays = []
+
+    for field in cleaned_data_schema:
+        column = data[field.name].reset_index(drop = True)
+
+        if field.name in list_column_types:
+            arrays.append(list_column_to_arrow(column, list_column_types[field.name]))
+
+        else:
+            if column.dtype.name == 'category':
+                column = column.astype(object)
+
+            arrays.append(pa.array(column, type = field.type, from_pandas = True))
+
+    table = pa.Table.from_arrays(arrays, schema = cleaned_data_schema)
+
+    return table
+
+
+def arrow_to_data(table):
+    """
+    Convert an arrow table with cleaned_data_schema (or some of its columns) back into the
+    cleaned dataframe
+    Typed list columns are converted by arrow into one numpy array per row, null lists
+    become np.nan
+
+    Parameters:
+    -----------
+    table: pa.Table
+
+    Returns
+    -----------
+    data: dataframe
+    """
+
+    data = table.select([column for column in table.column_names if column not in list_column_types]).to_pandas()
+    data = data.astype({column: dtype for column, dtype in column_dtypes.items() if column in data and dtype is not object})
+
+    for column in list_column_types:
+        if column in table.column_names:
+            values = table.column(column).to_pandas().to_numpy(copy = True)
+            values[table.column(column).is_null().to_numpy(zero_copy_only = False)] = np.nan
+            data[column] = pd.Series(values, dtype = object)
+
+    data = data[table.column_names]
+
+    return data
+
+
+def data_writers_open(file_formats = ('parquet', 'csv')):
+    """
+    Open the output files for the cleaned data so chunks can be appended to them
+    The participant table is appended to disk chunk by chunk (participant_writer_open), the
+    cube and hexagon bins are merged into running aggregates (aggregate_append), so memory
+    is bounded by the chunk and aggregate sizes instead of the number of chunks
+
+    Parameters:
+    -----------
+    file_formats: tuple of output_formats ('parquet', 'csv', 'participants', 'cube', 'hex_bins')
+
+    Returns
+    -----------
+    writers: dict
+    """
+
+    writers = {'rows': 0}
+
+    if 'parquet' in file_formats:
+        writers['parquet'] = pq.ParquetWriter('data/cleaned_data/cleaned_data.parquet', cleaned_data_schema)
+
+    if 'csv' in file_formats:
+        writers['csv'] = [
+            open('data/cleaned_data/cleaned_data_1.csv', 'w', newline = ''),
+            open('data/cleaned_data/cleaned_data_2.csv', 'w', newline = '')
+        ]
+
+    if 'participants' in file_formats:
+        writers['participants'] = participant_writer_open()
+
+    if 'cube' in file_formats:
+        writers['cube'] = []
+
+    if 'hex_bins' in file_formats:
+        writers['hex_bins'] = []
+
+    return writers
+
+
+def data_chunk_save(data, writers):
+    """
+    Append a chunk of cleaned data to the open outputs
+    Rows are split between the 2 csv files at row 112798, list columns are written
+    formatted by list_column_format()
+
+    Parameters:
+    -----------
+    data: dataframe
+    writers: dict
+
+    Returns
+    -----------
+    None
+    """
+
+    if 'parquet' in writers or 'participants' in writers:
+        table = data_to_arrow(data)
+
+    if 'parquet' in writers:
+        writers['parquet'].write_table(table)
+
+    if 'csv' in writers:
+        split = min(max(112798 - writers['rows'], 0), len(data))
+        csv_data = data.assign(**{column: list_column_format(data[column]) for column in list_column_types})
+
+        for csv_file, part in zip(writers['csv'], [csv_data[:split], csv_data[split:]]):
+            part.to_csv(csv_file, index = False, header = csv_file.tell() == 0)
+
+    if 'participants' in writers:
+        participant_chunk_save(participant_table_builder(table), writers['participants'])
+
+    if 'cube' in writers:
+        aggregate_append(writers['cube'], aggregate_cube_builder(data), aggregate_cube_merge)
+
+    if 'hex_bins' in writers:
+        aggregate_append(writers['hex_bins'], hex_bins_builder(data), hex_bins_merge)
+
+    writers['rows'] += len(data)
+
+    return None
+
+
+def data_writers_close(writers):
+    """
+    Close the outputs opened by data_writers_open(), saving the participant table and the
+    merged aggregates
+
+    Parameters:
+    -----------
+    writers: dict
+
+    Returns
+    -----------
+    None
+    """
+
+    if 'parquet' in writers:
+        writers['parquet'].close()
+
+    if 'csv' in writers:
+        for csv_file in writers['csv']:
+            csv_file.close()
+
+    if 'participants' in writers:
+        participant_writer_close(writers['participants'])
+
+    if 'cube' in writers:
+        aggregate_cube_save(aggregate_cube_merge(writers['cube']))
+
+    if 'hex_bins' in writers:
+        hex_bins_save(hex_bins_merge(writers['hex_bins']))
+
+    return None
+
+
+def aggregate_append(aggregates, aggregate, merge):
+    """
+    Append the aggregate of a chunk (cube or hexagon bins) to a running aggregate
+    The chunk aggregates are merged into the running one every aggregate_merge_chunks chunks,
+    so they are never all held at once
+
+    Parameters:
+    -----------
+    aggregates: list of dataframes (the running aggregate, then the pending chunk aggregates)
+    aggregate: dataframe
+    merge: function (aggregate_cube_merge or hex_bins_merge)
+
+    Returns
+    -----------
+    None
+    """
+
+    aggregates.append(aggregate)
+
+    if len(aggregates) > aggregate_merge_chunks:
+        aggregates[:] = [merge(aggregates)]
+
+    return None
+
+
+def data_save(data, file_formats = ('parquet', 'csv')):
+    """
+    Save cleaned data as a single parquet file and/or 2 separate csv files
+    The parquet file keeps list columns as typed lists, the csv files keep them as strings
+
+    Parameters:
+    -----------
+    data: dataframe
+    file_formats: tuple of 'parquet', 'csv'
+
+    Returns
+    -----------
+    None
+    """
+
+    writers = data_writers_open(file_formats)
+    data_chunk_save(data, writers)
+    data_writers_close(writers)
+
+    return None
+
+
+def compact_schema_apply(data):
+    """
+    Convert the cleaned data into a compact in-memory schema
+    date is parsed once into datetime64, state/state_code/weekday/month become small
+    integer codes into the shared dictionaries, n_guns_involved becomes a nullable integer
+    The list columns are dropped: build the participant table first (participant_table_builder),
+    it holds their values as small integer codes into participant_categories and gun_categories
+
+    Parameters:
+    -----------
+    data: dataframe
+
+    Returns
+    -----------
+    data: dataframe
+    """
+
+    data['date'] = pd.to_datetime(data['date'])
+    data['n_guns_involved'] = pd.to_numeric(data['n_guns_involved'])
+
+    for column, dtype in compact_column_dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            # astype() keeps an existing categorical's order when the categories match
+            data[column] = pd.Categorical(data[column], dtype = dtype)
+        else:
+            data[column] = data[column].astype(dtype)
+
+    data = data.drop(columns = [column for column in list_column_types if column in data])
+
+    return data
+
+
+def memory_usage_report(data, compact_data, participants = None):
+    """
+    Compare the bytes used per column before and after compact_schema_apply()
+    The list columns are counted after as their coded arrays in the participant table,
+    the offsets of the table are reported on their own row
+
+    Parameters:
+    -----------
+    data: dataframe
+    compact_data: dataframe
+    participants: dict of np arrays (optional, participant table of the data)
+
+    Returns
+    -----------
+    report: dataframe
+    """
+
+    after = compact_data.memory_usage(index = False, deep = True)
+
+    if participants is not None:
+        for column in list_column_types:
+            after[column] = participants['gun_category' if column == 'gun_type' else column.replace('participant_', '')].nbytes
+
+        after['offsets'] = participants['offsets'].nbytes + participants['gun_offsets'].nbytes
+
+    report = pd.DataFrame(
+        {
+            'before': data.memory_usage(index = False, deep = True),
+            'after': after
+        }
+    ).fillna(0).astype('int64')
+
+    report.loc['total'] = report.sum()
+    report['ratio'] = (report['before'] / report['after']).round(2)
+
+    return report
+
+
+def dictionary_encode(values, categories):
+    """
+    Encode values as small integer codes into a shared dictionary
+    Values missing from the dictionary are appended to it instead of being dropped
+
+    Parameters:
+    -----------
+    values: df series
+    categories: list of str
+
+    Returns
+    -----------
+    codes: np array
+    categories: np array
+    """
+
+    unseen = sorted(set(values.dropna().unique()) - set(categories))
+    categories = list(categories) + unseen
+
+    codes = pd.Categorical(values, categories = categories).codes
+
+    return codes, np.array(categories, dtype = str)
+
+
+def gun_category_encode(gun_types):
+    """
+    Code gun types as small integers into gun_categories through gun_map
+    Each distinct gun type is looked up a single time, unmapped types are coded as -1
+
+    Parameters:
+    -----------
+    gun_types: df series
+
+    Returns
+    -----------
+    codes: np array of int8
+    """
+
+    gun_type_codes, gun_types_unique = pd.factorize(gun_types)
+    category_lookup = pd.Categorical(pd.Series(gun_types_unique).map(gun_map), categories = gun_categories).codes
+
+    codes = np.append(category_lookup, -1)[gun_type_codes].astype('int8')
+
+    return codes
+
+
+def participant_table_builder(data):
+    """
+    Build a normalized participant level table in an offsets (CSR) layout
+    Participants of incident i are the slice offsets[i]:offsets[i+1] of the flat arrays
+    Each incident has as many participants as its longest participant list, positions
+    missing from shorter lists are coded as -1
+    The guns of incident i are the slice gun_offsets[i]:gun_offsets[i+1] of gun_category
+    The list columns are flattened by arrow, an arrow table of the cleaned data is read
+    without converting its lists at all
+
+    Parameters:
+    -----------
+    data: dataframe or pa.Table
+
+    Returns
+    -----------
+    participants: dict of np arrays
+        offsets, age, gender, status, type, gun_offsets, gun_category and the categories
+        for each coded array
+    """
+
+    flattened = {column: list_column_flatten(data[column]) for column in participant_columns}
+
+    counts = np.max([lengths for _, lengths in flattened.values()], axis = 0)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype('int64')
+    participants = {'offsets': offsets}
+
+    for column, (values, lengths) in flattened.items():
+        starts = np.cumsum(lengths) - lengths
+        positions = np.arange(len(values)) - np.repeat(starts, lengths)
+        flat_index = np.repeat(offsets[:-1], lengths) + positions
+
+        name = column.replace('participant_', '')
+        array = np.full(offsets[-1], -1, dtype = 'int16' if column == 'participant_age' else 'int8')
+
+        if column == 'participant_age':
+            array[flat_index] = pd.to_numeric(values, errors = 'coerce').fillna(-1).to_numpy()
+
+        else:
+            codes, categories = dictionary_encode(values, participant_categories[column])
+            array[flat_index] = codes
+            participants[name + '_categories'] = categories
+
+        participants[name] = array
+
+    gun_types, gun_lengths = list_column_flatten(data['gun_type'])
+
+    participants['gun_offsets'] = np.concatenate([[0], np.cumsum(gun_lengths)]).astype('int64')
+    participants['gun_category'] = gun_category_encode(gun_types)
+    participants['gun_categories'] = np.array(gun_categories, dtype = str)
+
+    return participants
+
+
+def participant_table_save(participants):
+    """
+    Save the participant table into a single npz file
+
+    Parameters:
+    -----------
+    participants: dict of np arrays
+
+    Returns
+    -----------
+    None
+    """
+
+    np.savez('data/cleaned_data/participants.npz', **participants)
+
+    return None
+
+
+def participant_writer_open(path = 'data/cleaned_data/participants.npz'):
+    """
+    Open a participant table that the tables of consecutive chunks are appended to
+    Every array is appended to its own raw file as chunks arrive, the npz file is only
+    assembled from them by participant_writer_close()
+
+    Parameters:
+    -----------
+    path: str
+
+    Returns
+    -----------
+    writer: dict
+    """
+
+    directory = f'{path}.{os.getpid()}.parts'
+    os.makedirs(directory, exist_ok = True)
+
+    writer = {
+        'path': path,
+        'directory': directory,
+        'files': {name: open(os.path.join(directory, name), 'wb') for name in participant_array_dtypes},
+        'offsets': 0,
+        'gun_offsets': 0,
+        'categories': {column.replace('participant_', ''): list(categories) for column, categories in participant_categories.items()}
+    }
+
+    writer['files']['offsets'].write(np.zeros(1, dtype = 'int64').tobytes())
+    writer['files']['gun_offsets'].write(np.zeros(1, dtype = 'int64').tobytes())
+
+    return writer
+
+
+def participant_chunk_save(participants, writer):
+    """
+    Append the participant table of a chunk to an open participant table
+    Offsets are shifted and codes are remapped onto the running union of the chunk
+    categories, which keeps the order of the shared dictionaries
+
+    Parameters:
+    -----------
+    participants: dict of np arrays
+    writer: dict
+
+    Returns
+    -----------
+    None
+    """
+
+    arrays = {
+        'offsets': participants['offsets'][1:] + writer['offsets'],
+        'age': participants['age'],
+        'gun_offsets': participants['gun_offsets'][1:] + writer['gun_offsets'],
+        'gun_category': participants['gun_category']
+    }
+
+    for name, categories in writer['categories'].items():
+        categories += [category for category in participants[name + '_categories'] if category not in categories]
+
+        lookup = np.array([categories.index(category) for category in participants[name + '_categories']] + [-1])
+        arrays[name] = lookup[participants[name]]
+
+    for name, array in arrays.items():
+        writer['files'][name].write(array.astype(participant_array_dtypes[name]).tobytes())
+
+    writer['offsets'] += int(participants['offsets'][-1])
+    writer['gun_offsets'] += int(participants['gun_offsets'][-1])
+
+    return None
+
+
+def participant_writer_close(writer):
+    """
+    Assemble the npz file of an open participant table from its raw files, each copied into
+    the archive block by block, and remove the raw files
+    The archive is the one np.savez writes, so participant tables are read the same way
+
+    Parameters:
+    -----------
+    writer: dict
+
+    Returns
+    -----------
+    None
+    """
+
+    for array_file in writer['files'].values():
+        array_file.close()
+
+    temporary_path = f"{writer['path']}.{os.getpid()}.tmp"
+
+    with zipfile.ZipFile(temporary_path, 'w', allowZip64 = True) as archive:
+        for name, dtype in participant_array_dtypes.items():
+            array_path = os.path.join(writer['directory'], name)
+            header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (os.path.getsize(array_path) // np.dtype(dtype).itemsize,)}
+
+            with archive.open(name + '.npy', 'w', force_zip64 = True) as member, open(array_path, 'rb') as array_file:
+                np.lib.format.write_array_header_1_0(member, header)
+                shutil.copyfileobj(array_file, member, 1 << 20)
+
+        categories = {name + '_categories': values for name, values in writer['categories'].items()}
+        categories['gun_categories'] = gun_categories
+
+        for name, values in categories.items():
+            with archive.open(name + '.npy', 'w', force_zip64 = True) as member:
+                np.lib.format.write_array(member, np.array(values, dtype = str))
+
+    os.replace(temporary_path, writer['path'])
+    shutil.rmtree(writer['directory'])
+
+    return None
+
+
+def aggregate_cube_builder(data):
+    """
+    Pre-aggregate incident counts, n_killed and n_injured by
+    state x city x year x month x weekday (state_code follows state)
+
+    Parameters:
+    -----------
+    data: dataframe
+
+    Returns
+    -----------
+    cube: dataframe
+    """
+
+    cube = data.groupby(cube_dimensions, observed = True, dropna = False).agg(
+        count = ('n_killed', 'size'),
+        n_killed = ('n_killed', 'sum'),
+        n_injured = ('n_injured', 'sum')
+    )
+
+    cube = cube.reset_index().astype({'count': 'int32', 'n_killed': 'int32', 'n_injured': 'int32', 'year': 'int16'})
+
+    return cube
+
+
+def aggregate_cube_merge(cubes):
+    """
+    Merge cubes built from separate chunks or shards of the data into a single cube
+
+    Parameters:
+    -----------
+    cubes: list of dataframes
+
+    Returns
+    -----------
+    cube: dataframe
+    """
+
+    cube = pd.concat(cubes, ignore_index = True)
+
+    # Code every dimension by its sorted values (missing values last, as a groupby with
+    # dropna = False) and sum the measures per combination of codes, without the hash tables
+    # of a groupby over 6 object columns
+    codes = []
+    values = []
+
+    for dimension in cube_dimensions:
+        dimension_codes, dimension_values = pd.factorize(cube[dimension].astype(object), sort = True)
+        dimension_codes[dimension_codes < 0] = len(dimension_values)
+
+        codes.append(dimension_codes)
+        values.append(np.append(np.asarray(dimension_values, dtype = object), np.nan))
+
+    shape = [len(dimension_values) for dimension_values in values]
+    keys, inverse = np.unique(np.ravel_multi_index(codes, shape), return_inverse = True)
+
+    merged = pd.DataFrame({
+        dimension: dimension_values[dimension_codes]
+        for dimension, dimension_values, dimension_codes in zip(cube_dimensions, values, np.unravel_index(keys, shape))
+    })
+
+    for measure in cube_measures:
+        merged[measure] = np.bincount(inverse.ravel(), weights = cube[measure], minlength = len(keys)).astype('int32')
+
+    merged = merged.astype({'year': 'int16'})
+
+    return merged
+
+
+def aggregate_cube_save(cube):
+    """
+    Save the pre-aggregated cube into a parquet file
+
+    Parameters:
+    -----------
+    cube: dataframe
+
+    Returns
+    -----------
+    None
+    """
+
+    pq.write_table(pa.Table.from_pandas(cube, preserve_index = False), 'data/cleaned_data/cube.parquet')
+
+    return None
+
+
+def hex_bin_codes(longitude, latitude, radius):
+    """
+    Axial coordinates of the pointy top hexagons of a given radius containing each point
+    Longitudes are scaled by cos(hex_latitude) so hexagons are regular around the US
+
+    Parameters:
+    -----------
+    longitude: np array of float
+    latitude: np array of float
+    radius: float (degrees)
+
+    Returns
+    -----------
+    q: np array of int32
+    r: np array of int32
+    """
+
+    x = longitude.astype('float64') * np.cos(np.radians(hex_latitude))
+    y = latitude.astype('float64')
+
+    q = (np.sqrt(3) / 3 * x - y / 3) / radius
+    r = 2 / 3 * y / radius
+    s = -q - r
+
+    rounded_q, rounded_r, rounded_s = np.round(q), np.round(r), np.round(s)
+    q_error, r_error, s_error = np.abs(rounded_q - q), np.abs(rounded_r - r), np.abs(rounded_s - s)
+
+    fix_q = (q_error > r_error) & (q_error > s_error)
+    fix_r = ~fix_q & (r_error > s_error)
+
+    rounded_q = np.where(fix_q, -rounded_r - rounded_s, rounded_q)
+    rounded_r = np.where(fix_r, -rounded_q - rounded_s, rounded_r)
+
+    return rounded_q.astype('int32'), rounded_r.astype('int32')
+
+
+def hex_bin_centers(q, r, radius):
+    """
+    Longitude and latitude of the centers of hexagons given by their axial coordinates
+
+    Parameters:
+    -----------
+    q: np array of int
+    r: np array of int
+    radius: float (degrees)
+
+    Returns
+    -----------
+    longitude: np array of float32
+    latitude: np array of float32
+    """
+
+    longitude = radius * np.sqrt(3) * (q + r / 2) / np.cos(np.radians(hex_latitude))
+    latitude = radius * 3 / 2 * r
+
+    return longitude.astype('float32'), latitude.astype('float32')
+
+
+def hex_bins_builder(data, levels = None):
+    """
+    Count incidents, n_killed and n_injured per hexagon at every level of the bin pyramid
+    Only non-empty hexagons are kept and incidents without coordinates are left out
+
+    Parameters:
+    -----------
+    data: dataframe (or dict of arrays) with longitude, latitude, n_killed and n_injured
+    levels: list of int (optional, every level by default)
+
+    Returns
+    -----------
+    bins: dataframe of level, q, r, count, n_killed, n_injured
+    """
+
+    columns = ['level', 'q', 'r', 'count', 'n_killed', 'n_injured']
+
+    if 'latitude' not in data:
+        return pd.DataFrame({column: np.zeros(0, dtype = 'int32') for column in columns})
+
+    longitude = np.asarray(data['longitude'], dtype = 'float32')
+    latitude = np.asarray(data['latitude'], dtype = 'float32')
+    located = ~(np.isnan(longitude) | np.isnan(latitude))
+
+    longitude, latitude = longitude[located], latitude[located]
+    measures = {measure: np.asarray(data[measure])[located] for measure in ['n_killed', 'n_injured']}
+
+    level_bins = []
+
+    for level in range(hex_levels) if levels is None else levels:
+        q, r = hex_bin_codes(longitude, latitude, hex_radius / 2 ** level)
+
+        keys, inverse = np.unique(q.astype('int64') << 32 | (r.astype('int64') & 0xffffffff), return_inverse = True)
+
+        level_bins.append(pd.DataFrame({
+            'level': np.full(len(keys), level, dtype = 'int8'),
+            'q': (keys >> 32).astype('int32'),
+            'r': keys.astype('int32'),
+            'count': np.bincount(inverse, minlength = len(keys)).astype('int32'),
+            'n_killed': np.bincount(inverse, weights = measures['n_killed'], minlength = len(keys)).astype('int32'),
+            'n_injured': np.bincount(inverse, weights = measures['n_injured'], minlength = len(keys)).astype('int32')
+        }))
+
+    bins = pd.concat(level_bins, ignore_index = True) if level_bins else pd.DataFrame(columns = columns)
+
+    return bins
+
+
+def hex_bins_merge(bins):
+    """
+    Merge hexagon bins built from separate chunks or shards of the data
+
+    Parameters:
+    -----------
+    bins: list of dataframes
+
+    Returns
+    -----------
+    bins: dataframe
+    """
+
+    columns = {'level': 'int8', 'q': 'int32', 'r': 'int32', 'count': 'int32', 'n_killed': 'int32', 'n_injured': 'int32'}
+    arrays = {column: np.concatenate([part[column].to_numpy(dtype = dtype) for part in bins]) for column, dtype in columns.items()}
+
+    # Sort the bins by hexagon and sum the runs of equal hexagons, without the hash table
+    # and int64 copies of a groupby
+    order = np.lexsort((arrays['r'], arrays['q'], arrays['level']))
+    keys = [arrays[column][order] for column in ['level', 'q', 'r']]
+
+    changed = np.zeros(len(order), dtype = bool)
+    changed[:1] = True
+
+    for key in keys:
+        changed[1:] |= key[1:] != key[:-1]
+
+    starts = np.flatnonzero(changed)
+
+    merged = pd.DataFrame({column: key[starts] for column, key in zip(['level', 'q', 'r'], keys)})
+
+    for measure in ['count', 'n_killed', 'n_injured']:
+        merged[measure] = np.add.reduceat(arrays[measure][order], starts).astype('int32') if len(starts) else np.zeros(0, dtype = 'int32')
+
+    return merged
+
+
+def hex_bins_save(bins):
+    """
+    Save the hexagon bin pyramid into a parquet file
+
+    Parameters:
+    -----------
+    bins: dataframe
+
+    Returns
+    -----------
+    None
+    """
+
+    pq.write_table(pa.Table.from_pandas(bins, preserve_index = False), 'data/cleaned_data/hex_bins.parquet')
+
+    return None
+
+
+def string_to_list(row_value):
+    """
+    Convert a string representation of a list to an actual list
+    Only the enclosing brackets are removed, so values holding brackets themselves
+    ('7.62 [AK-47]') are kept whole
+    
+    Parameters:
+    -----------
+    row: str
+
+    Returns
+    -----------
+    cleaned_row: list
+    """
+    
+    if row_value is np.nan:
+        return np.nan
+
+    else:
+        row_value = row_value.replace("'", '')
+
+        if row_value.startswith('[') and row_value.endswith(']'):
+            row_value = row_value[1:-1]
+
         try:
-            return list(map(int, row_value.replace("'", '').strip('][]').split(', ')))
+            return list(map(int, row_value.split(', ')))
         except:
-            return row_value.replace("'", '').strip('][]').split(', ')
+            return row_value.split(', ')
 
 
 if __name__ == '__main__':
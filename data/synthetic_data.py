@@ -0,0 +1,188 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from data_cleaning_functions import original_data_paths, us_state_abbrev, gun_map, participant_categories
+
+original_columns = [
+    'incident_id',
+    'date',
+    'state',
+    'city_or_county',
+    'address',
+    'n_killed',
+    'n_injured',
+    'incident_url',
+    'source_url',
+    'incident_url_fields_missing',
+    'congressional_district',
+    'gun_stolen',
+    'gun_type',
+    'incident_characteristics',
+    'latitude',
+    'location_description',
+    'longitude',
+    'n_guns_involved',
+    'notes',
+    'participant_age',
+    'participant_age_group',
+    'participant_gender',
+    'participant_name',
+    'participant_relationship',
+    'participant_status',
+    'participant_type',
+    'sources',
+    'state_house_district',
+    'state_senate_district'
+]
+
+base_rows = 239677
+base_cities = 12000
+max_participants = 6
+
+synthetic_states = list(us_state_abbrev)
+synthetic_gun_types = list(gun_map) + ['Unknown']
+
+
+def participant_encode(values, n_participants, present = None):
+    """
+    Encode per participant values the way the original data does: '0::a||1::b||2::c'
+    Participants that are not present are left out, keeping the index of the others
+
+    Parameters:
+    -----------
+    values: np array of str, shape (rows, max_participants)
+    n_participants: np array of int (participants per row)
+    present: np array of bool, shape (rows, max_participants) (optional)
+
+    Returns:
+    encoded: np array of object (np.nan for rows without any value)
+    """
+
+    rows = len(n_participants)
+    encoded = np.full(rows, '', dtype = object)
+
+    for slot in range(values.shape[1]):
+        keep = n_participants > slot
+
+        if present is not None:
+            keep &= present[:, slot]
+
+        slot_values = np.char.add(f'{slot}::', values[keep, slot].astype(str)).astype(object)
+        separators = np.where(encoded[keep] == '', '', '||').astype(object)
+
+        encoded[keep] = encoded[keep] + separators + slot_values
+
+    encoded[encoded == ''] = np.nan
+
+    return encoded
+
+
+def synthetic_chunk(rows, rng, first_id = 0):
+    """
+    Generate a chunk of incidents shaped like the original GVA data
+    Dates span 2013 to early 2018 so the 2014-2017 filter has rows to drop, list columns use
+    the '::'/'||' participant encoding with missing participants and missing columns
+
+    Parameters:
+    -----------
+    rows: int
+    rng: np random generator
+    first_id: int
+
+    Returns:
+    data: dataframe
+    """
+
+    dates = pd.date_range('2013-01-01', '2018-03-31').strftime('%Y-%m-%d').to_numpy()
+    states = rng.choice(synthetic_states, rows)
+    n_participants = rng.choice(np.arange(1, max_participants + 1), rows, p = [0.25, 0.35, 0.2, 0.1, 0.06, 0.04])
+
+    n_guns = np.where(rng.random(rows) < 0.9, 1, rng.integers(2, 12, rows))
+    gun_slots = min(int(n_guns.max()), 4)
+    has_guns = rng.random(rows) < 0.6
+
+    gun_type = participant_encode(rng.choice(synthetic_gun_types, (rows, gun_slots)), np.where(has_guns, np.minimum(n_guns, gun_slots), 0))
+
+    data = pd.DataFrame({
+        'incident_id': np.arange(first_id, first_id + rows),
+        'date': dates[rng.integers(len(dates), size = rows)],
+        'state': states,
+        'city_or_county': np.char.add('City ', rng.integers(base_cities, size = rows).astype(str)),
+        'address': 'Main Street',
+        'n_killed': rng.poisson(0.25, rows),
+        'n_injured': rng.poisson(0.5, rows),
+        'incident_url': 'http://www.gunviolencearchive.org/incident',
+        'source_url': 'http://example.com',
+        'incident_url_fields_missing': False,
+        'congressional_district': rng.integers(1, 20, rows),
+        'gun_stolen': np.nan,
+        'gun_type': gun_type,
+        'incident_characteristics': 'Shot - Wounded/Injured',
+        'latitude': np.round(rng.uniform(25, 49, rows), 4),
+        'location_description': np.nan,
+        'longitude': np.round(rng.uniform(-124, -67, rows), 4),
+        'n_guns_involved': np.where(has_guns, n_guns, np.nan),
+        'notes': np.nan,
+        'participant_age': participant_encode(rng.integers(1, 90, (rows, max_participants)), n_participants, rng.random((rows, max_participants)) < 0.8),
+        'participant_age_group': participant_encode(np.full((rows, max_participants), 'Adult 18+'), n_participants),
+        'participant_gender': participant_encode(rng.choice(participant_categories['participant_gender'], (rows, max_participants), p = [0.85, 0.15]), n_participants, rng.random((rows, max_participants)) < 0.9),
+        'participant_name': np.nan,
+        'participant_relationship': np.nan,
+        'participant_status': participant_encode(rng.choice(participant_categories['participant_status'], (rows, max_participants)), n_participants),
+        'participant_type': participant_encode(rng.choice(participant_categories['participant_type'], (rows, max_participants)), n_participants),
+        'sources': np.nan,
+        'state_house_district': np.nan,
+        'state_senate_district': np.nan
+    }, columns = original_columns)
+
+    return data
+
+
+def synthetic_data_write(scale = 1, root = '.', seed = 0, chunksize = 100000):
+    """
+    Write seeded synthetic original data files, base_rows * scale incidents split over the
+    original_data_paths shards under root. Generation is chunked so memory stays bounded
+
+    Parameters:
+    -----------
+    scale: float
+    root: str (directory that holds the data/original_data folder)
+    seed: int
+    chunksize: int
+
+    Returns:
+    paths: list of str
+    """
+
+    shard_rows = int(round(base_rows * scale / len(original_data_paths)))
+    paths = []
+    first_id = 0
+
+    for shard, path in enumerate(original_data_paths):
+        path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+
+        rng = np.random.default_rng([seed, shard])
+
+        with open(path, 'w', newline = '') as shard_file:
+            for start in range(0, shard_rows, chunksize):
+                rows = min(chunksize, shard_rows - start)
+
+                synthetic_chunk(rows, rng, first_id).to_csv(shard_file, header = shard_file.tell() == 0, index = False)
+                first_id += rows
+
+        paths.append(path)
+
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Write seeded synthetic data shaped like the original GVA files')
+    parser.add_argument('--scale', type = float, default = 1, help = f'multiple of {base_rows} incidents')
+    parser.add_argument('--root', default = '.', help = 'directory that holds data/original_data')
+    parser.add_argument('--seed', type = int, default = 0)
+    arguments = parser.parse_args()
+
+    for path in synthetic_data_write(arguments.scale, arguments.root, arguments.seed):
+        print(f'Wrote {path}')
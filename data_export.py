@@ -0,0 +1,158 @@
+import io
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from flask import Response, abort, request
+from app import server
+from preview_table import preview_columns, preview_table_get, filter_query_compile, predicate_mask
+
+export_chunk_rows = 16384
+export_dimensions = ['year', 'state_code', 'month', 'weekday']
+
+export_formats = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+
+
+def export_filters(args):
+    """
+    Read the export filters from the query string
+    Dimensions take repeated values (?year=2016&year=2017&state_code=CA), like the dashboard
+    filters; filter_query takes a Data Preview filter ('{state} contains Cal && {n_killed} >= 2')
+
+    Parameters:
+    -----------
+    args: werkzeug MultiDict (request.args)
+
+    Returns:
+    filters: dict of dimension -> list of allowed values
+    filter_query: str
+    """
+
+    filters = {}
+
+    for dimension in export_dimensions:
+        values = args.getlist(dimension)
+
+        if values:
+            filters[dimension] = [int(value) for value in values] if dimension == 'year' else values
+
+    filter_query = args.get('filter_query', '')
+
+    return filters, filter_query
+
+
+def export_mask(table, filters, predicates):
+    """
+    Rows of a slice of the preview table matching the dimension filters and the predicates
+
+    Parameters:
+    -----------
+    table: arrow table
+    filters: dict of dimension -> list of allowed values
+    predicates: tuple (see preview_table.filter_query_compile)
+
+    Returns:
+    mask: np array of bool
+    """
+
+    mask = np.ones(len(table), dtype = bool)
+
+    for dimension, values in filters.items():
+        value_set = pa.array(values, type = table.schema.field(dimension).type)
+        mask &= pc.fill_null(pc.is_in(table[dimension], value_set = value_set), False).to_numpy(zero_copy_only = False)
+
+    for predicate in predicates:
+        mask &= predicate_mask(table, *predicate)
+
+    return mask
+
+
+def export_chunks(filters, filter_query, file_format = 'csv', chunk_rows = export_chunk_rows):
+    """
+    Stream the matching cleaned incidents, encoded chunk by chunk
+    The memory-mapped preview table is scanned in slices of chunk_rows incidents; each slice is
+    filtered, encoded into a reused buffer and handed to the response before the next one is
+    read, so a download holds one chunk in memory whatever the size of the data
+    csv chunks go through pandas to_csv, as in data_chunk_save, so the quoting and the number
+    formatting match the cleaned csv files (pyarrow's csv writer quotes every string field)
+
+    Parameters:
+    -----------
+    filters: dict of dimension -> list of allowed values
+    filter_query: str
+    file_format: str ('csv' or 'arrow', an arrow ipc stream)
+    chunk_rows: int
+
+    Returns:
+    chunks: generator of bytes
+    """
+
+    table = preview_table_get().select(preview_columns)
+    predicates = filter_query_compile(filter_query)
+
+    sink = io.BytesIO()
+    writer = None if file_format == 'csv' else pa.ipc.new_stream(sink, table.schema)
+    header = True
+
+    for start in range(0, len(table), chunk_rows):
+        part = table.slice(start, chunk_rows)
+
+        if filters or predicates:
+            part = part.filter(pa.array(export_mask(part, filters, predicates)))
+
+        if len(part) == 0 and sink.tell() == 0:
+            continue
+
+        if writer is None:
+            text = part.to_pandas().to_csv(index = False, header = header)
+            sink.write(text.encode())
+            header = False
+        else:
+            writer.write_table(part)
+
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+
+    if writer is None and header:
+        sink.write(table.schema.empty_table().to_pandas().to_csv(index = False).encode())
+    elif writer is not None:
+        writer.close()
+
+    if sink.tell():
+        yield sink.getvalue()
+
+
+@server.route('/export/incidents.<file_format>')
+def export_incidents(file_format):
+    """
+    Download the cleaned incidents matching the query string filters as csv or an arrow stream
+    The body is a chunked generator response; with threaded workers (see Procfile) several
+    downloads run at once without holding back the dashboard callbacks
+
+    Parameters:
+    -----------
+    file_format: str ('csv' or 'arrow')
+
+    Returns:
+    response: flask streaming response
+    """
+
+    if file_format not in export_formats:
+        abort(404)
+
+    try:
+        filters, filter_query = export_filters(request.args)
+    except ValueError:
+        abort(400)
+
+    response = Response(export_chunks(filters, filter_query, file_format), mimetype = export_formats[file_format])
+    response.headers['Content-Disposition'] = f'attachment; filename=incidents.{file_format}'
+
+    return response
+
+
+if __name__ == '__main__':
+    print('This is the data export file')
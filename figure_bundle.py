@@ -0,0 +1,119 @@
+import os
+import json
+import plotly
+from dash import dcc
+import sys
+sys.path.insert(1, './data')
+from data_cleaning_functions import data_signature #type:ignore
+
+bundle_version = 2
+bundle_path = './data/cleaned_data/figure_bundle.json'
+
+# Every module the figure generators and their data sources run, a change to any of them
+# invalidates the bundle
+bundle_code_paths = [
+    './dashboard_functions.py',
+    './figure_registry.py',
+    './query_engine.py',
+    './gun_analytics.py',
+    './time_series.py',
+    './bitmap_index.py',
+    './out_of_core.py',
+    './data/data_cleaning_functions.py'
+]
+
+
+def bundle_signature():
+    """
+    Signature of the cleaned data and of the code of the figure generators the bundle is
+    built from (see data_cleaning_functions.data_signature)
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    signature: str
+    """
+
+    signature = data_signature(bundle_version, bundle_code_paths)
+
+    return signature
+
+
+def figure_bundle_save(figures):
+    """
+    Serialize every dashboard figure into the versioned bundle file, replacing the previous
+    bundle in a single rename
+
+    Parameters:
+    -----------
+    figures: dict of name -> dcc.Graph
+
+    Returns:
+    None
+    """
+
+    bundle = {
+        'version': bundle_version,
+        'signature': bundle_signature(),
+        'figures': {name: figure.to_plotly_json()['props'] for name, figure in figures.items()}
+    }
+
+    temporary_path = f'{bundle_path}.{os.getpid()}.tmp'
+
+    with open(temporary_path, 'w') as bundle_file:
+        json.dump(bundle, bundle_file, cls = plotly.utils.PlotlyJSONEncoder)
+
+    os.replace(temporary_path, bundle_path)
+
+    return None
+
+
+def figure_bundle_reader():
+    """
+    Load the dashboard figures from the bundle file
+    Returns None when the bundle is missing, was written by another bundle version or
+    no longer matches the data files it was built from
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    figures: dict of name -> dcc.Graph
+    """
+
+    if not os.path.exists(bundle_path):
+        return None
+
+    with open(bundle_path) as bundle_file:
+        bundle = json.load(bundle_file)
+
+    if bundle['version'] != bundle_version:
+        return None
+
+    signature = bundle_signature()
+
+    if signature is not None and bundle['signature'] != signature:
+        return None
+
+    figures = {name: dcc.Graph(**props) for name, props in bundle['figures'].items()}
+
+    return figures
+
+
+def figure_bundle_build():
+    """
+    Generate every dashboard figure from the cleaned data and save the bundle
+    """
+
+    from figure_registry import figure_sources, figure_generate
+
+    figure_bundle_save({name: figure_generate(name) for name in figure_sources})
+
+    return None
+
+
+if __name__ == '__main__':
+    figure_bundle_build()
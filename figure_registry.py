@@ -0,0 +1,439 @@
+import time
+import threading
+from figure_bundle import bundle_signature, figure_bundle_reader, figure_bundle_save
+from result_cache import cache_key, cached_call, cache_clear
+from data_cleaning_functions import data_stamp #type:ignore
+
+figure_sources = {
+    'incident_heatmap': ('heatmap_generator', 'aggregates'),
+    'density_map': ('density_map_generator', 'hex_bins'),
+    'top_states': ('top_states_generator', 'aggregates'),
+    'top_cities': ('top_cities_generator', 'aggregates'),
+    'incidents_per_day': ('incidents_per_day_generator', 'aggregates'),
+    'incidents_per_month': ('incidents_per_month_generator', 'aggregates'),
+    'incidents_per_year': ('incidents_per_year_generator', 'aggregates'),
+    'incidents_time_series': ('incidents_time_series_generator', 'index'),
+    'age_distribution': ('age_distribution_generator', 'index'),
+    'gun_type_distribution': ('gun_type_distribution_generator', 'index'),
+    'gun_count_distribution': ('gun_count_distribution_generator', 'index'),
+    'suspect_gender_distribution': ('suspect_gender_distribution_generator', 'index'),
+    'victim_gender_distribution': ('victim_gender_distribution_generator', 'index')
+}
+
+# Figures replaced by the breakdown of one state when a state of the heatmap is clicked
+drilldown_figures = ['top_cities', 'incidents_per_day', 'incidents_per_month', 'incidents_per_year', 'incidents_time_series']
+
+# Figures redrawn for their zoomed view, with the generator argument the view is passed as
+zoom_figures = {
+    'incidents_time_series': 'x_range',
+    'density_map': 'map_view'
+}
+
+registry_lock = threading.Lock()
+registry_locks = {}
+registry_bundle = None
+registry_sources = {}
+registry_figures = {}
+registry_timings = {}
+registry_state = {'stamp': None, 'signature': None}
+
+
+def registry_lock_get(key):
+    """
+    Lock of one source or figure of the registry, created on first use
+    The global registry_lock is only held to look the lock up, so loading a source or
+    generating a figure never blocks the requests for the others
+
+    Parameters:
+    -----------
+    key: str
+
+    Returns:
+    lock: threading.Lock
+    """
+
+    with registry_lock:
+        lock = registry_locks.setdefault(key, threading.Lock())
+
+    return lock
+
+
+def registry_signature():
+    """
+    Signature of the cleaned data and generator code the registry is loaded from (see
+    figure_bundle.bundle_signature), computed again only when data_stamp() changed
+    When the signature changed (e.g. the data was cleaned again) every loaded source, figure
+    and cached filtered figure is dropped, so they are loaded again from the new data
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    signature: str
+    """
+
+    global registry_bundle
+
+    stamp = data_stamp()
+
+    if stamp == registry_state['stamp']:
+        return registry_state['signature']
+
+    with registry_lock:
+        if stamp != registry_state['stamp']:
+            signature = bundle_signature()
+
+            if registry_state['stamp'] is not None and signature != registry_state['signature']:
+                registry_bundle = None
+                registry_sources.clear()
+                registry_figures.clear()
+                cache_clear()
+
+            registry_state['signature'] = signature
+            registry_state['stamp'] = stamp
+
+    return registry_state['signature']
+
+
+def source_get(source):
+    """
+    Load a data source the first time a figure needs it
+    'cube' only reads the incident data when the cube file is missing, 'aggregates' holds
+    every incident level statistic computed from the cube in one pass, 'index' is the
+    query index over the incident data and its participant table, mapped from the shared
+    column store (built and saved from the incident data when the store is missing or stale),
+    'hex_bins' is the hexagon bin pyramid of the density map
+    In out-of-core mode (DASHBOARD_OUT_OF_CORE set to a chunk size) the incident data is never
+    loaded: 'cube_index' is the query index over the aggregate cube that answers every
+    'aggregates' figure, 'chunks' the query indexes of the chunks of the cleaned data, saved
+    once and mapped from disk, and 'out_of_core' (in place of 'index') the statistics merged
+    over the chunks; 'hex_bins' is built from the chunks when the pyramid file is missing
+    Each source is loaded under its own lock, checked again once the lock is held
+
+    Parameters:
+    -----------
+    source: str ('data', 'cube', 'cube_index', 'aggregates', 'index', 'hex_bins', 'chunks' or 'out_of_core')
+
+    Returns:
+    data: dataframe, incident aggregates or query index
+    """
+
+    import dashboard_functions
+    import query_engine
+    import column_store
+    import out_of_core
+
+    if out_of_core.out_of_core_chunksize and source == 'index':
+        source = 'out_of_core'
+
+    if source in registry_sources:
+        return registry_sources[source]
+
+    with registry_lock_get('source/' + source):
+        if source not in registry_sources:
+            start = time.perf_counter()
+
+            if source == 'data':
+                registry_sources['data'] = dashboard_functions.cleaned_data_reader()
+            elif source == 'index':
+                index = column_store.column_store_reader()
+
+                if index is None:
+                    data = source_get('data')
+                    column_store.column_store_save(query_engine.query_index_builder(data, dashboard_functions.participant_table_reader()))
+                    index = column_store.column_store_reader()
+
+                registry_sources['index'] = index
+            elif source == 'chunks':
+                registry_sources['chunks'] = out_of_core.chunk_stores_get(out_of_core.out_of_core_chunksize)
+            elif source == 'out_of_core':
+                registry_sources['out_of_core'] = out_of_core.out_of_core_aggregates(source_get('chunks'))
+            elif source == 'cube_index':
+                cube = source_get('cube')
+                registry_sources['cube_index'] = query_engine.query_index_builder(cube[dashboard_functions.cube_dimensions + dashboard_functions.cube_measures], bitmaps = False)
+            elif source == 'aggregates':
+                registry_sources['aggregates'] = dashboard_functions.incident_aggregates(source_get('cube_index' if out_of_core.out_of_core_chunksize else 'cube'))
+            elif source == 'hex_bins' and out_of_core.out_of_core_chunksize:
+                registry_sources['hex_bins'] = out_of_core.out_of_core_hex_pyramid(out_of_core.out_of_core_chunksize)
+            elif source == 'hex_bins':
+                registry_sources['hex_bins'] = dashboard_functions.hex_bins_reader(registry_sources.get('data'))
+            elif out_of_core.out_of_core_chunksize:
+                registry_sources['cube'] = out_of_core.out_of_core_cube(out_of_core.out_of_core_chunksize)
+            else:
+                registry_sources['cube'] = dashboard_functions.cube_reader(registry_sources.get('data'))
+
+            registry_timings['load_' + source] = time.perf_counter() - start
+
+    return registry_sources[source]
+
+
+def figure_generate(name):
+    """
+    Run the generator of a figure on its data source
+
+    Parameters:
+    -----------
+    name: str
+
+    Returns:
+    figure: dcc.Graph
+    """
+
+    import dashboard_functions
+
+    generator, source = figure_sources[name]
+    data = source_get(source)
+
+    start = time.perf_counter()
+    figure = getattr(dashboard_functions, generator)(data)
+    figure.id = name
+    registry_timings[name] = time.perf_counter() - start
+
+    return figure
+
+
+def figure_get(name):
+    """
+    Return a dashboard figure, computing it on first request and memoizing it
+    Figures are taken from the prebuilt bundle when it is fresh; once every figure has been
+    computed the bundle is rewritten so other workers can load them
+    Each figure is generated under its own lock, checked again once the lock is held
+
+    Parameters:
+    -----------
+    name: str
+
+    Returns:
+    figure: dcc.Graph
+    """
+
+    global registry_bundle
+
+    registry_signature()
+
+    if name in registry_figures:
+        return registry_figures[name]
+
+    if registry_bundle is None:
+        with registry_lock_get('bundle'):
+            if registry_bundle is None:
+                registry_bundle = figure_bundle_reader() or {}
+
+    with registry_lock_get('figure/' + name):
+        if name not in registry_figures:
+            if name in registry_bundle:
+                registry_figures[name] = registry_bundle[name]
+
+            else:
+                registry_figures[name] = figure_generate(name)
+
+                if len(registry_figures) == len(figure_sources):
+                    with registry_lock_get('bundle'):
+                        figure_bundle_save(registry_figures)
+
+    return registry_figures[name]
+
+
+def filtered_figure_generate(name, filters, plan, drilldown = None, zoom = None):
+    """
+    Compute a dashboard figure over the incidents matching some filters
+    Every figure is answered from the query index, so a filter change costs array lookups
+    and bincounts rather than a scan and regroup of the incident dataframe. The selection
+    and the incident aggregates are computed once per plan and shared by its figures.
+    In out-of-core mode the 'aggregates' figures are answered from the query index of the
+    aggregate cube and the others from the statistics of the filtered incidents of every
+    mapped chunk, merged once per plan; filtered density maps bin the viewed level and
+    bounds of every chunk
+    A drill-down restricts the figure to one group: its rows are read from the group index
+    of the query index and intersected with the selection, so only that group is aggregated
+    Unfiltered density maps are read from the hexagon bin pyramid, filtered ones are binned
+    from the coordinates of the selection
+
+    Parameters:
+    -----------
+    name: str
+    filters: dict of dimension -> list of allowed values (None selects everything)
+    plan: dict (shared by the figures of one request, filled on first use)
+    drilldown: tuple of (dimension, value) (optional, e.g. ('state_code', 'CA'))
+    zoom: hashable (optional, the zoomed view of a zoom figure, see zoom_figures)
+
+    Returns:
+    figure: dcc.Graph
+    """
+
+    import dashboard_functions
+    import query_engine
+    import out_of_core
+
+    generator, source = figure_sources[name]
+    options = {zoom_figures[name]: zoom} if zoom is not None else {}
+
+    if drilldown is not None:
+        figure = drilldown_figure_generate(name, filters, plan, drilldown, options)
+        figure.id = name
+
+        return figure
+
+    if out_of_core.out_of_core_chunksize:
+        if source == 'aggregates':
+            if 'aggregates' not in plan:
+                cube = source_get('cube_index')
+                plan['aggregates'] = dashboard_functions.incident_aggregates(cube, query_engine.query_selection(cube, filters))
+
+            figure = getattr(dashboard_functions, generator)(plan['aggregates'], **options)
+
+        elif source == 'hex_bins':
+            bins = out_of_core.out_of_core_hex_bins(source_get('chunks'), filters, zoom) if filters else source_get('hex_bins')
+            figure = getattr(dashboard_functions, generator)(bins, **options)
+
+        else:
+            if 'out_of_core' not in plan:
+                plan['out_of_core'] = out_of_core.out_of_core_aggregates(source_get('chunks'), filters) if filters else source_get('out_of_core')
+
+            figure = getattr(dashboard_functions, generator)(plan['out_of_core'], **options)
+
+        figure.id = name
+
+        return figure
+
+    if source == 'hex_bins' and not filters:
+        figure = getattr(dashboard_functions, generator)(source_get('hex_bins'), **options)
+        figure.id = name
+
+        return figure
+
+    index = source_get('index')
+
+    if 'selection' not in plan:
+        plan['selection'] = query_engine.query_selection(index, filters)
+
+    if source == 'aggregates':
+        if 'aggregates' not in plan:
+            plan['aggregates'] = dashboard_functions.incident_aggregates(index, plan['selection'])
+
+        figure = getattr(dashboard_functions, generator)(plan['aggregates'], **options)
+
+    else:
+        figure = getattr(dashboard_functions, generator)(index, plan['selection'], **options)
+
+    figure.id = name
+
+    return figure
+
+
+def drilldown_figure_generate(name, filters, plan, drilldown, options = None):
+    """
+    Compute a figure over the filtered incidents of one drill-down group, titled with the group
+
+    Parameters:
+    -----------
+    name: str (one of drilldown_figures)
+    filters: dict of dimension -> list of allowed values (None selects everything)
+    plan: dict (shared by the figures of one request, filled on first use)
+    drilldown: tuple of (dimension, value)
+    options: dict (optional, keyword arguments of the generator)
+
+    Returns:
+    figure: dcc.Graph
+    """
+
+    import dashboard_functions
+    import query_engine
+    import out_of_core
+
+    generator, source = figure_sources[name]
+    dimension, value = drilldown
+
+    if 'drilldown_aggregates' not in plan:
+        if out_of_core.out_of_core_chunksize:
+            allowed = [value] if not filters.get(dimension) or value in filters[dimension] else []
+            cube = source_get('cube_index')
+
+            plan['drilldown_filters'] = dict(filters, **{dimension: allowed})
+            plan['drilldown_aggregates'] = dashboard_functions.incident_aggregates(cube, query_engine.query_selection(cube, plan['drilldown_filters']))
+
+        else:
+            index = source_get('index')
+
+            if 'selection' not in plan:
+                plan['selection'] = query_engine.query_selection(index, filters)
+
+            plan['drilldown_rows'] = query_engine.group_rows(index, dimension, value, plan['selection'])
+            plan['drilldown_aggregates'] = dashboard_functions.incident_aggregates(index, plan['drilldown_rows'])
+
+    if source == 'aggregates':
+        figure = getattr(dashboard_functions, generator)(plan['drilldown_aggregates'], **(options or {}))
+    elif out_of_core.out_of_core_chunksize:
+        if 'drilldown_out_of_core' not in plan:
+            plan['drilldown_out_of_core'] = out_of_core.out_of_core_aggregates(source_get('chunks'), plan['drilldown_filters'])
+
+        figure = getattr(dashboard_functions, generator)(plan['drilldown_out_of_core'], **(options or {}))
+    else:
+        figure = getattr(dashboard_functions, generator)(source_get('index'), plan['drilldown_rows'], **(options or {}))
+
+    figure.figure['layout'].title.text = f"{figure.figure['layout'].title.text} - {value}"
+
+    return figure
+
+
+def filtered_figures_get(names, filters, drilldown = None, zooms = None):
+    """
+    Return filtered dashboard figures from the LRU result cache, computing the misses together
+    Filters that allow every value of their dimension are dropped first so that, e.g., the
+    full year range and no year filter share a cache entry. The drill-down only applies to
+    drilldown_figures and the zoomed views to zoom_figures, the other figures keep their
+    filtered entries
+
+    Parameters:
+    -----------
+    names: list of str
+    filters: dict of dimension -> list of allowed values (None selects everything)
+    drilldown: tuple of (dimension, value) (optional, e.g. ('state_code', 'CA'))
+    zooms: dict of figure name -> zoomed view (optional, e.g.
+           {'incidents_time_series': ('2016-01-01', '2016-03-31'), 'density_map': (3, (-88, -87, 41, 42), 8.0)})
+
+    Returns:
+    figures: list of dcc.Graph
+    """
+
+    import out_of_core
+
+    registry_signature()
+
+    index = source_get('cube_index' if out_of_core.out_of_core_chunksize else 'index')
+    categories = {dimension: set(index[dimension + '_categories']) for dimension in filters}
+
+    filters = {
+        dimension: values for dimension, values in filters.items()
+        if values and not (dimension in categories and categories[dimension].issubset(values))
+    }
+
+    plan = {}
+    figures = []
+
+    for name in names:
+        name_drilldown = drilldown if name in drilldown_figures else None
+        name_zoom = (zooms or {}).get(name) if name in zoom_figures else None
+        key = cache_key(name, filters, (name_drilldown, name_zoom))
+
+        figures.append(cached_call(key, filtered_figure_generate, name, filters, plan, name_drilldown, name_zoom))
+
+    return figures
+
+
+def figure_registry_timings():
+    """
+    Seconds spent loading each data source and generating each figure in this process
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    timings: dict
+    """
+
+    timings = dict(registry_timings)
+
+    return timings
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import sys
+sys.path.insert(1, './data')
+from data_cleaning_functions import gun_categories #type:ignore
+
+gun_count_labels = [1.0, 2.0, 3.0, 4.0, '5+']
+
+
+def gun_index_builder(data, participants):
+    """
+    Index the guns of every incident once, at load time
+    Guns are already coded into gun_categories by the participant table (-1 when unmapped),
+    each one is stored with the position of its incident. n_guns_involved is kept as int16
+    with -1 for missing values
+
+    Parameters:
+    -----------
+    data: dataframe
+    participants: dict of np arrays (participant table, with gun_offsets and gun_category)
+
+    Returns:
+    guns: dict of np arrays (gun_category, gun_categories, gun_incidents, n_guns_involved)
+    """
+
+    guns = {
+        'gun_category': participants['gun_category'],
+        'gun_categories': pd.Index(gun_categories),
+        'gun_incidents': np.repeat(np.arange(len(data), dtype = 'int32'), np.diff(participants['gun_offsets'])),
+        'n_guns_involved': data['n_guns_involved'].fillna(-1).to_numpy(dtype = 'int16')
+    }
+
+    return guns
+
+
+def group_codes(index, by):
+    """
+    Codes and categories of the grouping dimension, or a single group when by is None
+    """
+
+    if by is None:
+        return np.zeros(index['size'], dtype = 'int8'), None
+
+    return index[by], index[by + '_categories']
+
+
+def gun_type_counts(index, selection = None, by = None):
+    """
+    Count the guns of the selected incidents per gun_map category, optionally per group
+
+    Parameters:
+    -----------
+    index: dict (query index)
+    selection: np array of bool (optional)
+    by: str (optional, a query dimension such as 'state' or 'year')
+
+    Returns:
+    counts: df series indexed by category, most common first, zero categories removed
+            (dataframe of groups x categories when by is given; precomputed counts, e.g. from
+            out_of_core_aggregates, are returned as is)
+    """
+
+    if 'gun_type_counts' in index and by is None:
+        return index['gun_type_counts'].copy()
+
+    codes, groups = group_codes(index, by)
+    n_categories = len(index['gun_categories'])
+
+    keep = index['gun_category'] >= 0
+    incident_codes = codes[index['gun_incidents']]
+    keep &= incident_codes >= 0
+
+    if selection is not None:
+        keep &= selection[index['gun_incidents']]
+
+    keys = incident_codes[keep].astype('int64') * n_categories + index['gun_category'][keep]
+    n_groups = 1 if groups is None else len(groups)
+    counts = np.bincount(keys, minlength = n_groups * n_categories).reshape(n_groups, n_categories)
+
+    if groups is None:
+        counts = pd.Series(counts[0], index = index['gun_categories'])
+        counts = counts[counts > 0].sort_values(ascending = False)
+
+        return counts
+
+    counts = pd.DataFrame(counts, index = pd.Index(groups, name = by), columns = index['gun_categories'])
+
+    return counts
+
+
+def gun_count_bins(index, selection = None, by = None):
+    """
+    Count the selected incidents by number of guns involved, binned as gun_count_labels
+    (1, 2, 3, 4 and 5+), optionally per group
+
+    Parameters:
+    -----------
+    index: dict (query index)
+    selection: np array of bool (optional)
+    by: str (optional, a query dimension such as 'state' or 'year')
+
+    Returns:
+    counts: list of int (dataframe of groups x gun_count_labels when by is given; precomputed
+            counts, e.g. from out_of_core_aggregates, are returned as is)
+    """
+
+    if 'gun_count_bins' in index and by is None:
+        return list(index['gun_count_bins'])
+
+    codes, groups = group_codes(index, by)
+    n_bins = len(gun_count_labels)
+
+    n_guns = index['n_guns_involved']
+    keep = (n_guns > 0) & (codes >= 0)
+
+    if selection is not None:
+        keep &= selection
+
+    keys = codes[keep].astype('int64') * n_bins + np.minimum(n_guns[keep], n_bins) - 1
+    n_groups = 1 if groups is None else len(groups)
+    counts = np.bincount(keys, minlength = n_groups * n_bins).reshape(n_groups, n_bins)
+
+    if groups is None:
+        return counts[0].tolist()
+
+    counts = pd.DataFrame(counts, index = pd.Index(groups, name = by), columns = gun_count_labels)
+
+    return counts
+
+
+if __name__ == '__main__':
+    print('This is the gun analytics file')
@@ -0,0 +1,267 @@
+import os
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import brotli
+from flask import request, Response
+
+http_cache_max_bytes = int(os.environ.get('DASHBOARD_HTTP_CACHE_BYTES', 32 * 1024 * 1024))
+
+http_cached_paths = ['/_dash-layout', '/_dash-dependencies']
+http_callback_path = '/_dash-update-component'
+
+http_encodings = ['br', 'gzip']
+
+http_cache_lock = threading.Lock()
+http_cache_entries = OrderedDict()
+http_cache_counters = {'hits': 0, 'not_modified': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+http_cached_outputs = set()
+http_signature = {'function': None, 'value': None}
+
+
+def http_cache_signature():
+    """
+    Signature of the data the responses are built from, as returned by the signature function
+    given to http_cache_install() ('' without one)
+    Every cached response is dropped when it changes, so a data refresh is never answered from
+    responses built before it
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    signature: str
+    """
+
+    if http_signature['function'] is None:
+        return ''
+
+    signature = http_signature['function']() or ''
+
+    if signature != http_signature['value']:
+        http_cache_clear()
+        http_signature['value'] = signature
+
+    return signature
+
+
+def http_cache_key():
+    """
+    Key of the current request when its response can be cached, None otherwise
+    The layout and dependency routes are cached per url; callback requests are cached per
+    request body when every output of the callback is in http_cached_outputs, i.e. when the
+    response depends on nothing but the inputs sent with the request
+    Every key holds the data signature, so responses are never shared across data refreshes
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    key: tuple
+    """
+
+    if request.method == 'GET' and request.path in http_cached_paths:
+        return (http_cache_signature(), 'GET', request.full_path)
+
+    if request.method != 'POST' or request.path != http_callback_path or not http_cached_outputs:
+        return None
+
+    body = request.get_data(cache = True)
+
+    try:
+        output = json.loads(body)['output']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    if not set(output.strip('.').split('...')) <= http_cached_outputs:
+        return None
+
+    key = (http_cache_signature(), 'POST', request.path, hashlib.sha256(body).hexdigest())
+
+    return key
+
+
+def http_entry_build(body, mimetype, signature = ''):
+    """
+    Serialize a response once for every client: the raw body, its brotli and gzip encodings
+    and a strong ETag derived from the data signature and the raw body
+
+    Parameters:
+    -----------
+    body: bytes
+    mimetype: str
+    signature: str (data signature, see http_cache_signature)
+
+    Returns:
+    entry: dict
+    """
+
+    entry = {
+        'etag': hashlib.sha256(signature.encode() + body).hexdigest()[:32],
+        'mimetype': mimetype,
+        'bodies': {
+            'identity': body,
+            'br': brotli.compress(body, quality = 5),
+            'gzip': gzip.compress(body, compresslevel = 6)
+        }
+    }
+    entry['size'] = sum(len(encoded) for encoded in entry['bodies'].values())
+
+    return entry
+
+
+def http_entry_response(entry):
+    """
+    Answer the current request from a cached entry
+    A matching If-None-Match gets an empty 304, otherwise the smallest encoding the client
+    accepts is sent as is, with its ETag so the next request can be conditional
+
+    Parameters:
+    -----------
+    entry: dict
+
+    Returns:
+    response: flask response
+    """
+
+    if entry['etag'] in request.if_none_match:
+        response = Response(status = 304)
+
+        with http_cache_lock:
+            http_cache_counters['not_modified'] += 1
+    else:
+        encoding = next((encoding for encoding in http_encodings if encoding in request.accept_encodings), 'identity')
+
+        response = Response(entry['bodies'][encoding], mimetype = entry['mimetype'])
+
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(entry['etag'])
+    response.headers['Vary'] = 'Accept-Encoding'
+
+    if request.method == 'GET':
+        response.headers['Cache-Control'] = 'no-cache'
+
+    return response
+
+
+def http_cache_before():
+    """
+    Serve cached responses before Dash builds them again
+    """
+
+    key = http_cache_key()
+
+    if key is None:
+        return None
+
+    with http_cache_lock:
+        entry = http_cache_entries.get(key)
+
+        if entry is None:
+            http_cache_counters['misses'] += 1
+            return None
+
+        http_cache_entries.move_to_end(key)
+        http_cache_counters['hits'] += 1
+
+    return http_entry_response(entry)
+
+
+def http_cache_after(response):
+    """
+    Keep the first response to a cacheable request, evicting the least recently used
+    entries past http_cache_max_bytes, and answer it from the new entry
+    Responses served from the cache by http_cache_before() are passed through
+    """
+
+    key = http_cache_key()
+
+    if key is None or key in http_cache_entries or response.status_code != 200 or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+
+    entry = http_entry_build(response.get_data(), response.mimetype, key[0])
+
+    if entry['size'] <= http_cache_max_bytes:
+        with http_cache_lock:
+            if key not in http_cache_entries:
+                http_cache_entries[key] = entry
+                http_cache_counters['bytes'] += entry['size']
+
+            while http_cache_counters['bytes'] > http_cache_max_bytes:
+                _, evicted = http_cache_entries.popitem(last = False)
+                http_cache_counters['bytes'] -= evicted['size']
+                http_cache_counters['evictions'] += 1
+
+    return http_entry_response(entry)
+
+
+def http_cache_install(server, outputs = (), signature = None):
+    """
+    Put the response cache in front of a Dash server
+
+    Parameters:
+    -----------
+    server: flask app
+    outputs: list of str (callback outputs, 'component_id.property', whose responses only
+             depend on the request, e.g. the page router and the filtered figures)
+    signature: function (optional, returns the signature of the data the responses are
+               built from, cheap enough to call on every request)
+
+    Returns:
+    None
+    """
+
+    http_cached_outputs.update(outputs)
+    http_signature['function'] = signature
+
+    server.before_request(http_cache_before)
+    server.after_request(http_cache_after)
+
+    return None
+
+
+def http_cache_statistics():
+    """
+    Hit, 304, miss and eviction counts of the response cache and the bytes it holds
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    statistics: dict
+    """
+
+    with http_cache_lock:
+        statistics = dict(http_cache_counters, entries = len(http_cache_entries), max_bytes = http_cache_max_bytes)
+
+    return statistics
+
+
+def http_cache_clear():
+    """
+    Drop every cached response (called by http_cache_signature() when the data changed)
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    None
+    """
+
+    with http_cache_lock:
+        http_cache_entries.clear()
+        http_cache_counters.update({'hits': 0, 'not_modified': 0, 'misses': 0, 'evictions': 0, 'bytes': 0})
+
+    return None
+
+
+if __name__ == '__main__':
+    print('This is the http response cache file')
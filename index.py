@@ -4,6 +4,9 @@ from dash.dependencies import Input, Output, State
 
 from app import app
 from app import server #not used in file but necessary for heroku deployment
+import data_export #registers the /export routes on the server
+from http_cache import http_cache_install
+from figure_registry import figure_sources, registry_signature
 from apps import home, datapreview, dashboard
 
 
@@ -93,10 +96,13 @@ def display_page(pathname):
     elif pathname == '/data-preview':
         return datapreview.layout
     elif pathname == '/dashboard':
-        return dashboard.layout
+        return dashboard.layout()
     else:
         return error_page
 
 
+http_cache_install(server, ['page-content.children', 'drilldown_label.children'] + [name + '.figure' for name in figure_sources], registry_signature)
+
+
 if __name__ == '__main__':
     app.run_server(debug=True)
\ No newline at end of file
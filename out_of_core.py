@@ -0,0 +1,331 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import sys
+sys.path.insert(1, './data')
+from query_engine import participant_roles, query_index_builder, query_selection, participant_histogram
+from gun_analytics import gun_categories, gun_count_labels, gun_type_counts, gun_count_bins
+from time_series import daily_counts
+from column_store import store_signature, column_store_save, column_store_reader
+from data_cleaning_functions import compact_column_dtypes, cube_dimensions, aggregate_cube_builder, aggregate_cube_merge, hex_bins_builder, hex_bins_merge #type:ignore
+
+out_of_core_chunksize = int(os.environ.get('DASHBOARD_OUT_OF_CORE', 0)) or None
+out_of_core_path = './data/cleaned_data/out_of_core'
+
+
+def chunk_stores_build(chunksize):
+    """
+    Stream the cleaned data once and save the query index of every chunk as its own column
+    store, so later requests map the chunks from disk instead of reading and indexing the
+    cleaned data again. The manifest listing the chunks is written last
+
+    Parameters:
+    -----------
+    chunksize: int
+
+    Returns:
+    paths: list of str
+    """
+
+    import dashboard_functions
+
+    directory = os.path.join(out_of_core_path, str(chunksize))
+
+    shutil.rmtree(directory, ignore_errors = True)
+    os.makedirs(directory)
+
+    paths = []
+
+    for data, participants in dashboard_functions.cleaned_data_chunk_reader(chunksize):
+        paths.append(os.path.join(directory, f'chunk_{len(paths):05d}.bin'))
+        column_store_save(query_index_builder(data, participants), paths[-1])
+
+    with open(os.path.join(directory, 'manifest.json'), 'w') as manifest_file:
+        json.dump({'chunks': [os.path.basename(path) for path in paths]}, manifest_file)
+
+    return paths
+
+
+def chunk_stores_reader(chunksize):
+    """
+    Map the query index of every chunk saved by chunk_stores_build()
+    Returns None if the chunks are missing or any of them is stale
+
+    Parameters:
+    -----------
+    chunksize: int
+
+    Returns:
+    indexes: list of dict (query index of np.memmap views, one per chunk)
+    """
+
+    directory = os.path.join(out_of_core_path, str(chunksize))
+
+    if not os.path.exists(os.path.join(directory, 'manifest.json')):
+        return None
+
+    with open(os.path.join(directory, 'manifest.json')) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    signature = store_signature()
+    indexes = [column_store_reader(os.path.join(directory, name), signature) for name in manifest['chunks']]
+
+    if any(index is None for index in indexes):
+        return None
+
+    return indexes
+
+
+def chunk_stores_get(chunksize):
+    """
+    Map the chunk query indexes, building them first when missing or stale
+    """
+
+    indexes = chunk_stores_reader(chunksize)
+
+    if indexes is None:
+        chunk_stores_build(chunksize)
+        indexes = chunk_stores_reader(chunksize)
+
+    return indexes
+
+
+def out_of_core_cube(chunksize):
+    """
+    Read the aggregate cube saved by the cleaning step
+    If the parquet file is missing, build it by streaming the cleaned data in chunks and
+    merging the cube of every chunk
+
+    Parameters:
+    -----------
+    chunksize: int
+
+    Returns:
+    cube: dataframe
+    """
+
+    import dashboard_functions
+
+    if os.path.exists('./data/cleaned_data/cube.parquet'):
+        return dashboard_functions.cube_reader()
+
+    cubes = [aggregate_cube_builder(data) for data, _ in dashboard_functions.cleaned_data_chunk_reader(chunksize)]
+
+    if not cubes:
+        return aggregate_cube_builder(pd.DataFrame({column: pd.Series(dtype = dtype) for column, dtype in compact_column_dtypes.items()}))
+
+    cube = aggregate_cube_merge(cubes)
+    cube = cube.astype({column: dtype for column, dtype in compact_column_dtypes.items() if column in cube_dimensions})
+
+    return cube
+
+
+def partial_aggregates(index, filters = None):
+    """
+    Compute the dashboard statistics of one chunk of incidents
+    The chunk query index goes through the same kernels as the in-memory path, only the
+    results are kept: per role histograms, gun counts and per day counts, all of a size that
+    does not depend on the number of incidents
+    Grouped incident sums are not computed, they are answered from the aggregate cube, nor
+    hexagon bins, binned for the viewed level and bounds only (see out_of_core_hex_bins)
+
+    Parameters:
+    -----------
+    index: dict (query index of a chunk, see chunk_stores_get)
+    filters: dict of dimension -> list of allowed values (optional)
+
+    Returns:
+    partial: dict
+    """
+
+    selection = query_selection(index, filters) if filters else None
+    gender_histogram = participant_histogram(index, 'gender', selection)
+    first_day, day_counts = daily_counts(index, selection)
+
+    partial = {
+        'histograms': {
+            'age': pd.DataFrame(participant_histogram(index, 'age', selection)),
+            'gender': pd.DataFrame(gender_histogram, columns = index['participants']['gender_categories'][:gender_histogram.shape[1]])
+        },
+        'gun_type_counts': gun_type_counts(index, selection).reindex(index['gun_categories'], fill_value = 0),
+        'gun_count_bins': np.array(gun_count_bins(index, selection)),
+        'daily_counts': pd.Series(day_counts, index = np.arange(first_day, first_day + len(day_counts)))
+    }
+
+    return partial
+
+
+def partial_empty():
+    """
+    Statistics of no incidents, the running totals of an empty chunk list
+    """
+
+    n_roles = len(participant_roles) + 1
+
+    partial = {
+        'histograms': {
+            'age': pd.DataFrame(np.zeros((n_roles, 0), dtype = 'int64')),
+            'gender': pd.DataFrame(np.zeros((n_roles, 0), dtype = 'int64'))
+        },
+        'gun_type_counts': pd.Series(0, index = gun_categories),
+        'gun_count_bins': np.zeros(len(gun_count_labels), dtype = 'int64'),
+        'daily_counts': pd.Series(dtype = 'int64')
+    }
+
+    return partial
+
+
+def partial_merge(merged, partial):
+    """
+    Add the statistics of a chunk to the running totals
+
+    Parameters:
+    -----------
+    merged: dict (running totals, None for the first chunk)
+    partial: dict
+
+    Returns:
+    merged: dict
+    """
+
+    if merged is None:
+        return partial
+
+    for attribute, histogram in partial['histograms'].items():
+        merged['histograms'][attribute] = merged['histograms'][attribute].add(histogram, fill_value = 0)
+
+    merged['gun_type_counts'] = merged['gun_type_counts'].add(partial['gun_type_counts'], fill_value = 0)
+    merged['gun_count_bins'] = merged['gun_count_bins'] + partial['gun_count_bins']
+    merged['daily_counts'] = merged['daily_counts'].add(partial['daily_counts'], fill_value = 0)
+
+    return merged
+
+
+def aggregates_finalize(merged):
+    """
+    Convert the merged totals into the form the generators accept
+    Histograms become arrays over ages / the gender dictionary, gun counts are sorted and
+    per day counts are spread over the full date range
+    Totals of no chunks at all (merged is None) give empty statistics
+
+    Parameters:
+    -----------
+    merged: dict (None when there were no chunks)
+
+    Returns:
+    aggregates: dict (accepted by every *_generator of an 'index' figure in place of the data)
+    """
+
+    if merged is None:
+        merged = partial_empty()
+
+    age_histogram = merged['histograms']['age']
+    age_histogram = age_histogram.reindex(columns = range(int(age_histogram.columns.max()) + 1 if len(age_histogram.columns) else 0), fill_value = 0)
+    gender_histogram = merged['histograms']['gender']
+
+    aggregates = {
+        'histograms': {
+            'age': age_histogram.to_numpy(dtype = 'int64'),
+            'gender': gender_histogram.to_numpy(dtype = 'int64')
+        },
+        'participants': {'gender_categories': np.array(gender_histogram.columns, dtype = str)}
+    }
+
+    gun_counts = merged['gun_type_counts'].astype('int64')
+    aggregates['gun_type_counts'] = gun_counts[gun_counts > 0].sort_values(ascending = False)
+    aggregates['gun_count_bins'] = merged['gun_count_bins'].tolist()
+
+    day_counts = merged['daily_counts']
+
+    if len(day_counts):
+        day_counts = day_counts.reindex(range(int(day_counts.index.min()), int(day_counts.index.max()) + 1), fill_value = 0)
+        aggregates['daily_counts'] = (int(day_counts.index[0]), day_counts.to_numpy(dtype = 'int64'))
+    else:
+        aggregates['daily_counts'] = (0, np.zeros(0, dtype = 'int64'))
+
+    return aggregates
+
+
+def out_of_core_aggregates(indexes, filters = None):
+    """
+    Compute the participant, gun and per day statistics of the dashboard over the
+    query indexes of the chunks and merge the partial results, so memory is bounded by the
+    chunk size rather than the number of incidents. The chunks are mapped from disk once
+    and reused by every filter. Gives the same numbers as the in-memory path
+
+    Parameters:
+    -----------
+    indexes: list of dict (query index of every chunk, see chunk_stores_get)
+    filters: dict of dimension -> list of allowed values (optional)
+
+    Returns:
+    aggregates: dict (accepted by every *_generator of an 'index' figure in place of the data)
+    """
+
+    merged = None
+
+    for index in indexes:
+        merged = partial_merge(merged, partial_aggregates(index, filters))
+
+    aggregates = aggregates_finalize(merged)
+
+    return aggregates
+
+
+def out_of_core_hex_bins(indexes, filters = None, map_view = None):
+    """
+    Bin the filtered incidents of every chunk for one density map view: at its zoom level
+    alone and within its bounds, so each chunk only yields the hexagons shown. The bins of
+    all the chunks are merged once, at the end
+
+    Parameters:
+    -----------
+    indexes: list of dict (query index of every chunk, see chunk_stores_get)
+    filters: dict of dimension -> list of allowed values (optional)
+    map_view: tuple of (level, bounds, scale) (optional, see density_map_generator)
+
+    Returns:
+    bins: dataframe of level, q, r, count, n_killed, n_injured
+    """
+
+    import dashboard_functions
+
+    bins = [
+        dashboard_functions.hex_bins_view(index, query_selection(index, filters) if filters else None, map_view)
+        for index in indexes
+    ]
+
+    bins = hex_bins_merge(bins) if bins else hex_bins_builder({})
+
+    return bins
+
+
+def out_of_core_hex_pyramid(chunksize):
+    """
+    Read the hexagon bin pyramid saved by the cleaning step
+    If the parquet file is missing, bin every level of the mapped chunks and merge the bins
+    of all the chunks once, at the end
+
+    Parameters:
+    -----------
+    chunksize: int
+
+    Returns:
+    bins: dataframe of level, q, r, count, n_killed, n_injured
+    """
+
+    import dashboard_functions
+
+    if os.path.exists('./data/cleaned_data/hex_bins.parquet'):
+        return dashboard_functions.hex_bins_reader()
+
+    bins = [hex_bins_builder(index) for index in chunk_stores_get(chunksize)]
+    bins = hex_bins_merge(bins) if bins else hex_bins_builder({})
+
+    return bins
+
+
+if __name__ == '__main__':
+    print('This is the out-of-core aggregation file')
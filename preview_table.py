@@ -0,0 +1,403 @@
+import os
+import re
+import threading
+import functools
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import sys
+sys.path.insert(1, './data')
+from data_cleaning_functions import data_signature, list_column_format #type:ignore
+
+preview_version = 3
+preview_path = './data/cleaned_data/preview_table.arrow'
+
+preview_source_paths = [
+    './data/cleaned_data/cleaned_data_1.csv',
+    './data/cleaned_data/cleaned_data_2.csv'
+]
+
+preview_parquet_path = './data/cleaned_data/cleaned_data.parquet'
+
+preview_columns = [
+    'date',
+    'state',
+    'city_or_county',
+    'n_killed',
+    'n_injured',
+    'gun_type',
+    'latitude',
+    'longitude',
+    'n_guns_involved',
+    'participant_age',
+    'participant_gender',
+    'participant_status',
+    'participant_type',
+    'state_code',
+    'weekday',
+    'month',
+    'year'
+]
+
+preview_numeric_columns = ['n_killed', 'n_injured', 'latitude', 'longitude', 'n_guns_involved', 'year']
+
+preview_float_columns = ['latitude', 'longitude', 'n_guns_involved']
+
+preview_column_types = {
+    column: pa.float64() if column in preview_float_columns else pa.int16() if column in preview_numeric_columns else pa.string()
+    for column in preview_columns
+}
+
+filter_operators = {
+    '=': 'eq', 'eq': 'eq',
+    '!=': 'ne', 'ne': 'ne',
+    '<': 'lt', 'lt': 'lt',
+    '<=': 'le', 'le': 'le',
+    '>': 'gt', 'gt': 'gt',
+    '>=': 'ge', 'ge': 'ge',
+    'contains': 'contains',
+    'datestartswith': 'datestartswith'
+}
+
+filter_pattern = re.compile(r'^\{(?P<column>[^}]+)\}\s+(?P<case>[si]?)(?P<operator>!=|<=|>=|=|<|>|eq|ne|lt|le|gt|ge|contains|datestartswith)\s+(?P<value>.+)$')
+
+preview_lock = threading.Lock()
+preview_state = {'table': None, 'stamp': None}
+
+
+def preview_signature():
+    """
+    Signature of the cleaned data the preview table is built from (see
+    data_cleaning_functions.data_signature)
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    signature: str
+    """
+
+    signature = data_signature(preview_version)
+
+    return signature
+
+
+def preview_source_reader():
+    """
+    Read the cleaned data as an arrow table in the form the preview shows it
+    The csv files are read as is (list columns stay the strings written by data_save), the
+    parquet file is only used when they are missing and its list columns are formatted the same way
+    Columns missing from data cleaned by an older version (e.g. the coordinates) are read as nulls
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    table: arrow table
+    """
+
+    if all(os.path.exists(path) for path in preview_source_paths):
+        convert_options = pv.ConvertOptions(column_types = preview_column_types, include_columns = preview_columns, include_missing_columns = True, strings_can_be_null = True)
+        tables = [pv.read_csv(path, convert_options = convert_options) for path in preview_source_paths]
+
+        return pa.concat_tables(tables)
+
+    table = pq.read_table(preview_parquet_path)
+    columns = []
+
+    for column in preview_columns:
+        if column not in table.column_names:
+            columns.append(pa.nulls(len(table), type = preview_column_types[column]))
+            continue
+
+        values = table[column]
+
+        if pa.types.is_list(values.type):
+            values = pa.array(list_column_format(values), type = pa.string(), from_pandas = True)
+
+        columns.append(values.cast(preview_column_types[column]))
+
+    table = pa.table(columns, names = preview_columns)
+
+    return table
+
+
+def preview_table_save(path = preview_path):
+    """
+    Write the preview table: every cleaned column plus, for each column, the row order that
+    sorts it ascending (nulls last) and, in the schema metadata, how many null or NaN rows end
+    that order. Sorting a page request is then a lookup of the stored order instead of a sort of
+    the whole data. Columns are stored as single chunks so taking the rows of
+    a page is a direct lookup
+
+    Parameters:
+    -----------
+    path: str
+
+    Returns:
+    None
+    """
+
+    table = preview_source_reader().combine_chunks()
+    metadata = {'version': str(preview_version), 'signature': preview_signature() or ''}
+
+    for column in preview_columns:
+        order = pc.sort_indices(table, sort_keys = [(column, 'ascending')])
+        table = table.append_column('sort/' + column, order.cast(pa.int32()))
+
+        nulls = table[column].null_count
+
+        if column in preview_float_columns:
+            nulls += pc.sum(pc.fill_null(pc.is_nan(table[column]), False)).as_py() or 0
+
+        metadata['nulls/' + column] = str(nulls)
+
+    table = table.replace_schema_metadata(metadata)
+
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+
+    with pa.OSFile(temporary_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    os.replace(temporary_path, path)
+
+    return None
+
+
+def preview_table_reader(path = preview_path):
+    """
+    Map the preview table read only, zero copy, so every worker shares one copy in the page cache
+    Returns None if the file is missing, of another version or stale
+
+    Parameters:
+    -----------
+    path: str
+
+    Returns:
+    table: arrow table
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    metadata = table.schema.metadata or {}
+
+    if metadata.get(b'version') != str(preview_version).encode():
+        return None
+
+    signature = preview_signature()
+
+    if signature is not None and metadata.get(b'signature') != signature.encode():
+        return None
+
+    return table
+
+
+def preview_table_stamp(path = preview_path):
+    """
+    Size and modification time of the preview table file, None when it is missing
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    stat = os.stat(path)
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+def preview_table_get():
+    """
+    Return the preview table, mapping it on first use or when the file was rebuilt since it was
+    mapped, and building it when missing or stale
+    """
+
+    with preview_lock:
+        if preview_state['table'] is None or preview_state['stamp'] != preview_table_stamp():
+            table = preview_table_reader()
+
+            if table is None:
+                preview_table_save()
+                table = preview_table_reader()
+
+            preview_state['table'] = table
+            preview_state['stamp'] = preview_table_stamp()
+
+    return preview_state['table']
+
+
+def filter_value(value):
+    """
+    Strip the quotes around a filter value and convert unquoted numbers
+    """
+
+    value = value.strip()
+
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'`':
+        return value[1:-1].replace('\\' + value[0], value[0])
+
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+@functools.lru_cache(maxsize = 256)
+def filter_query_compile(filter_query):
+    """
+    Parse a DataTable filter query ('{state} contains Cal && {n_killed} >= 2') into predicates
+    Parsing is cached per query string, so paging through the same filter never parses it again
+    Unknown columns and clauses that cannot be parsed are ignored, like the DataTable does
+
+    Parameters:
+    -----------
+    filter_query: str
+
+    Returns:
+    predicates: tuple of (column, operator, case sensitive, value)
+    """
+
+    predicates = []
+
+    for clause in (filter_query or '').split(' && '):
+        match = filter_pattern.match(clause.strip())
+
+        if match is None or match['column'] not in preview_columns:
+            continue
+
+        predicates.append((match['column'], filter_operators[match['operator']], match['case'] != 'i', filter_value(match['value'])))
+
+    return tuple(predicates)
+
+
+def predicate_mask(table, column, operator, case_sensitive, value):
+    """
+    Evaluate one predicate over a whole column with arrow compute kernels
+
+    Parameters:
+    -----------
+    table: arrow table
+    column: str
+    operator: str
+    case_sensitive: bool
+    value: str or float
+
+    Returns:
+    mask: np array of bool (False for null values)
+    """
+
+    values = table[column]
+    numeric = column in preview_numeric_columns
+
+    if operator in ('contains', 'datestartswith'):
+        if numeric:
+            values = pc.cast(values, pa.string())
+            value = f'{value:g}' if isinstance(value, float) else value
+
+        function = pc.match_substring if operator == 'contains' else pc.starts_with
+        mask = function(values, pattern = str(value), ignore_case = not case_sensitive)
+
+    else:
+        if numeric != isinstance(value, float):
+            if numeric:
+                return np.zeros(len(table), dtype = bool)
+
+            value = f'{value:g}'
+
+        if not numeric and not case_sensitive:
+            values, value = pc.utf8_lower(values), value.lower()
+
+        comparisons = {'eq': pc.equal, 'ne': pc.not_equal, 'lt': pc.less, 'le': pc.less_equal, 'gt': pc.greater, 'ge': pc.greater_equal}
+        mask = comparisons[operator](values, pa.scalar(value))
+
+    mask = pc.fill_null(mask, False).to_numpy()
+
+    return mask
+
+
+@functools.lru_cache(maxsize = 32)
+def preview_positions(filter_query, sort_by, stamp):
+    """
+    Rows of the preview table matching a filter query, in display order
+    Masks of the compiled predicates are and-ed over the whole table; a single sort column
+    reuses its stored ascending order (its non-null part reversed for descending, so nulls stay
+    last as in pc.sort_indices), several columns are sorted on the matching rows only. Cached per
+    (filter, sort) of the mapped table file, so turning pages is a slice and a rebuilt table is
+    never answered with the positions of the previous one
+
+    Parameters:
+    -----------
+    filter_query: str
+    sort_by: tuple of (column, direction)
+    stamp: tuple (preview_table_stamp() of the mapped table)
+
+    Returns:
+    positions: np array of int
+    """
+
+    table = preview_table_get()
+    mask = None
+
+    for predicate in filter_query_compile(filter_query):
+        predicate_result = predicate_mask(table, *predicate)
+        mask = predicate_result if mask is None else mask & predicate_result
+
+    if len(sort_by) == 1:
+        column, direction = sort_by[0]
+        order = table['sort/' + column].to_numpy()
+
+        if direction == 'desc':
+            non_null = len(order) - int(table.schema.metadata[('nulls/' + column).encode()])
+            order = np.concatenate([order[:non_null][::-1], order[non_null:]])
+
+        positions = order if mask is None else order[mask[order]]
+
+    else:
+        positions = np.arange(len(table)) if mask is None else np.flatnonzero(mask)
+
+        if sort_by:
+            sort_keys = [(column, 'descending' if direction == 'desc' else 'ascending') for column, direction in sort_by]
+            positions = positions[pc.sort_indices(table.take(positions).select([column for column, _ in sort_by]), sort_keys = sort_keys).to_numpy()]
+
+    return positions
+
+
+def preview_page(page_current, page_size, sort_by = None, filter_query = ''):
+    """
+    Rows of one DataTable page with backend paging, sorting and filtering
+    Only the visible rows are taken from the mapped table and converted to records
+
+    Parameters:
+    -----------
+    page_current: int
+    page_size: int
+    sort_by: list of dict (DataTable sort_by, {'column_id': ..., 'direction': 'asc' or 'desc'})
+    filter_query: str (DataTable filter_query)
+
+    Returns:
+    records: list of dict
+    page_count: int
+    """
+
+    sort_by = tuple((sort['column_id'], sort['direction']) for sort in sort_by or [] if sort['column_id'] in preview_columns)
+    table = preview_table_get()
+    positions = preview_positions(filter_query or '', sort_by, preview_state['stamp'])
+
+    page_count = max(1, -(-len(positions) // page_size))
+    page_current = min(page_current or 0, page_count - 1)
+
+    page_positions = positions[page_current * page_size:(page_current + 1) * page_size]
+    records = table.select(preview_columns).take(pa.array(page_positions)).to_pylist()
+
+    return records, page_count
+
+
+if __name__ == '__main__':
+    preview_table_save()
+    print(f'Preview table written to {preview_path}')
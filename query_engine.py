@@ -0,0 +1,330 @@
+import numpy as np
+import pandas as pd
+import sys
+sys.path.insert(1, './data')
+from bitmap_index import bitmap_dimensions, bitmap_index_builder, bitmap_query, bitmap_selection
+from gun_analytics import gun_index_builder
+from time_series import day_index_builder
+from data_cleaning_functions import cube_measures #type:ignore
+
+participant_roles = ['Victim', 'Suspect']
+
+query_dimensions = [
+    'state',
+    'state_code',
+    'city_or_county',
+    'year',
+    'month',
+    'weekday'
+]
+
+group_dimensions = ['state_code']
+
+
+def query_index_builder(data, participants = None, bitmaps = True):
+    """
+    Build an indexed, column oriented view of the data for fast filtered aggregation
+    Every dimension is stored as integer codes plus its categories, so filters become
+    array lookups and groupbys become bincounts instead of dataframe scans
+
+    Parameters:
+    -----------
+    data: dataframe (aggregate cube or incidents)
+    participants: dict of np arrays (optional, participant table of the incidents, its guns
+                  are indexed with gun_index_builder)
+    bitmaps: bool (build the bitmap index used by query_selection and the group index used
+             by group_rows)
+
+    Returns:
+    index: dict
+    """
+
+    index = {'size': len(data)}
+
+    for dimension in query_dimensions:
+        column = data[dimension]
+
+        if column.dtype.name != 'category':
+            column = column.astype('category')
+
+        index[dimension] = column.cat.codes.to_numpy()
+        index[dimension + '_categories'] = column.cat.categories
+
+    if bitmaps:
+        index['bitmaps'] = bitmap_index_builder(index)
+
+        for dimension in group_dimensions:
+            index[dimension + '_group_order'], index[dimension + '_group_offsets'] = group_index_builder(index[dimension], len(index[dimension + '_categories']))
+
+    index['count'] = data['count'].to_numpy() if 'count' in data else np.ones(len(data), dtype = 'int32')
+    index['n_killed'] = data['n_killed'].to_numpy()
+    index['n_injured'] = data['n_injured'].to_numpy()
+
+    if participants is not None:
+        index['participants'] = {name: array for name, array in participants.items() if not name.startswith('gun_')}
+        index['participant_incidents'] = participant_incidents(participants)
+        index['participant_role'] = participant_role_codes(participants)
+
+        if 'gun_category' in participants:
+            index.update(gun_index_builder(data, participants))
+
+    if 'date' in data:
+        index.update(day_index_builder(data))
+
+    if 'latitude' in data:
+        index['latitude'] = data['latitude'].to_numpy(dtype = 'float32')
+        index['longitude'] = data['longitude'].to_numpy(dtype = 'float32')
+
+    return index
+
+
+def query_selection(index, filters):
+    """
+    Select the rows matching every filter
+    Values within a filter are OR'ed, filters are AND'ed, a filter of None selects everything.
+    Filters on the bitmap dimensions are answered from the bitmap index (when the index has
+    one), other dimensions by a code lookup. A ('and' | 'or', [predicates]) tuple is evaluated
+    on the bitmap index only
+
+    Parameters:
+    -----------
+    index: dict
+    filters: dict of dimension -> list of allowed values, or bitmap predicate tuple
+
+    Returns:
+    selection: np array of bool
+    """
+
+    if not isinstance(filters, dict):
+        return bitmap_selection(index['bitmaps'], bitmap_query(index['bitmaps'], filters))
+
+    bitmap_filters = {dimension: values for dimension, values in filters.items() if dimension in bitmap_dimensions and 'bitmaps' in index}
+    selection = bitmap_selection(index['bitmaps'], bitmap_query(index['bitmaps'], bitmap_filters)) if bitmap_filters else np.ones(index['size'], dtype = bool)
+
+    for dimension, values in filters.items():
+        if values is None or dimension in bitmap_filters:
+            continue
+
+        positions = index[dimension + '_categories'].get_indexer(values)
+
+        allowed = np.zeros(len(index[dimension + '_categories']) + 1, dtype = bool)
+        allowed[positions[positions >= 0]] = True
+
+        selection &= allowed[index[dimension]]
+
+    return selection
+
+
+def group_index_builder(codes, n_groups):
+    """
+    Group the rows of a dimension once, at load time
+    The row positions are stably sorted by code, so the rows of group g are the contiguous
+    range order[offsets[g]:offsets[g + 1]], in row order. Rows with a missing code are left out
+
+    Parameters:
+    -----------
+    codes: np array of int (codes of the dimension)
+    n_groups: int (number of categories of the dimension)
+
+    Returns:
+    order: np array of int32
+    offsets: np array of int64 (n_groups + 1)
+    """
+
+    order = np.argsort(codes, kind = 'stable').astype('int32')
+    order = order[np.count_nonzero(codes < 0):]
+
+    offsets = np.zeros(n_groups + 1, dtype = 'int64')
+    offsets[1:] = np.cumsum(np.bincount(codes[codes >= 0], minlength = n_groups))
+
+    return order, offsets
+
+
+def group_rows(index, dimension, value, selection = None):
+    """
+    Positions of the rows of one group from the group index, without scanning the dimension
+    An unknown value selects no rows
+
+    Parameters:
+    -----------
+    index: dict
+    dimension: str (one of group_dimensions)
+    value: category of the dimension (e.g. 'CA')
+    selection: np array of bool (optional, only the selected rows of the group are kept)
+
+    Returns:
+    rows: np array of int32 (row positions, accepted by query_aggregates as a selection)
+    """
+
+    group = index[dimension + '_categories'].get_indexer([value])[0]
+
+    if group < 0:
+        return np.zeros(0, dtype = 'int32')
+
+    offsets = index[dimension + '_group_offsets']
+    rows = index[dimension + '_group_order'][offsets[group]:offsets[group + 1]]
+
+    if selection is not None:
+        rows = rows[selection[rows]]
+
+    return rows
+
+
+def query_aggregate(index, by, selection = None):
+    """
+    Sum count, n_killed and n_injured grouped by some dimensions over the selected rows
+    Only groups with at least one row are returned, like groupby(observed = True)
+
+    Parameters:
+    -----------
+    index: dict
+    by: list of dimensions
+    selection: np array of bool or of row positions (optional)
+
+    Returns:
+    result: dataframe of count, n_killed, n_injured indexed by the dimensions
+    """
+
+    result = query_aggregates(index, [by], selection)[tuple(by)]
+
+    return result
+
+
+def query_aggregates(index, groupings, selection = None):
+    """
+    Answer several groupings in a single pass over the selected rows
+    The selected rows of every dimension and measure involved are gathered once, then each
+    grouping is a bincount over the gathered codes
+
+    Parameters:
+    -----------
+    index: dict
+    groupings: list of lists of dimensions
+    selection: np array of bool or of row positions (optional)
+
+    Returns:
+    aggregates: dict of tuple of dimensions -> dataframe of count, n_killed, n_injured
+    """
+
+    if selection is None:
+        rows = slice(None)
+    elif selection.dtype == bool:
+        rows = np.flatnonzero(selection)
+    else:
+        rows = selection
+
+    dimensions = list(dict.fromkeys(dimension for by in groupings for dimension in by))
+    codes = {dimension: index[dimension][rows] for dimension in dimensions}
+    measures = {measure: index[measure][rows] for measure in cube_measures}
+
+    aggregates = {}
+
+    for by in groupings:
+        if tuple(by) in aggregates:
+            continue
+
+        sizes = [len(index[dimension + '_categories']) for dimension in by]
+        keys = np.ravel_multi_index([codes[dimension].astype('int64') for dimension in by], sizes, mode = 'clip')
+        valid = np.all([codes[dimension] >= 0 for dimension in by], axis = 0)
+
+        if not valid.all():
+            keys = np.where(valid, keys, np.prod(sizes))
+
+        sums = {measure: np.bincount(keys, weights = measures[measure], minlength = np.prod(sizes) + 1)[:np.prod(sizes)] for measure in cube_measures}
+
+        observed = np.flatnonzero(sums['count'])
+        levels = np.unravel_index(observed, sizes)
+        labels = [index[dimension + '_categories'][level] for dimension, level in zip(by, levels)]
+
+        aggregates[tuple(by)] = pd.DataFrame(
+            {measure: sums[measure][observed].astype('int64') for measure in cube_measures},
+            index = pd.MultiIndex.from_arrays(labels, names = by) if len(by) > 1 else pd.Index(labels[0], name = by[0])
+        )
+
+    return aggregates
+
+
+def participant_incidents(participants):
+    """
+    Expand the offsets of the participant table into the incident position of every participant
+
+    Parameters:
+    -----------
+    participants: dict of np arrays
+
+    Returns:
+    incidents: np array of int32
+    """
+
+    incidents = np.repeat(np.arange(len(participants['offsets']) - 1, dtype = 'int32'), np.diff(participants['offsets']))
+
+    return incidents
+
+
+def participant_role_codes(participants):
+    """
+    Assign every participant the position of its role in participant_roles
+    A participant type matches the first role it contains, other or missing types get
+    len(participant_roles)
+
+    Parameters:
+    -----------
+    participants: dict of np arrays
+
+    Returns:
+    roles: np array of int8
+    """
+
+    role_lookup = [
+        next((role_code for role_code, role in enumerate(participant_roles) if role in category), len(participant_roles))
+        for category in participants['type_categories']
+    ]
+
+    roles = np.array(role_lookup + [len(participant_roles)], dtype = 'int8')[participants['type']]
+
+    return roles
+
+
+def participant_histogram(index, attribute, selection = None):
+    """
+    Count the participants of the selected incidents per (role, attribute value) in one pass
+    Row r holds the counts of participant_roles[r], the last row those of other or missing
+    roles, so summing the rows counts every participant
+
+    Parameters:
+    -----------
+    index: dict
+    attribute: str ('age' or 'gender')
+    selection: np array of bool or of row positions (optional)
+
+    Returns:
+    histogram: np array of shape (len(participant_roles) + 1, largest attribute code + 1)
+               (precomputed histograms, e.g. from out_of_core_aggregates, are returned as is)
+    """
+
+    if 'histograms' in index:
+        return index['histograms'][attribute]
+
+    n_roles = len(participant_roles) + 1
+    codes = index['participants'][attribute]
+    keep = codes >= 0
+
+    if selection is not None:
+        if selection.dtype != bool:
+            rows = selection
+            selection = np.zeros(index['size'], dtype = bool)
+            selection[rows] = True
+
+        keep &= selection[index['participant_incidents']]
+
+    keys = codes[keep].astype('int64') * n_roles + index['participant_role'][keep]
+    counts = np.bincount(keys)
+    counts = np.pad(counts, (0, -len(counts) % n_roles))
+
+    histogram = counts.reshape(-1, n_roles).T
+
+    return histogram
+
+
+if __name__ == '__main__':
+    print('This is the query engine file')
@@ -0,0 +1,161 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+import plotly
+
+cache_max_bytes = int(os.environ.get('DASHBOARD_CACHE_BYTES', 64 * 1024 * 1024))
+
+cache_lock = threading.Lock()
+cache_entries = OrderedDict()
+cache_counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+
+
+def cache_key(name, filters, view = None):
+    """
+    Canonical, hashable key of a chart request
+    Filters are sorted by dimension, their values are deduplicated and sorted, and filters
+    selecting everything (None or empty) are dropped, so equivalent requests share a key
+
+    Parameters:
+    -----------
+    name: str
+    filters: dict of dimension -> list of allowed values
+    view: hashable (optional, e.g. the drill-down and zoomed range of the figure)
+
+    Returns:
+    key: tuple
+    """
+
+    canonical_filters = tuple(
+        (dimension, tuple(sorted(set(values), key = str)))
+        for dimension, values in sorted(filters.items())
+        if values
+    )
+
+    key = (name, canonical_filters, view)
+
+    return key
+
+
+def cache_size(value):
+    """
+    Approximate memory held by a cached chart, measured as its serialized figure size
+
+    Parameters:
+    -----------
+    value: dcc.Graph
+
+    Returns:
+    size: int (bytes)
+    """
+
+    size = len(json.dumps(value.figure, cls = plotly.utils.PlotlyJSONEncoder))
+
+    return size
+
+
+def cached_call(key, function, *args):
+    """
+    Return function(*args) from the cache, computing and storing it on a miss
+    The least recently used entries are evicted once the cache holds more than
+    cache_max_bytes; a single entry larger than the bound is returned but not kept
+
+    Parameters:
+    -----------
+    key: tuple (see cache_key)
+    function: callable
+    args: arguments of function
+
+    Returns:
+    value: result of function(*args)
+    """
+
+    with cache_lock:
+        if key in cache_entries:
+            cache_entries.move_to_end(key)
+            cache_counters['hits'] += 1
+
+            return cache_entries[key][0]
+
+        cache_counters['misses'] += 1
+
+    value = function(*args)
+    size = cache_size(value)
+
+    if size > cache_max_bytes:
+        return value
+
+    with cache_lock:
+        if key not in cache_entries:
+            cache_entries[key] = (value, size)
+            cache_counters['bytes'] += size
+
+        while cache_counters['bytes'] > cache_max_bytes:
+            _, (_, evicted_size) = cache_entries.popitem(last = False)
+            cache_counters['bytes'] -= evicted_size
+            cache_counters['evictions'] += 1
+
+    return value
+
+
+def cache_statistics():
+    """
+    Hit/miss/eviction counters and current size of the cache
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    statistics: dict
+    """
+
+    with cache_lock:
+        statistics = dict(cache_counters, entries = len(cache_entries), max_bytes = cache_max_bytes)
+
+    return statistics
+
+
+def cache_configure(max_bytes):
+    """
+    Change the memory bound of the cache, evicting entries if it shrinks
+
+    Parameters:
+    -----------
+    max_bytes: int
+
+    Returns:
+    None
+    """
+
+    global cache_max_bytes
+
+    with cache_lock:
+        cache_max_bytes = max_bytes
+
+        while cache_counters['bytes'] > cache_max_bytes:
+            _, (_, evicted_size) = cache_entries.popitem(last = False)
+            cache_counters['bytes'] -= evicted_size
+            cache_counters['evictions'] += 1
+
+
+def cache_clear():
+    """
+    Drop every entry and reset the counters
+
+    Parameters:
+    -----------
+    None
+
+    Returns:
+    None
+    """
+
+    with cache_lock:
+        cache_entries.clear()
+        cache_counters.update({'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0})
+
+
+if __name__ == '__main__':
+    print('This is the result cache file')
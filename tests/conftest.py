@@ -0,0 +1,63 @@
+import os
+import sys
+import shutil
+import pytest
+import pyarrow.parquet as pq
+
+repository_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repository_path)
+sys.path.insert(1, os.path.join(repository_path, 'data'))
+
+from synthetic_data import synthetic_data_write
+from data_cleaning_functions import original_data_reader
+from data_clean import data_clean
+
+# Size of the synthetic data, as a multiple of synthetic_data.base_rows incidents
+synthetic_scale = 0.02
+
+
+@pytest.fixture(scope = 'session')
+def work_path(tmp_path_factory):
+    """
+    Working directory laid out like the repository, holding seeded synthetic original data
+    The code is copied along: the modules read the data and hash their own sources by paths
+    relative to the working directory
+    """
+
+    path = tmp_path_factory.mktemp('repository')
+    shutil.copytree(repository_path, path, dirs_exist_ok = True, ignore = shutil.ignore_patterns('.git', 'tests', 'original_data', 'cleaned_data', '__pycache__', '*.jsonl', '*.patch'))
+    synthetic_data_write(synthetic_scale, str(path))
+    os.makedirs(path / 'data' / 'cleaned_data', exist_ok = True)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(path)
+        yield str(path)
+
+
+@pytest.fixture(scope = 'session')
+def original_data(work_path):
+    """
+    The synthetic original data, as read by the cleaning pipeline
+    """
+
+    return original_data_reader()
+
+
+@pytest.fixture(scope = 'session')
+def cleaned_path(work_path):
+    """
+    Working directory after a cleaning run over the synthetic original data
+    """
+
+    data_clean()
+
+    return work_path
+
+
+@pytest.fixture(scope = 'session')
+def cleaned_table(cleaned_path):
+    """
+    The cleaned parquet file of the synthetic data
+    """
+
+    return pq.read_table('data/cleaned_data/cleaned_data.parquet')
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from data_cleaning_functions import column_cleaner, vectorized_column_cleaner, list_column_to_arrow, list_column_format, string_to_list, gun_category_encode, gun_categories
+
+edge_cases = pd.Series([
+    '0::22||1::35',
+    '0::Male',
+    '0::Unharmed, Arrested||1::Killed',
+    '0:22|1:35',
+    '0::a::b||1::c',
+    '0::7.62 [AK-47]||1::223 Rem [AR-15]',
+    '22',
+    '',
+    np.nan
+], dtype = object)
+
+
+def assert_cleaned_columns_equal(cleaned_column, expected_column):
+    """
+    Rows must hold equal python lists of str or both be np.nan
+    """
+
+    assert len(cleaned_column) == len(expected_column)
+
+    for cleaned_row, expected_row in zip(cleaned_column, expected_column):
+        if isinstance(expected_row, list):
+            assert type(cleaned_row) is list and cleaned_row == expected_row
+            assert all(type(value) is str for value in cleaned_row)
+        else:
+            assert isinstance(cleaned_row, float) and np.isnan(cleaned_row)
+
+
+def test_edge_cases():
+    assert_cleaned_columns_equal(vectorized_column_cleaner(edge_cases), column_cleaner(edge_cases))
+
+
+@pytest.mark.parametrize('column', ['participant_age', 'participant_status', 'participant_type', 'gun_type', 'participant_gender'])
+def test_original_data_columns(original_data, column):
+    values = original_data[column].reset_index(drop = True)
+
+    assert_cleaned_columns_equal(vectorized_column_cleaner(values), column_cleaner(values))
+
+
+def test_bracketed_gun_types():
+    """
+    Gun types holding brackets ('7.62 [AK-47]') stay whole through cleaning and the parquet and
+    csv round trips, and count as rifles
+    The original string_to_list() stripped their closing bracket, so they were not counted
+    """
+
+    gun_types = vectorized_column_cleaner(pd.Series(['0::9mm||1::7.62 [AK-47]||2::223 Rem [AR-15]']))
+    expected = ['9mm', '7.62 [AK-47]', '223 Rem [AR-15]']
+
+    assert gun_types[0] == expected
+    assert list_column_to_arrow(gun_types, pa.string()).to_pylist() == [expected]
+    assert string_to_list(list_column_format(gun_types)[0]) == expected
+    assert [gun_categories[code] for code in gun_category_encode(pd.Series(expected))] == ['Handgun', 'Rifle', 'Rifle']
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data_cleaning_functions import list_column_types, arrow_to_data, compact_schema_apply, participant_table_builder, memory_usage_report
+
+
+@pytest.fixture(scope = 'module')
+def cleaned_data(cleaned_table):
+    """
+    The cleaned data with python lists in its list columns, as the dashboard held it before
+    the compact schema
+    """
+
+    data = arrow_to_data(cleaned_table)
+
+    for column in list_column_types:
+        data[column] = pd.Series([np.nan if row is None else row for row in cleaned_table.column(column).to_pylist()], dtype = object)
+
+    return data
+
+
+def test_compact_schema_memory(cleaned_data, cleaned_table):
+    compact_data = compact_schema_apply(cleaned_data.copy())
+    report = memory_usage_report(cleaned_data, compact_data, participant_table_builder(cleaned_table))
+
+    assert report.loc['total', 'after'] < report.loc['total', 'before']
+
+    for column in list_column_types:
+        assert report.loc[column, 'after'] < report.loc[column, 'before']
+
+
+def test_compact_schema_values(cleaned_data):
+    compact_data = compact_schema_apply(cleaned_data.copy())
+
+    assert not any(column in compact_data for column in list_column_types)
+    assert (compact_data['date'] == pd.to_datetime(cleaned_data['date'])).all()
+
+    for column in ['state', 'city_or_county', 'state_code', 'weekday', 'month']:
+        assert compact_data[column].astype(str).tolist() == cleaned_data[column].astype(str).tolist()
+
+    for column in ['n_killed', 'n_injured', 'year']:
+        assert compact_data[column].tolist() == cleaned_data[column].tolist()
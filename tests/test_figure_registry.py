@@ -0,0 +1,27 @@
+import sys
+import json
+import subprocess
+
+registry_script = '''
+import json
+import index
+import figure_registry
+sizes = [len(figure_registry.registry_figures)]
+for pathname in ['/', '/data-preview', '/dashboard']:
+    index.display_page(pathname)
+    sizes.append(len(figure_registry.registry_figures))
+print(json.dumps(sizes))
+'''
+
+
+def test_figures_built_on_first_dashboard_request(cleaned_path):
+    """
+    A fresh worker builds no figure at boot nor for the other pages, only on the first
+    request to /dashboard
+    """
+
+    output = subprocess.run([sys.executable, '-c', registry_script], cwd = cleaned_path, capture_output = True, text = True, check = True)
+    sizes = json.loads(output.stdout.strip().splitlines()[-1])
+
+    assert sizes[:3] == [0, 0, 0]
+    assert sizes[3] > 0
@@ -0,0 +1,36 @@
+import pytest
+from data_cleaning_functions import data_feature_engineering, final_column_cleaning, parallel_data_clean, parallel_workers, parallel_min_shard_bytes, data_to_arrow
+
+
+@pytest.fixture(scope = 'module')
+def serial_data(original_data):
+    """
+    The synthetic data cleaned in a single process, like data_clean()
+    """
+
+    data = data_feature_engineering(original_data.copy())
+    data = final_column_cleaning(data)
+
+    return data
+
+
+@pytest.mark.parametrize('min_shard_bytes', [0, parallel_min_shard_bytes])
+def test_parallel_matches_serial(serial_data, min_shard_bytes):
+    """
+    Identical output through the pool (forced with min_shard_bytes = 0) and through the
+    serial fallback for small shards
+    """
+
+    parallel_data = parallel_data_clean(workers = 2, min_shard_bytes = min_shard_bytes)
+
+    assert serial_data.to_csv(index = False) == parallel_data.to_csv(index = False)
+    assert data_to_arrow(serial_data).equals(data_to_arrow(parallel_data))
+
+
+def test_parallel_workers(work_path):
+    paths = ['data/original_data/original_data_1.csv', 'data/original_data/original_data_2.csv']
+
+    assert parallel_workers(paths, 2, min_shard_bytes = float('inf')) == 1
+    assert parallel_workers(paths, 1, min_shard_bytes = 0) == 1
+    assert parallel_workers(paths[:1], 2, min_shard_bytes = 0) == 1
+    assert parallel_workers(paths, 2, min_shard_bytes = 0) == 2
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+import pytest
+import dashboard_functions
+from query_engine import participant_roles, query_index_builder, group_rows, participant_histogram
+
+
+def age_counts_loops(data):
+    """
+    Age counts of all participants, victims and suspects as the original age_distribution_generator
+    computed them, by comparing every age against every unique age
+
+    Parameters:
+    -----------
+    data: dataframe
+
+    Returns:
+    counts: list of (unique ages, counts) for all participants, victims and suspects
+    """
+
+    ages = data['participant_age'].tolist()
+    types = data['participant_type'].tolist()
+    age_list = []
+
+    for idx, _ in enumerate(ages):
+        if isinstance(ages[idx], list):
+            for idx2, _ in enumerate(ages[idx]):
+                age_list.append(ages[idx][idx2])
+
+    victim_age_list = []
+    suspect_age_list = []
+
+    for idx, _ in enumerate(ages):
+        if ages[idx] is not np.nan:
+            for idx2, _ in enumerate(ages[idx]):
+                if 'Victim' in types[idx][idx2] and ages[idx][idx2] is not np.nan:
+                    victim_age_list.append(ages[idx][idx2])
+
+                elif 'Suspect' in types[idx][idx2] and ages[idx][idx2] is not np.nan:
+                    suspect_age_list.append(ages[idx][idx2])
+
+    counts = []
+
+    for role_age_list in [age_list, victim_age_list, suspect_age_list]:
+        role_age_list = list(map(int, role_age_list))
+        unique_ages = list(sorted(set(role_age_list)))
+        ages_count = [0] * len(unique_ages)
+
+        for idx, _ in enumerate(role_age_list):
+            for idx2, _ in enumerate(unique_ages):
+                if unique_ages[idx2] == role_age_list[idx]:
+                    ages_count[idx2] += 1
+
+        counts.append((unique_ages, ages_count))
+
+    return counts
+
+
+def gender_counts_loops(data, role):
+    """
+    Male/Female counts of a role as the original gender generators computed them with list.count
+
+    Parameters:
+    -----------
+    data: dataframe
+    role: str
+
+    Returns:
+    counts: list of int
+    """
+
+    genders = data['participant_gender'].tolist()
+    types = data['participant_type'].tolist()
+    gender_list = []
+
+    for idx, _ in enumerate(genders):
+        if isinstance(genders[idx], list):
+            for idx2, _ in enumerate(genders[idx]):
+                try:
+                    if role in types[idx][idx2]:
+                        gender_list.append(genders[idx][idx2])
+                except:
+                    pass
+
+    counts = [gender_list.count('Male'), gender_list.count('Female')]
+
+    return counts
+
+
+def age_counts_kernel(index):
+    """
+    Age counts of all participants, victims and suspects from the histogram kernel
+    """
+
+    age_histogram = participant_histogram(index, 'age')
+    counts = []
+
+    for role_count in [age_histogram.sum(axis = 0), age_histogram[participant_roles.index('Victim')], age_histogram[participant_roles.index('Suspect')]]:
+        counts.append((np.flatnonzero(role_count).tolist(), role_count[role_count > 0].tolist()))
+
+    return counts
+
+
+def gender_counts_kernel(index, role):
+    """
+    Male/Female counts of a role from the histogram kernel
+    """
+
+    gender_histogram = participant_histogram(index, 'gender')[participant_roles.index(role)]
+    gender_counts = dict(zip(index['participants']['gender_categories'], gender_histogram.tolist()))
+
+    counts = [gender_counts.get('Male', 0), gender_counts.get('Female', 0)]
+
+    return counts
+
+
+@pytest.fixture(scope = 'module')
+def index(cleaned_path):
+    """
+    Query index of the cleaned data with its participant table
+    """
+
+    return query_index_builder(dashboard_functions.cleaned_data_reader(), dashboard_functions.participant_table_reader())
+
+
+@pytest.fixture(scope = 'module')
+def participant_lists(cleaned_table):
+    """
+    The participant columns of the cleaned data as python lists (np.nan for missing lists),
+    the form the original generators looped over
+    """
+
+    return pd.DataFrame({
+        column: pd.Series([np.nan if row is None else row for row in cleaned_table.column(column).to_pylist()], dtype = object)
+        for column in ['participant_age', 'participant_gender', 'participant_type']
+    })
+
+
+def test_age_counts(index, participant_lists):
+    assert age_counts_kernel(index) == age_counts_loops(participant_lists)
+
+
+@pytest.mark.parametrize('role', ['Suspect', 'Victim'])
+def test_gender_counts(index, participant_lists, role):
+    assert gender_counts_kernel(index, role) == gender_counts_loops(participant_lists, role)
+
+
+@pytest.mark.parametrize('attribute', ['age', 'gender'])
+def test_row_position_selection(index, attribute):
+    """
+    A selection given as row positions (as returned by group_rows) counts the same participants
+    as the equivalent boolean mask
+    """
+
+    rows = group_rows(index, 'state_code', index['state_code_categories'][0])
+    mask = np.zeros(index['size'], dtype = bool)
+    mask[rows] = True
+
+    position_histogram = participant_histogram(index, attribute, rows)
+    mask_histogram = participant_histogram(index, attribute, mask)
+
+    assert position_histogram.shape == mask_histogram.shape
+    assert (position_histogram == mask_histogram).all()
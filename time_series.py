@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+time_series_points = 500
+time_series_window = 7
+
+
+def day_index_builder(data):
+    """
+    Encode the date of every incident once, at load time, as a day number (days since
+    1970-01-01) and keep the first and last day of the data, so per day counts cover the full
+    date range whatever the selection
+
+    Parameters:
+    -----------
+    data: dataframe (incidents, date as datetime64)
+
+    Returns:
+    days: dict of np arrays (day, day_range)
+    """
+
+    day = pd.to_datetime(data['date']).to_numpy(dtype = 'datetime64[D]').astype('int32')
+
+    days = {
+        'day': day,
+        'day_range': np.array([day.min(), day.max()], dtype = 'int32')
+    }
+
+    return days
+
+
+def daily_counts(index, selection = None):
+    """
+    Count the selected incidents of every day of the date range with one bincount
+
+    Parameters:
+    -----------
+    index: dict (query index)
+    selection: np array of bool or of row positions (optional)
+
+    Returns:
+    first_day: int (day number of counts[0])
+    counts: np array of int64, one count per day from the first to the last day of the data
+            (precomputed counts, e.g. from out_of_core_aggregates, are returned as is)
+    """
+
+    if 'daily_counts' in index:
+        first_day, counts = index['daily_counts']
+        return first_day, counts.copy()
+
+    first_day, last_day = (int(day) for day in index['day_range'])
+    day = index['day'] if selection is None else index['day'][selection]
+
+    counts = np.bincount(day - first_day, minlength = last_day - first_day + 1)
+
+    return first_day, counts
+
+
+def lttb(x, y, threshold):
+    """
+    Downsample a series with Largest-Triangle-Three-Buckets
+    The first and last points are kept; every bucket in between keeps the point forming the
+    largest triangle with the point kept in the previous bucket and the average of the next
+    bucket, so spikes survive the downsampling
+
+    Parameters:
+    -----------
+    x: np array of float (increasing)
+    y: np array of float
+    threshold: int (number of points to keep)
+
+    Returns:
+    keep: np array of int (positions of the kept points, increasing)
+    """
+
+    n_points = len(x)
+
+    if threshold >= n_points or threshold < 3:
+        return np.arange(n_points)
+
+    x = x.astype('float64')
+    y = y.astype('float64')
+
+    edges = (np.arange(threshold - 1) * (n_points - 2) / (threshold - 2)).astype('int64') + 1
+    edges[-1] = n_points - 1
+
+    keep = np.zeros(threshold, dtype = 'int64')
+    keep[-1] = n_points - 1
+    previous = 0
+
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else n_points
+
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous]) - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+
+        previous = start + int(np.argmax(areas))
+        keep[bucket + 1] = previous
+
+    return keep
+
+
+if __name__ == '__main__':
+    print('This is the time series file')